@@ -4,7 +4,7 @@ import { SubmissionError } from 'redux-form'
 import { cloneDeep, pick } from 'lodash'
 import { PRIVILEGES, AGENDA } from '../constants'
 import { checkPermission, getErrorMessage, isItemSpiked } from '../utils'
-import { planning, showModal } from './index'
+import { planning, showModal, subscribeNotifications } from './index'
 
 /**
  * Creates or updates an Agenda
@@ -80,6 +80,8 @@ const selectAgenda = (agendaId) => (
 
         // update the url (deep linking)
         $timeout(() => ($location.search('agenda', agendaId)))
+        // only receive the notifications of this agenda
+        dispatch(subscribeNotifications(agendaId))
         // reload the plannings list
         return dispatch(fetchSelectedAgendaPlannings())
     }
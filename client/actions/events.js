@@ -475,11 +475,28 @@ const onRecurringEventCreated = (_e, data) => (
 /**
  * Action Event when an Event gets updated
  * @param _e
- * @param {object} data - Event and User IDs
+ * @param {object} data - Event and User IDs, along with the changes made to the Event
  */
 const onEventUpdated = (_e, data) => (
     (dispatch, getState) => {
         if (data && data.item) {
+            const eventInStore = get(selectors.getEvents(getState()), data.item)
+
+            // Patch the stored event with the changes, unless its position in the list changed
+            if (data.changes && eventInStore && !('dates' in data.changes)) {
+                dispatch(eventsApi.receiveEvents([{
+                    ...eventInStore,
+                    ...data.changes,
+                }]))
+
+                if (eventUtils.isEventAssociatedWithPlannings(data.item,
+                        selectors.getStoredPlannings(getState()))) {
+                    dispatch(fetchSelectedAgendaPlannings())
+                }
+
+                return
+            }
+
             dispatch(eventsUi.refetchEvents())
             .then((events) => {
                 const selectedEvents = selectors.getSelectedEvents(getState())
@@ -3,6 +3,7 @@ export * from './locations'
 export * from './modal'
 export * from './agenda'
 export * from './assignment'
+export * from './notifications'
 
 import planning from './planning/index'
 import events from './events/index'
@@ -0,0 +1,48 @@
+import { AGENDA, NOTIFICATIONS } from '../constants'
+import * as selectors from '../selectors'
+
+/**
+ * Action Dispatcher to subscribe this client to the notifications of the selected agenda
+ * Once subscribed, the notifications routed to other clients are discarded
+ * If the subscription fails, all the notifications keep being handled
+ * @param {string} agendaId - The selected Agenda, all of them if not set
+ * @return arrow function
+ */
+const subscribeNotifications = (agendaId=null) => (
+    (dispatch, getState, { api }) => {
+        const agendas = agendaId && agendaId !== AGENDA.FILTER.ALL_PLANNING &&
+            agendaId !== AGENDA.FILTER.NO_AGENDA_ASSIGNED ? [agendaId] : []
+
+        return api('planning_notification_subscriptions').save({}, {
+            agendas,
+            client_id: selectors.getNotificationsClientId(getState()),
+        })
+        .then(() => {
+            dispatch({
+                type: NOTIFICATIONS.ACTIONS.SUBSCRIBED,
+                payload: true,
+            })
+        }, () => {
+            dispatch({
+                type: NOTIFICATIONS.ACTIONS.SUBSCRIBED,
+                payload: false,
+            })
+        })
+    }
+)
+
+/**
+ * Action Dispatcher to post the subscription of the selected agenda again,
+ * so it doesn't expire while the client is open
+ * @return arrow function
+ */
+const refreshNotificationsSubscription = () => (
+    (dispatch, getState) => (
+        dispatch(subscribeNotifications(selectors.getCurrentAgendaId(getState())))
+    )
+)
+
+export {
+    subscribeNotifications,
+    refreshNotificationsSubscription,
+}
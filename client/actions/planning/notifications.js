@@ -1,4 +1,4 @@
-import { get, includes, isEmpty } from 'lodash'
+import { get, includes, isEmpty, isEqual } from 'lodash'
 import planning from './index'
 import { getErrorMessage } from '../../utils'
 import * as selectors from '../../selectors'
@@ -115,6 +115,7 @@ const onCoverageDeleted = (_e, data) => (
 
 /**
  * WS Action when a Planning item gets updated, spiked or unspiked
+ * If the changes are sent along, the stored Planning item is patched instead of refetched
  * If the Planning Item is not loaded, silently discard this notification
  * @param {object} _e - Event object
  * @param {object} data - Planning and User IDs
@@ -122,6 +123,20 @@ const onCoverageDeleted = (_e, data) => (
 const onPlanningUpdated = (_e, data, refetch=true) => (
     (dispatch, getState, { notify }) => {
         if (get(data, 'item')) {
+            const planningInStore = get(selectors.getStoredPlannings(getState()), data.item)
+
+            // Patch the stored Planning item with the changes, unless it moved between agendas
+            if (get(data, 'changes') && planningInStore && (!('agendas' in data.changes) ||
+                isEqual(data.changes.agendas, planningInStore.agendas))) {
+                const item = {
+                    ...planningInStore,
+                    ...data.changes,
+                }
+
+                dispatch(planning.api.receivePlannings([item]))
+                return Promise.resolve(item)
+            }
+
             if (refetch) {
                 return dispatch(self.canRefetchPlanning(data))
                 .then((result) => {
@@ -417,6 +417,40 @@ describe('actions.planning.notifications', () => {
             })
         })
 
+        it('patches the stored planning with the changes', (done) => {
+            sinon.stub(planningApi, 'loadPlanningById').callsFake(
+                () => (Promise.resolve(data.plannings[0]))
+            )
+            sinon.stub(planningUi, 'refetch').callsFake(() => (Promise.resolve()))
+
+            return store.test(done, planningNotifications.onPlanningUpdated(
+                {},
+                {
+                    item: 'p1',
+                    changes: {
+                        slugline: 'New Slugline',
+                        _etag: 'p123',
+                    },
+                },
+                true
+            ))
+            .then((item) => {
+                expect(item).toEqual({
+                    ...data.plannings[0],
+                    slugline: 'New Slugline',
+                    _etag: 'p123',
+                })
+                expect(store.dispatch.args[0]).toEqual([{
+                    type: 'RECEIVE_PLANNINGS',
+                    payload: [item],
+                }])
+                expect(planningApi.loadPlanningById.callCount).toBe(0)
+                expect(planningUi.refetch.callCount).toBe(0)
+
+                done()
+            })
+        })
+
         it('notifies user is fetchPlanningById fails', (done) => {
             sinon.stub(planningApi, 'loadPlanningById').callsFake(
                 () => (Promise.reject(errorMessage))
@@ -332,6 +332,12 @@ describe('agenda', () => {
                     expect(services.$location.search.callCount).toBe(1)
                     expect(services.$location.search.args[0]).toEqual(['agenda', 'a1'])
 
+                    expect(services.api('planning_notification_subscriptions').save.args[0])
+                        .toEqual([{}, {
+                            agendas: ['a1'],
+                            client_id: 'client1',
+                        }])
+
                     expect(planningUi.fetchToList.callCount).toBe(1)
                     expect(planningUi.fetchToList.args[0]).toEqual([
                         {
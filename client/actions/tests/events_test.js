@@ -668,6 +668,32 @@ describe('events', () => {
                 }, 250)
             })
 
+            it('Patches the stored event with the changes', (done) => {
+                $rootScope.$broadcast('events:updated', {
+                    item: 'e1',
+                    changes: {
+                        name: 'Event1 Renamed',
+                        _etag: 'e123',
+                    },
+                })
+
+                originalSetTimeout(() => {
+                    expect(spyQuery.callCount).toBe(0)
+                    expect(selectors.getEvents(store.getState())).toEqual({
+                        e1: {
+                            _id: 'e1',
+                            name: 'Event1 Renamed',
+                            _etag: 'e123',
+                            dates: {
+                                start: moment('2017-05-31T16:37:11+0000'),
+                                end: moment('2017-05-31T17:37:11+0000'),
+                            },
+                        },
+                    })
+                    done()
+                }, 250)
+            })
+
             it('Event silently returns if no event provided', (done) => {
                 $rootScope.$broadcast('events:updated', {})
 
@@ -0,0 +1,7 @@
+export const NOTIFICATIONS = {
+    ACTIONS: {
+        SUBSCRIBED: 'NOTIFICATIONS_SUBSCRIBED',
+    },
+    // The subscription is posted again in this interval, so it doesn't expire on the server
+    SUBSCRIPTION_REFRESH_INTERVAL: 30 * 60 * 1000,
+}
@@ -4,6 +4,7 @@ import { Provider } from 'react-redux'
 import { registerNotifications } from '../utils'
 import * as actions from '../actions'
 import { PlanningApp } from '../components'
+import { NOTIFICATIONS } from '../constants'
 
 PlanningController.$inject = [
     '$element',
@@ -37,7 +38,7 @@ export function PlanningController(
                     return store.dispatch(actions.selectAgenda($location.search().agenda))
                 }
 
-                return Promise.resolve()
+                return store.dispatch(actions.subscribeNotifications())
             }),
 
             lockedEvents: store.dispatch(
@@ -49,7 +50,14 @@ export function PlanningController(
             ),
         })
         .then(() => {
+            // keep the notifications subscription from expiring
+            const refreshSubscription = setInterval(
+                () => store.dispatch(actions.refreshNotificationsSubscription()),
+                NOTIFICATIONS.SUBSCRIPTION_REFRESH_INTERVAL
+            )
+
             $scope.$on('$destroy', () => {
+                clearInterval(refreshSubscription)
                 // Unmount the React application
                 ReactDOM.unmountComponentAtNode($element.get(0))
                 store.dispatch(actions.resetStore())
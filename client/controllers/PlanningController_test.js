@@ -4,7 +4,11 @@ import { registerNotifications } from '../utils'
 
 describe('PlanningController', () => {
     describe('websocket', () => {
-        const store = { dispatch: sinon.spy(() => Promise.resolve()) }
+        let state = {}
+        const store = {
+            dispatch: sinon.spy(() => Promise.resolve()),
+            getState: () => (state),
+        }
         const args = {
             item: 'foo',
             user: 'bar',
@@ -19,5 +23,67 @@ describe('PlanningController', () => {
             expect(event.args[0][1]).toEqual(args)
         }))
 
+        it('discards the notifications routed to other clients', inject(($rootScope) => {
+            const event = sinon.spy()
+            actions.notifications['test:routed'] = () => (event)
+            registerNotifications($rootScope, store)
+            state = {
+                notifications: {
+                    subscribed: true,
+                    clientId: 'client123',
+                },
+            }
+
+            $rootScope.$broadcast('test:routed', {
+                ...args,
+                sessions: ['client456'],
+            })
+            expect(event.callCount).toBe(0)
+
+            $rootScope.$broadcast('test:routed', {
+                ...args,
+                sessions: ['client456', 'client123'],
+            })
+            $rootScope.$broadcast('test:routed', args)
+            expect(event.callCount).toBe(2)
+
+            state = {}
+        }))
+
+        it('dispatches coalesced notifications once per item', inject(($rootScope) => {
+            const event = sinon.spy()
+            actions.notifications['test:coalesced'] = () => (event)
+            registerNotifications($rootScope, store)
+            state = {
+                notifications: {
+                    subscribed: true,
+                    clientId: 'client123',
+                },
+            }
+
+            $rootScope.$broadcast('test:coalesced', {
+                items: [
+                    {
+                        item: 'foo',
+                        sessions: ['client123'],
+                    },
+                    {
+                        item: 'baz',
+                        sessions: ['client456'],
+                    },
+                    { item: 'qux' },
+                ],
+                sessions: null,
+            })
+            expect(event.callCount).toBe(2)
+            expect(event.args[0][1]).toEqual({
+                item: 'foo',
+                sessions: ['client123'],
+            })
+            expect(event.args[1][1]).toEqual({ item: 'qux' })
+
+            state = {}
+        }))
+
     })
 })
@@ -6,6 +6,7 @@ import planning from './planning'
 import vocabularies from './vocabularies'
 import agenda from './agenda'
 import assignment from './assignment'
+import notifications from './notifications'
 
 const returnState = (state) => state || {}
 
@@ -16,6 +17,7 @@ const planningApp = combineReducers({
     planning,
     agenda,
     assignment,
+    notifications,
     form: forms,
 
     // The following doesn't require reducers as they are loaded using sdPlanningService
@@ -0,0 +1,27 @@
+import { NOTIFICATIONS, RESET_STORE, INIT_STORE } from '../constants'
+
+// Identifies this instance of the client in the subscriptions, the browser tabs sharing the session
+const clientId = Math.random().toString(36).substr(2, 10) + Date.now().toString(36)
+
+const initialState = {
+    subscribed: false,
+    clientId,
+}
+
+const notificationsReducer = (state=initialState, action) => {
+    switch (action.type) {
+        case RESET_STORE:
+            return null
+        case INIT_STORE:
+            return initialState
+        case NOTIFICATIONS.ACTIONS.SUBSCRIBED:
+            return {
+                ...state,
+                subscribed: action.payload,
+            }
+        default:
+            return state
+    }
+}
+
+export default notificationsReducer
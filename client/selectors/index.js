@@ -79,6 +79,8 @@ export const getPlanningItemReadOnlyState = (state) => get(state, 'planning.read
 export const getEventReadOnlyState = (state) => get(state, 'events.readOnly')
 export const getSessionDetails = (state) => get(state, 'session')
 export const getCurrentUserId = (state) => get(state, 'session.identity._id')
+export const isSubscribedToNotifications = (state) => get(state, 'notifications.subscribed', false)
+export const getNotificationsClientId = (state) => get(state, 'notifications.clientId')
 export const getPreviewAssignmentOpened = (state) => get(state, 'assignment.previewOpened')
 export const getCurrentAssignment = (state) => get(state, 'assignment.currentAssignment')
 export const getReadOnlyAssignment = (state) => get(state, 'assignment.readOnly')
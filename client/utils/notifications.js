@@ -1,23 +1,58 @@
 import { WS_NOTIFICATION } from '../constants'
 import * as actions from '../actions'
-import { forEach } from 'lodash'
+import * as selectors from '../selectors'
+import { forEach, includes, get } from 'lodash'
+
+/**
+ * Returns true if the notification is routed to other clients than this subscribed one
+ * @param {object} state - The Redux state
+ * @param {object} data - The notification data
+ * @return {boolean}
+ */
+export const isNotificationForOtherSessions = (state, data) => (
+    selectors.isSubscribedToNotifications(state) &&
+    Array.isArray(data && data.sessions) &&
+    !includes(data.sessions, selectors.getNotificationsClientId(state))
+)
+
+/**
+ * Returns the payloads of a notification
+ * The notifications of the same name sent while the server handles a request
+ * are coalesced into one message listing their payloads as `items`
+ * @param {object} data - The notification data
+ * @return {Array} - The payloads, each one for a single item
+ */
+export const getNotificationPayloads = (data) => (
+    Array.isArray(get(data, 'items')) ? data.items : [data]
+)
 
 /**
  * Registers WebSocket Notifications to Redux Actions
+ * Coalesced notifications are dispatched once per item
  * @param {scope} $scope - PlanningController scope where notifications are received
  * @param {store} store - The Redux Store used for dispatching actions
  */
 export const registerNotifications = ($scope, store) => {
     forEach(actions.notifications, (func, event) => {
         $scope.$on(event, (_e, data) => {
-            store.dispatch({
-                type: WS_NOTIFICATION,
-                payload: {
-                    event,
-                    data,
-                },
+            if (isNotificationForOtherSessions(store.getState(), data)) {
+                return
+            }
+
+            forEach(getNotificationPayloads(data), (payload) => {
+                if (isNotificationForOtherSessions(store.getState(), payload)) {
+                    return
+                }
+
+                store.dispatch({
+                    type: WS_NOTIFICATION,
+                    payload: {
+                        event,
+                        data: payload,
+                    },
+                })
+                store.dispatch(func()(_e, payload))
             })
-            store.dispatch(func()(_e, data))
         })
     })
 }
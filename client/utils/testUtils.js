@@ -62,6 +62,11 @@ export const getTestActionStore = () => {
                         () => (store.spies.api._query('planning_history'))
                     ),
                 },
+                planning_notification_subscriptions: {
+                    save: sinon.spy((ori, item) => (
+                        store.spies.api._save('planning_notification_subscriptions', ori, item)
+                    )),
+                },
                 update: sinon.spy(() => (Promise.resolve())),
                 save: sinon.spy(() => (Promise.resolve())),
 
@@ -287,6 +292,10 @@ export const getTestActionStore = () => {
                 identity: { _id: 'ident1' },
                 sessionId: 'session1',
             },
+            notifications: {
+                subscribed: false,
+                clientId: 'client1',
+            },
             users: [
                 {
                     _id: 'ident1',
@@ -180,4 +180,38 @@ Feature: Agenda
                 "item": "#agenda._id#"
             }
         }]
-        """
\ No newline at end of file
+        """
+
+    @auth
+    Scenario: Agenda usage counts the Planning items of each Agenda
+        When we post to "agenda"
+        """
+        [{"name": "foo"}]
+        """
+        Then we get OK response
+        When we post to "agenda"
+        """
+        [{"name": "bar"}]
+        """
+        Then we get OK response
+        When we post to "/planning"
+        """
+        [
+            {"item_class": "item class value", "headline": "first", "agendas": ["#agenda._id#"]},
+            {"item_class": "item class value", "headline": "second", "agendas": ["#agenda._id#"]}
+        ]
+        """
+        Then we get OK response
+        When we get "/agenda_usage"
+        Then we get list with 2 items
+        """
+        {"_items": [
+            {"name": "foo", "is_enabled": true, "planning_items": 0},
+            {"_id": "#agenda._id#", "name": "bar", "is_enabled": true, "planning_items": 2}
+        ]}
+        """
+        When we get "/agenda_usage?agendas=#agenda._id#"
+        Then we get list with 1 items
+        """
+        {"_items": [{"_id": "#agenda._id#", "planning_items": 2}]}
+        """
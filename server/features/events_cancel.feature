@@ -98,11 +98,7 @@ Feature: Events Cancel
         },
         {
             "event": "planning:created",
-            "extra": {"item": "plan1"}
-        },
-        {
-            "event": "planning:created",
-            "extra": {"item": "plan2"}
+            "extra": {"items": [{"item": "plan1"}, {"item": "plan2"}]}
         },
         {
             "event": "events:cancelled",
@@ -110,11 +106,10 @@ Feature: Events Cancel
         },
         {
             "event": "planning:cancelled",
-            "extra": {"item": "plan1", "user": "#CONTEXT_USER_ID#"}
-        },
-        {
-            "event": "planning:cancelled",
-            "extra": {"item": "plan2", "user": "#CONTEXT_USER_ID#"}
+            "extra": {"items": [
+                {"item": "plan1", "user": "#CONTEXT_USER_ID#"},
+                {"item": "plan2", "user": "#CONTEXT_USER_ID#"}
+            ]}
         }]
         """
         When we get "/events"
@@ -0,0 +1,92 @@
+Feature: Planning Notifications
+    @auth
+    @notification
+    Scenario: Planning notifications list the subscribed clients and the changes
+        When we post to "agenda"
+        """
+        [{"name": "Sports"}]
+        """
+        Then we store "sportsAgenda" with value "#agenda._id#" to context
+        When we post to "agenda"
+        """
+        [{"name": "Culture"}]
+        """
+        Then we store "cultureAgenda" with value "#agenda._id#" to context
+        When we post to "planning_notification_subscriptions"
+        """
+        {"client_id": "tab1", "agendas": ["#sportsAgenda#"], "resources": ["planning"]}
+        """
+        Then we get OK response
+        And we get existing resource
+        """
+        {"session": "__any_value__", "client_id": "tab1", "user": "#CONTEXT_USER_ID#", "agendas": ["#sportsAgenda#"]}
+        """
+        When we reset notifications
+        And we post to "planning"
+        """
+        [{"slugline": "Culture planning", "agendas": ["#cultureAgenda#"]}]
+        """
+        Then we get notifications
+        """
+        [{
+            "event": "planning:created",
+            "extra": {
+                "item": "#planning._id#",
+                "sessions": []
+            }
+        }]
+        """
+        When we reset notifications
+        And we post to "planning"
+        """
+        [{"slugline": "Sports planning", "agendas": ["#sportsAgenda#"]}]
+        """
+        Then we get notifications
+        """
+        [{
+            "event": "planning:created",
+            "extra": {
+                "item": "#planning._id#",
+                "sessions": ["tab1"]
+            }
+        }]
+        """
+        When we reset notifications
+        And we patch "/planning/#planning._id#"
+        """
+        {"slugline": "Football planning"}
+        """
+        Then we get notifications
+        """
+        [{
+            "event": "planning:updated",
+            "extra": {
+                "item": "#planning._id#",
+                "sessions": ["tab1"],
+                "changes": {"slugline": "Football planning"}
+            }
+        }]
+        """
+
+    @auth
+    Scenario: Posting a subscription replaces the previous one of the client
+        When we post to "planning_notification_subscriptions"
+        """
+        {"client_id": "tab1", "agendas": ["foo"]}
+        """
+        Then we get OK response
+        When we post to "planning_notification_subscriptions"
+        """
+        {"client_id": "tab2", "agendas": ["foo"]}
+        """
+        Then we get OK response
+        When we post to "planning_notification_subscriptions"
+        """
+        {"client_id": "tab1", "agendas": ["bar"], "start_date": "2017-06-01T00:00:00+0000", "end_date": "2017-06-30T00:00:00+0000"}
+        """
+        Then we get OK response
+        When we get "/planning_notification_subscriptions"
+        Then we get list with 2 items
+        """
+        {"_items": [{"client_id": "tab2", "agendas": ["foo"]}, {"client_id": "tab1", "agendas": ["bar"]}]}
+        """
@@ -127,3 +127,99 @@ Feature: Publish
 
         When we transmit items
         Then file exists "/tmp/123-1-None.txt"
+
+    @auth
+    @notification
+    Scenario: Publish a batch of events
+        When we post to "/products" with success
+        """
+        {
+            "name":"prod-1","codes":"abc,xyz", "product_type": "both"
+        }
+        """
+        And we post to "/subscribers" with success
+        """
+        {
+            "name":"News1","media_type":"media", "subscriber_type": "digital", "sequence_num_settings":{"min" : 1, "max" : 10}, "email": "test@test.com",
+            "products": ["#products._id#"],
+            "codes": "xyz, abc",
+            "destinations": [{"name":"events", "format": "ntb_event", "delivery_type": "File", "config":{"file_path": "/tmp"}}]
+        }
+        """
+        When we post to "/events" with success
+        """
+        {
+            "guid": "123",
+            "name": "event 123",
+            "slugline": "event-123",
+            "dates": {
+                "start": "2016-01-02",
+                "end": "2016-01-03"
+            }
+        }
+        """
+        Then we store "EVENT1_ID" with value "#events._id#" to context
+        And we store "EVENT1_ETAG" with value "#events._etag#" to context
+        When we post to "/events" with success
+        """
+        {
+            "guid": "456",
+            "name": "event 456",
+            "slugline": "event-456",
+            "dates": {
+                "start": "2016-01-09",
+                "end": "2016-01-10"
+            }
+        }
+        """
+        Then we store "EVENT2_ID" with value "#events._id#" to context
+        And we store "EVENT2_ETAG" with value "#events._etag#" to context
+        When we post to "/events/publish_batch"
+        """
+        {
+            "events": [
+                {"event": "#EVENT1_ID#", "etag": "#EVENT1_ETAG#"},
+                {"event": "#EVENT2_ID#", "etag": "foo"}
+            ],
+            "pubstatus": "usable"
+        }
+        """
+        Then we get error 412
+        When we get "publish_queue"
+        Then we get list with 0 items
+        When we reset notifications
+        And we post to "/events/publish_batch"
+        """
+        {
+            "events": [
+                {"event": "#EVENT1_ID#", "etag": "#EVENT1_ETAG#"},
+                {"event": "#EVENT2_ID#", "etag": "#EVENT2_ETAG#"}
+            ],
+            "pubstatus": "usable"
+        }
+        """
+        Then we get OK response
+        And we get notifications
+        """
+        [{
+            "event": "events:updated",
+            "extra": {"items": [
+                {"item": "#EVENT1_ID#", "user": "#CONTEXT_USER_ID#", "changes": {"state": "published"}},
+                {"item": "#EVENT2_ID#", "user": "#CONTEXT_USER_ID#", "changes": {"state": "published"}}
+            ]}
+        }]
+        """
+        When we get "/events/#EVENT1_ID#"
+        Then we get existing resource
+        """
+        {"state": "published", "pubstatus": "usable", "version_creator": "#CONTEXT_USER_ID#"}
+        """
+        When we get "/events/#EVENT2_ID#"
+        Then we get existing resource
+        """
+        {"state": "published", "pubstatus": "usable"}
+        """
+        When we get "publish_queue"
+        Then we get list with 2 items
+        When we get "/events_history?where=operation==%22publish%22"
+        Then we get list with 2 items
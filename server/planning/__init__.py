@@ -11,6 +11,8 @@
 """Superdesk Planning Plugin."""
 
 import superdesk
+from datetime import timedelta
+from superdesk.celery_app import celery
 
 from .events import EventsResource, EventsService
 from .events_spike import EventsSpikeResource, EventsSpikeService, EventsUnspikeResource, EventsUnspikeService
@@ -19,14 +21,19 @@ from .planning_spike import PlanningSpikeResource, PlanningSpikeService, Plannin
 from .events_files import EventsFilesResource, EventsFilesService
 from .coverage import CoverageResource, CoverageService
 from .coverage_history import CoverageHistoryResource, CoverageHistoryService
-from .locations import LocationsResource, LocationsService
+from .locations import LocationsResource, LocationsService, LocationsTypeaheadResource, \
+    LocationsTypeaheadService, clear_locations_index, clear_typeahead_cache, init_typeahead_analysis
+from .geo_search import PlanningGeoSearchResource, PlanningGeoSearchService
+from .planning_aggregations import PlanningAggregationsResource, PlanningAggregationsService
+from .notifications import NotificationSubscriptionsResource, NotificationSubscriptionsService, \
+    remove_session_subscriptions, flush_notifications
 from .events_history import EventsHistoryResource, EventsHistoryService
 from .planning_history import PlanningHistoryResource, PlanningHistoryService
 from .planning_lock import PlanningLockResource, PlanningLockService, PlanningUnlockResource, PlanningUnlockService
 from .planning_publish import PlanningPublishService, PlanningPublishResource
 from .planning_duplicate import PlanningDuplicateService, PlanningDuplicateResource
 from .events_lock import EventsLockResource, EventsLockService, EventsUnlockResource, EventsUnlockService
-from .agendas import AgendasResource, AgendasService
+from .agendas import AgendasResource, AgendasService, AgendaUsageResource, AgendaUsageService
 from superdesk.io.registry import register_feeding_service, register_feed_parser
 from .feed_parsers.ics_2_0 import IcsTwoFeedParser
 from .feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
@@ -34,13 +41,16 @@ from .feeding_services.event_file_service import EventFileFeedingService
 from .feeding_services.event_http_service import EventHTTPFeedingService
 from .feeding_services.event_email_service import EventEmailFeedingService
 from .events_duplicate import EventsDuplicateResource, EventsDuplicateService
-from .events_publish import EventsPublishService, EventsPublishResource
+from .events_publish import EventsPublishService, EventsPublishResource, EventsPublishBatchService, \
+    EventsPublishBatchResource
 from .events_cancel import EventsCancelService, EventsCancelResource
 from .events_reschedule import EventsRescheduleService, EventsRescheduleResource
 from .planning_cancel import PlanningCancelService, PlanningCancelResource
 from .planning_reschedule import PlanningRescheduleService, PlanningRescheduleResource
 from planning.planning_types import PlanningTypesService, PlanningTypesResource
-from .common import get_max_recurrent_events
+from .common import get_max_recurrent_events, is_virtual_recurrence_enabled, get_recurring_events_horizon, \
+    clear_vocabularies_cache
+from .commands import ExtendRecurringEvents
 
 
 def init_app(app):
@@ -78,6 +88,9 @@ def init_app(app):
     agendas_service = AgendasService('agenda', backend=superdesk.get_backend())
     AgendasResource('agenda', app=app, service=agendas_service)
 
+    agenda_usage_service = AgendaUsageService(AgendaUsageResource.endpoint_name, backend=superdesk.get_backend())
+    AgendaUsageResource(AgendaUsageResource.endpoint_name, app=app, service=agenda_usage_service)
+
     coverage_search_service = CoverageService('coverage', backend=superdesk.get_backend())
     CoverageResource('coverage', app=app, service=coverage_search_service)
 
@@ -93,9 +106,40 @@ def init_app(app):
     events_publish_service = EventsPublishService('events_publish', backend=superdesk.get_backend())
     EventsPublishResource('events_publish', app=app, service=events_publish_service)
 
+    events_publish_batch_service = EventsPublishBatchService('events_publish_batch',
+                                                             backend=superdesk.get_backend())
+    EventsPublishBatchResource('events_publish_batch', app=app, service=events_publish_batch_service)
+
     locations_search_service = LocationsService('locations', backend=superdesk.get_backend())
     LocationsResource('locations', app=app, service=locations_search_service)
 
+    init_typeahead_analysis(app)
+    locations_typeahead_service = LocationsTypeaheadService(LocationsTypeaheadResource.endpoint_name,
+                                                            backend=superdesk.get_backend())
+    LocationsTypeaheadResource(LocationsTypeaheadResource.endpoint_name,
+                               app=app,
+                               service=locations_typeahead_service)
+
+    geo_search_service = PlanningGeoSearchService(PlanningGeoSearchResource.endpoint_name,
+                                                  backend=superdesk.get_backend())
+    PlanningGeoSearchResource(PlanningGeoSearchResource.endpoint_name,
+                              app=app,
+                              service=geo_search_service)
+
+    planning_aggregations_service = PlanningAggregationsService(PlanningAggregationsResource.endpoint_name,
+                                                                backend=superdesk.get_backend())
+    PlanningAggregationsResource(PlanningAggregationsResource.endpoint_name,
+                                 app=app,
+                                 service=planning_aggregations_service)
+
+    notification_subscriptions_service = NotificationSubscriptionsService(
+        NotificationSubscriptionsResource.endpoint_name,
+        backend=superdesk.get_backend()
+    )
+    NotificationSubscriptionsResource(NotificationSubscriptionsResource.endpoint_name,
+                                      app=app,
+                                      service=notification_subscriptions_service)
+
     files_service = EventsFilesService('events_files', backend=superdesk.get_backend())
     EventsFilesResource('events_files', app=app, service=files_service)
 
@@ -161,6 +205,18 @@ def init_app(app):
 
     app.on_locked_planning += planning_search_service.on_locked_planning
 
+    app.on_inserted_vocabularies += clear_vocabularies_cache
+    app.on_updated_vocabularies += clear_vocabularies_cache
+    app.on_replaced_vocabularies += clear_vocabularies_cache
+    app.on_deleted_item_vocabularies += clear_vocabularies_cache
+    app.on_deleted_item_locations += clear_locations_index
+    app.on_inserted_locations += clear_typeahead_cache
+    app.on_updated_locations += clear_typeahead_cache
+    app.on_replaced_locations += clear_typeahead_cache
+    app.on_deleted_item_locations += clear_typeahead_cache
+    app.on_deleted_item_auth += remove_session_subscriptions
+    app.teardown_request(flush_notifications)
+
     coverage_history_service = CoverageHistoryService('coverage_history', backend=superdesk.get_backend())
     CoverageHistoryResource('coverage_history', app=app, service=coverage_history_service)
 
@@ -244,6 +300,18 @@ def init_app(app):
     import planning.output_formatters  # noqa
 
     app.client_config['max_recurrent_events'] = get_max_recurrent_events(app)
+    app.client_config['virtual_recurrent_events'] = is_virtual_recurrence_enabled(app)
+
+    if get_recurring_events_horizon(app):
+        app.config['CELERY_BEAT_SCHEDULE']['planning:extend_recurring_events'] = {
+            'task': 'planning.extend_recurring_events',
+            'schedule': timedelta(hours=1)
+        }
+
+
+@celery.task(soft_time_limit=600)
+def extend_recurring_events():
+    ExtendRecurringEvents().run()
 
 
 register_feeding_service(
@@ -2,7 +2,8 @@ from apps.archive.common import set_original_creator
 from apps.auth import get_user_id
 from superdesk import Resource, Service, config, get_resource_service
 from superdesk.errors import SuperdeskApiError
-from superdesk.notification import push_notification
+from .notifications import push_notification
+from superdesk.utils import ListCursor
 
 
 class AgendasResource(Resource):
@@ -60,7 +61,7 @@ class AgendasService(Service):
         )
 
     def on_delete(self, doc):
-        if get_resource_service('planning').get_planning_by_agenda_id(doc.get(config.ID_FIELD)).count() > 0:
+        if get_resource_service('planning').has_planning_items_for_agenda(doc.get(config.ID_FIELD)):
             raise SuperdeskApiError.badRequestError(message='Agenda is referenced by Planning items. '
                                                             'Cannot delete Agenda')
 
@@ -69,3 +70,41 @@ class AgendasService(Service):
             'agenda:deleted',
             item=str(doc[config.ID_FIELD])
         )
+
+
+class AgendaUsageResource(Resource):
+    """Number of planning items of each agenda, for the agenda management"""
+
+    endpoint_name = 'agenda_usage'
+    url = 'agenda_usage'
+    schema = {
+        'name': {'type': 'string'},
+        'is_enabled': {'type': 'boolean'},
+        'planning_items': {'type': 'integer'},
+    }
+    resource_methods = ['GET']
+    item_methods = []
+    datasource = {'source': 'agenda'}
+
+
+class AgendaUsageService(Service):
+    def get(self, req, lookup):
+        """Get the agendas with their number of planning items, counted with a single aggregation
+
+        The `agendas` argument restricts the result to a comma separated list of Agenda _ids.
+        """
+        agendas = list(get_resource_service('agenda').get(req=None, lookup={}))
+        agenda_ids = req.args.get('agendas') if req is not None and req.args else None
+        if agenda_ids:
+            agenda_ids = set(agenda_ids.split(','))
+            agendas = [agenda for agenda in agendas if str(agenda[config.ID_FIELD]) in agenda_ids]
+
+        usage = get_resource_service('planning').get_agendas_usage(
+            [agenda[config.ID_FIELD] for agenda in agendas]
+        )
+        return ListCursor([{
+            config.ID_FIELD: agenda[config.ID_FIELD],
+            'name': agenda.get('name'),
+            'is_enabled': agenda.get('is_enabled', True),
+            'planning_items': usage.get(str(agenda[config.ID_FIELD]), 0)
+        } for agenda in agendas])
@@ -0,0 +1,16 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from .extend_recurring_events import ExtendRecurringEvents  # noqa
+from .update_event_http_ingest import UpdateEventHTTPIngest  # noqa
+from .watch_event_files import WatchEventFiles  # noqa
+from .dedupe_locations import DedupeLocations  # noqa
+from .set_locations_geo_location import SetLocationsGeoLocation  # noqa
+from .init_typeahead_analysis import InitTypeaheadAnalysis  # noqa
@@ -0,0 +1,236 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import logging
+import math
+import superdesk
+from eve.utils import config
+from flask import current_app as app
+from eve.methods.common import resolve_document_etag
+from pymongo import UpdateOne
+from superdesk import get_resource_service
+from superdesk.celery_task_utils import get_lock_id
+from superdesk.lock import lock, unlock
+from superdesk.utc import utcnow
+from planning.locations import normalise_location_name, clear_locations_index, clear_typeahead_cache
+
+logger = logging.getLogger(__name__)
+
+# fields of the duplicates copied to the kept location when it doesn't have them
+MERGED_FIELDS = ['position', 'geo_location', 'address', 'access', 'details', 'open_hours', 'capacity',
+                 'contact_info']
+
+EARTH_RADIUS = 6371000
+
+
+class DedupeLocations(superdesk.Command):
+    """Merge the near-duplicate locations
+
+    The locations are grouped in blocks by their normalised name and locality, the words of
+    the name being sorted so "Nansens plass 17" and "17 Nansens plass" end up in the same block. Only the
+    locations of a block are compared, and those more than --distance metres apart are kept apart.
+
+    The oldest location of each cluster is kept, completed with the details of its duplicates.
+    The events referencing the duplicates are updated in bulk, then the duplicates are deleted,
+    unless they are still referenced by events modified meanwhile.
+
+    Example:
+    ::
+
+        $ python manage.py planning:dedupe_locations --distance 100 --dry-run
+
+    """
+
+    option_list = [
+        superdesk.Option('--distance', '-d', dest='distance', type=float, default=100.0),
+        superdesk.Option('--dry-run', dest='dry_run', action='store_true', default=False)
+    ]
+
+    def run(self, distance=100.0, dry_run=False):
+        lock_name = get_lock_id('planning', 'dedupe_locations')
+        if not lock(lock_name, expire=3610):
+            logger.info('Dedupe locations task is already running.')
+            return
+
+        try:
+            locations = app.data.get_mongo_collection('locations').find(
+                {},
+                {field: 1 for field in ['guid', 'name', 'unique_name', 'address', config.DATE_CREATED] + MERGED_FIELDS}
+            )
+            clusters = get_duplicate_clusters(locations, distance)
+            logger.info('Found {} clusters of duplicate locations.'.format(len(clusters)))
+
+            for cluster in clusters:
+                logger.info('Merging {} into {}.'.format(
+                    [location.get('name') for location in cluster[1:]], cluster[0].get('name')))
+                if not dry_run:
+                    self._merge(cluster[0], cluster[1:])
+        finally:
+            unlock(lock_name)
+            clear_locations_index()
+            clear_typeahead_cache()
+
+    def _merge(self, location, duplicates):
+        updates = {}
+        for duplicate in duplicates:
+            for field in MERGED_FIELDS:
+                if not location.get(field) and not updates.get(field) and duplicate.get(field):
+                    updates[field] = duplicate[field]
+
+        locations_service = get_resource_service('locations')
+        if updates:
+            locations_service.system_update(location[config.ID_FIELD], updates, location)
+
+        referenced = self._update_events(location, [duplicate['guid'] for duplicate in duplicates
+                                                    if duplicate.get('guid')])
+        if referenced:
+            logger.warning('Locations {} are referenced by events modified meanwhile, not deleted.'.format(
+                sorted(referenced)))
+
+        deleted = [duplicate[config.ID_FIELD] for duplicate in duplicates if duplicate.get('guid') not in referenced]
+        if deleted:
+            locations_service.delete(lookup={config.ID_FIELD: {'$in': deleted}})
+
+    def _update_events(self, location, guids):
+        """Point the events referencing the duplicates to the kept location, in mongo then elastic
+
+        The location list of each event is rewritten, as an event can reference several duplicates,
+        each location being only listed once. The events modified meanwhile are not updated.
+
+        :return set: guids of the duplicates still referenced by the events which weren't updated
+        """
+        if not guids:
+            return set()
+
+        events = app.data.get_mongo_collection('events')
+        now = utcnow()
+        ids = []
+        requests = []
+        for event in events.find({'location.qcode': {'$in': guids}}):
+            event_locations = []
+            for event_location in event['location']:
+                if event_location.get('qcode') in guids:
+                    event_location = dict(event_location, qcode=location['guid'], name=location.get('name'))
+                if event_location.get('qcode') == location['guid'] and \
+                        any(other.get('qcode') == location['guid'] for other in event_locations):
+                    continue
+                event_locations.append(event_location)
+
+            update = {'location': event_locations, config.LAST_UPDATED: now}
+            updated = dict(event, **update)
+            resolve_document_etag(updated, 'events')
+            update[config.ETAG] = updated[config.ETAG]
+
+            ids.append(event[config.ID_FIELD])
+            requests.append(UpdateOne(
+                {config.ID_FIELD: event[config.ID_FIELD], config.ETAG: event.get(config.ETAG)},
+                {'$set': update}
+            ))
+
+        if not requests:
+            return set()
+
+        result = events.bulk_write(requests, ordered=False)
+        updated = list(events.find({config.ID_FIELD: {'$in': ids}}))
+        # indexing the events again replaces them in elastic
+        get_resource_service('events').backend.create_in_search('events', updated)
+        logger.info('Updated the location of {} events.'.format(result.matched_count))
+
+        if result.matched_count == len(requests):
+            return set()
+        return {
+            event_location.get('qcode')
+            for event in updated for event_location in event.get('location') or []
+            if event_location.get('qcode') in guids
+        }
+
+
+def get_location_block_key(location):
+    """Get the key of the block of a location, its normalised name and its locality
+
+    The ingest resolves the location names with the same key, see `normalise_location_name`.
+    """
+    name = normalise_location_name(location.get('name') or location.get('unique_name'))
+    locality = normalise_location_name((location.get('address') or {}).get('locality'))
+    return name, locality
+
+
+def get_duplicate_clusters(locations, max_distance=100.0):
+    """Cluster the near-duplicate locations
+
+    The locations are only compared within their block. Locations without position are merged
+    into the cluster of their block if there is only one.
+
+    :param locations: locations
+    :param float max_distance: maximum distance in metres between the duplicates
+    :return list: clusters of at least two locations, the oldest location first
+    """
+    blocks = {}
+    for location in locations:
+        key = get_location_block_key(location)
+        if key[0]:
+            blocks.setdefault(key, []).append(location)
+
+    clusters = []
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+
+        block.sort(key=lambda location: (location.get(config.DATE_CREATED) is None,
+                                         location.get(config.DATE_CREATED) or 0))
+        block_clusters = []
+        without_position = []
+        for location in block:
+            position = _get_position(location)
+            if position is None:
+                without_position.append(location)
+                continue
+
+            for cluster in block_clusters:
+                if get_distance(position, _get_position(cluster[0])) <= max_distance:
+                    cluster.append(location)
+                    break
+            else:
+                block_clusters.append([location])
+
+        if len(block_clusters) > 1 and without_position:
+            logger.warning('Locations {} match several places, not merged.'.format(
+                [location.get('name') for location in without_position]))
+        elif block_clusters:
+            block_clusters[0].extend(without_position)
+        else:
+            block_clusters.append(without_position)
+
+        for cluster in block_clusters:
+            if len(cluster) > 1:
+                cluster.sort(key=lambda location: (location.get(config.DATE_CREATED) is None,
+                                                   location.get(config.DATE_CREATED) or 0))
+                clusters.append(cluster)
+    return clusters
+
+
+def get_distance(position, other):
+    """Get the distance in metres between two (latitude, longitude) positions"""
+    latitude, longitude = map(math.radians, position)
+    other_latitude, other_longitude = map(math.radians, other)
+    a = math.sin((other_latitude - latitude) / 2) ** 2 + \
+        math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def _get_position(location):
+    position = location.get('position') or {}
+    try:
+        return float(position['latitude']), float(position['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+superdesk.command('planning:dedupe_locations', DedupeLocations())
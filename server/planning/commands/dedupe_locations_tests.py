@@ -0,0 +1,79 @@
+from datetime import datetime
+from planning.commands.dedupe_locations import DedupeLocations, get_duplicate_clusters, get_location_block_key, \
+    get_distance
+from planning.tests import TestCase
+
+
+def location(guid, name, latitude=None, longitude=None, locality=None, day=1):
+    doc = {'_id': guid, 'guid': guid, 'name': name, '_created': datetime(2017, 1, day)}
+    if latitude is not None:
+        doc['position'] = {'latitude': latitude, 'longitude': longitude}
+    if locality:
+        doc['address'] = {'locality': locality}
+    return doc
+
+
+class DedupeLocationsTestCase(TestCase):
+
+    def test_get_location_block_key(self):
+        self.assertEqual(
+            get_location_block_key({'name': 'Nansens plass 17', 'address': {'locality': 'Tromsø'}}),
+            get_location_block_key({'name': '17, nansens  Plass', 'address': {'locality': 'TROMSØ'}})
+        )
+        self.assertNotEqual(
+            get_location_block_key({'name': 'City Hall', 'address': {'locality': 'Oslo'}}),
+            get_location_block_key({'name': 'City Hall', 'address': {'locality': 'Bergen'}})
+        )
+
+    def test_get_distance(self):
+        # Oslo - Bergen is about 305 km
+        self.assertAlmostEqual(305, get_distance((59.91, 10.75), (60.39, 5.32)) / 1000, delta=5)
+        self.assertEqual(0, get_distance((59.91, 10.75), (59.91, 10.75)))
+
+    def test_get_duplicate_clusters(self):
+        clusters = get_duplicate_clusters([
+            location('l1', 'Nansens plass 17', 69.6548, 18.9651, day=2),
+            location('l2', '17 Nansens plass', 69.6549, 18.9652, day=1),
+            location('l3', 'Nansens plass 17', day=3),
+            location('l4', 'Oslo Spektrum', 59.9129, 10.7547),
+            location('l5', 'Oslo spektrum', 60.39, 5.32),
+            location('l6', 'oslo spektrum'),
+            location('l7', 'Vigeland Park', 59.927, 10.700),
+        ], max_distance=100)
+
+        # the oldest location first, l6 is not merged as it could match both l4 and l5
+        self.assertEqual([['l2', 'l1', 'l3']], [[doc['guid'] for doc in cluster] for cluster in clusters])
+
+    def test_run(self):
+        with self.app.app_context():
+            self.app.data.insert('locations', [
+                location('l1', 'Nansens plass 17', day=1),
+                location('l2', '17 Nansens plass', 69.6548, 18.9651, day=2),
+                location('l3', 'Oslo Spektrum', 59.9129, 10.7547),
+                location('l4', 'Nansens Plass 17', day=3),
+            ])
+            self.app.data.insert('events', [
+                {'_id': 'e1', '_etag': 'etag', 'name': 'Event 1',
+                 'location': [{'qcode': 'l2', 'name': '17 Nansens plass'}]},
+                {'_id': 'e2', 'name': 'Event 2', 'location': [{'qcode': 'l3', 'name': 'Oslo Spektrum'}]},
+                {'_id': 'e3', 'name': 'Event 3', 'location': [
+                    {'qcode': 'l3', 'name': 'Oslo Spektrum'},
+                    {'qcode': 'l2', 'name': '17 Nansens plass'},
+                    {'qcode': 'l4', 'name': 'Nansens Plass 17'},
+                ]},
+            ])
+
+            DedupeLocations().run()
+
+            locations = self.app.data.get_mongo_collection('locations')
+            self.assertEqual(['l1', 'l3'], sorted(doc['guid'] for doc in locations.find()))
+            self.assertEqual({'latitude': 69.6548, 'longitude': 18.9651},
+                             locations.find_one({'guid': 'l1'})['position'])
+
+            events = self.app.data.get_mongo_collection('events')
+            self.assertEqual({'qcode': 'l1', 'name': 'Nansens plass 17'}, events.find_one({'_id': 'e1'})['location'][0])
+            self.assertEqual({'qcode': 'l3', 'name': 'Oslo Spektrum'}, events.find_one({'_id': 'e2'})['location'][0])
+            # all the duplicates referenced by an event are replaced, the kept location being listed once
+            self.assertEqual(['l3', 'l1'], [loc['qcode'] for loc in events.find_one({'_id': 'e3'})['location']])
+            # the etag of the updated events changes
+            self.assertNotEqual('etag', events.find_one({'_id': 'e1'})['_etag'])
@@ -0,0 +1,145 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import logging
+import superdesk
+from copy import deepcopy
+from datetime import timedelta
+from flask import current_app as app
+from superdesk import get_resource_service
+from superdesk.celery_task_utils import get_lock_id
+from superdesk.lock import lock, unlock
+from superdesk.utc import utcnow
+from superdesk.metadata.utils import generate_guid
+from superdesk.metadata.item import GUID_NEWSML
+from planning.common import WORKFLOW_STATE, ITEM_STATE, get_recurring_events_horizon, get_max_recurrent_events, \
+    get_timezone
+from planning.events import get_next_recurring_date, setRecurringMode, overwrite_event_expiry_date, \
+    _get_occurrence_template, _to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+# Fields of the last occurrence that are not copied to the new occurrences
+RESET_FIELDS = ['unique_id', 'unique_name', 'pubstatus', 'revert_state', 'duplicate_from', 'duplicate_to',
+                'version_creator', 'versioncreated']
+
+
+class ExtendRecurringEvents(superdesk.Command):
+    """Keep recurring series of events generated up to RECURRING_EVENTS_HORIZON_WEEKS ahead
+
+    Series are generated up to the horizon when created, this command then
+    generates the following occurrences of each series as time passes.
+    """
+
+    log_msg = ''
+
+    def run(self):
+        horizon_weeks = get_recurring_events_horizon()
+        if not horizon_weeks:
+            logger.info('RECURRING_EVENTS_HORIZON_WEEKS is not configured. Nothing to do.')
+            return
+
+        now = utcnow()
+        horizon = now + timedelta(weeks=horizon_weeks)
+        self.log_msg = 'Horizon: {}.'.format(horizon)
+        logger.info('{} Starting to extend recurring events.'.format(self.log_msg))
+        lock_name = get_lock_id('planning', 'extend_recurring_events')
+
+        if not lock(lock_name, expire=610):
+            logger.info('{} Extend recurring events task is already running.'.format(self.log_msg))
+            return
+
+        try:
+            self._extend_series(horizon)
+        finally:
+            unlock(lock_name)
+
+        logger.info('{} Completed extending recurring events.'.format(self.log_msg))
+
+    def _extend_series(self, horizon):
+        events_service = get_resource_service('events')
+
+        for series in self._get_series_to_extend(horizon):
+            last_event = events_service.find_one(req=None, _id=series['last_id'])
+            if not last_event:
+                continue
+
+            new_events = self._generate_next_occurrences(last_event, series['first_start'], series['first_end'],
+                                                         horizon)
+            if not new_events:
+                continue
+
+            events_service.insert_occurrences(new_events)
+            logger.info('{} Added {} events to the series {}.'.format(self.log_msg, len(new_events), series['_id']))
+
+    def _get_series_to_extend(self, horizon):
+        """Get the last occurrence of every series that ends before the horizon
+
+        Uses a single aggregation over the events collection, returning for each series
+        the _id and start of its last occurrence along with the dates of its first occurrence.
+        The last occurrence is taken whatever its state, a spiked or cancelled occurrence
+        does not end the series.
+        """
+        pipeline = [
+            {'$match': {
+                'recurrence_id': {'$ne': None},
+                'dates.recurring_rule': {'$ne': None},
+                'virtual_recurrence': {'$ne': True}
+            }},
+            {'$sort': {'dates.start': 1}},
+            {'$group': {
+                '_id': '$recurrence_id',
+                'first_start': {'$first': '$dates.start'},
+                'first_end': {'$first': '$dates.end'},
+                'last_id': {'$last': '$_id'},
+                'last_start': {'$last': '$dates.start'}
+            }},
+            {'$match': {'last_start': {'$lt': horizon}}}
+        ]
+
+        return app.data.get_mongo_collection('events').aggregate(pipeline, allowDiskUse=True)
+
+    def _generate_next_occurrences(self, last_event, series_start, series_end, horizon):
+        """Generate the occurrences following the last event of a series, up to the horizon
+
+        The dates come from the recurring rule applied from the start of the series,
+        so an occurrence whose dates were edited does not shift the rest of the series
+        and the count of the rule is respected. The other fields are copied from the last event.
+        """
+        template = _get_occurrence_template(last_event)
+        for field in RESET_FIELDS:
+            template.pop(field, None)
+        template[ITEM_STATE] = WORKFLOW_STATE.IN_PROGRESS
+        setRecurringMode(template)
+
+        recurring_rule = template['dates']['recurring_rule']
+        tz = get_timezone(template['dates'].get('tz'))
+        time_delta = series_end - series_start
+        horizon = _to_naive_utc(horizon)
+
+        new_events = []
+        date = last_event['dates']['start']
+        while len(new_events) < get_max_recurrent_events():
+            date = get_next_recurring_date(after=date, start=series_start, tz=tz, inc=False, **recurring_rule)
+            if date is None or _to_naive_utc(date) > horizon:
+                break
+
+            new_event = deepcopy(template)
+            new_event['dates']['start'] = date
+            new_event['dates']['end'] = date + time_delta
+            new_event['guid'] = generate_guid(type=GUID_NEWSML)
+            new_event['_id'] = new_event['guid']
+            overwrite_event_expiry_date(new_event)
+            new_events.append(new_event)
+
+        return new_events
+
+
+superdesk.command('planning:extend_recurring_events', ExtendRecurringEvents())
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from planning.commands.extend_recurring_events import ExtendRecurringEvents
+from planning.tests import TestCase
+import pytz
+
+
+class ExtendRecurringEventsTestCase(TestCase):
+    series_start = datetime(2017, 1, 1, 10, 0, tzinfo=pytz.UTC)
+    series_end = datetime(2017, 1, 1, 11, 0, tzinfo=pytz.UTC)
+
+    def generate(self, last_event, horizon):
+        return ExtendRecurringEvents()._generate_next_occurrences(
+            last_event, self.series_start, self.series_end, horizon)
+
+    def get_last_event(self, **recurring_rule):
+        return {
+            '_id': 'event5',
+            'guid': 'event5',
+            'name': 'Daily event',
+            'recurrence_id': 'rec1',
+            'state': 'published',
+            'pubstatus': 'usable',
+            'dates': {
+                'start': datetime(2017, 1, 5, 10, 0, tzinfo=pytz.UTC),
+                'end': datetime(2017, 1, 5, 11, 0, tzinfo=pytz.UTC),
+                'recurring_rule': dict(frequency='DAILY', interval=1, **recurring_rule)
+            }
+        }
+
+    def test_generate_next_occurrences_until_horizon(self):
+        with self.app.app_context():
+            last_event = self.get_last_event(endRepeatMode='until', until=None)
+            horizon = datetime(2017, 1, 8, 12, 0, tzinfo=pytz.UTC)
+
+            new_events = self.generate(last_event, horizon)
+
+            self.assertEqual(
+                [event['dates']['start'].replace(tzinfo=None) for event in new_events],
+                [datetime(2017, 1, 6, 10, 0), datetime(2017, 1, 7, 10, 0), datetime(2017, 1, 8, 10, 0)]
+            )
+            for event in new_events:
+                self.assertEqual('rec1', event['recurrence_id'])
+                self.assertEqual('in_progress', event['state'])
+                self.assertNotIn('pubstatus', event)
+                self.assertNotEqual('event5', event['_id'])
+                self.assertEqual(event['dates']['end'] - event['dates']['start'], timedelta(hours=1))
+
+    def test_generate_next_occurrences_respects_count(self):
+        with self.app.app_context():
+            last_event = self.get_last_event(endRepeatMode='count', count=7)
+            horizon = datetime(2017, 2, 1, tzinfo=pytz.UTC)
+
+            new_events = self.generate(last_event, horizon)
+            self.assertEqual(2, len(new_events))
+            self.assertEqual(7, new_events[0]['dates']['recurring_rule']['count'])
+
+            last_event['dates']['start'] = datetime(2017, 1, 7, 10, 0, tzinfo=pytz.UTC)
+            last_event['dates']['end'] = datetime(2017, 1, 7, 11, 0, tzinfo=pytz.UTC)
+            self.assertEqual([], self.generate(last_event, horizon))
+
+    def test_generate_next_occurrences_ignores_edited_last_event(self):
+        with self.app.app_context():
+            last_event = self.get_last_event(endRepeatMode='until', until=None)
+            last_event['dates']['start'] = datetime(2017, 1, 5, 14, 0, tzinfo=pytz.UTC)
+            last_event['dates']['end'] = datetime(2017, 1, 5, 17, 0, tzinfo=pytz.UTC)
+            horizon = datetime(2017, 1, 7, 12, 0, tzinfo=pytz.UTC)
+
+            new_events = self.generate(last_event, horizon)
+            self.assertEqual(
+                [(event['dates']['start'].replace(tzinfo=None), event['dates']['end'].replace(tzinfo=None))
+                 for event in new_events],
+                [(datetime(2017, 1, 6, 10, 0), datetime(2017, 1, 6, 11, 0)),
+                 (datetime(2017, 1, 7, 10, 0), datetime(2017, 1, 7, 11, 0))]
+            )
@@ -0,0 +1,74 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import logging
+import superdesk
+from eve.utils import config
+from eve_elastic import get_es, get_indices
+from flask import current_app as app
+from planning.locations import TYPEAHEAD_ANALYSIS, clear_typeahead_cache
+
+logger = logging.getLogger(__name__)
+
+# number of locations indexed with a single bulk request
+BATCH_SIZE = 500
+
+
+class InitTypeaheadAnalysis(superdesk.Command):
+    """Add the typeahead analysis to an existing elastic index and index the locations again
+
+    The analysis is only added to the settings of the new indexes, see `init_typeahead_analysis`.
+    For an existing index, the analysis settings are updated while the index is closed, the
+    `typeahead` fields are added to the mapping of the locations, then the locations are indexed
+    again from mongo so their names are analysed for the typeahead.
+
+    Example:
+    ::
+
+        $ python manage.py planning:init_typeahead_analysis
+
+    """
+
+    def run(self):
+        index = app.config['ELASTICSEARCH_INDEX']
+        indices = get_indices(get_es(app.config['ELASTICSEARCH_URL']))
+
+        logger.info('Adding the typeahead analysis to the index {}.'.format(index))
+        # the analysis settings can't be changed on an open index
+        indices.close(index=index)
+        try:
+            indices.put_settings(index=index, body={'analysis': TYPEAHEAD_ANALYSIS})
+        finally:
+            indices.open(index=index)
+
+        app.data.elastic.put_mapping(app, index)
+        indexed = self._index_locations()
+        clear_typeahead_cache()
+        logger.info('Indexed {} locations for the typeahead.'.format(indexed))
+
+    def _index_locations(self):
+        collection = app.data.get_mongo_collection('locations')
+        search_backend = app.data._search_backend('locations')
+
+        indexed = 0
+        batch = []
+        for location in collection.find().sort(config.ID_FIELD, 1):
+            batch.append(location)
+            if len(batch) >= BATCH_SIZE:
+                search_backend.bulk_insert('locations', batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            search_backend.bulk_insert('locations', batch)
+            indexed += len(batch)
+        return indexed
+
+
+superdesk.command('planning:init_typeahead_analysis', InitTypeaheadAnalysis())
@@ -0,0 +1,37 @@
+from mock import Mock, patch
+from planning.commands import init_typeahead_analysis
+from planning.commands.init_typeahead_analysis import InitTypeaheadAnalysis
+from planning.locations import TYPEAHEAD_ANALYSIS
+from planning.tests import TestCase
+
+
+class InitTypeaheadAnalysisTestCase(TestCase):
+
+    def test_run(self):
+        indices = Mock()
+        search_backend = Mock()
+        with self.app.app_context():
+            self.app.data.insert('locations', [
+                {'_id': 'location{}'.format(index), 'guid': 'location{}'.format(index),
+                 'name': 'Location {}'.format(index)}
+                for index in range(3)
+            ])
+
+            with patch.object(init_typeahead_analysis, 'get_indices', return_value=indices), \
+                    patch.object(init_typeahead_analysis, 'get_es'), \
+                    patch.object(init_typeahead_analysis, 'BATCH_SIZE', 2), \
+                    patch.object(self.app.data, 'elastic') as elastic, \
+                    patch.object(self.app.data, '_search_backend', return_value=search_backend):
+                InitTypeaheadAnalysis().run()
+
+            index = self.app.config['ELASTICSEARCH_INDEX']
+            # the settings are updated while the index is closed
+            self.assertEqual(['close', 'put_settings', 'open'], [call[0] for call in indices.method_calls])
+            indices.put_settings.assert_called_once_with(index=index, body={'analysis': TYPEAHEAD_ANALYSIS})
+            elastic.put_mapping.assert_called_once_with(self.app, index)
+
+            # the locations are indexed again in batches
+            self.assertEqual(
+                [['location0', 'location1'], ['location2']],
+                [[location['_id'] for location in call[0][1]] for call in search_backend.bulk_insert.call_args_list]
+            )
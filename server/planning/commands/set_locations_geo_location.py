@@ -0,0 +1,77 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import logging
+import superdesk
+from eve.utils import config
+from flask import current_app as app
+from pymongo import UpdateOne
+from superdesk import get_resource_service
+from planning.locations import set_geo_location, clear_typeahead_cache
+
+logger = logging.getLogger(__name__)
+
+# number of locations updated with a single bulk write
+BATCH_SIZE = 500
+
+
+class SetLocationsGeoLocation(superdesk.Command):
+    """Set the geo_location of the locations created before it was set from their position
+
+    The locations are updated in mongo with bulk writes, then indexed again in elastic
+    so the geo search finds them. The elastic mapping of the locations must be up to date,
+    i.e. with `app:initialize_data`, for geo_location to be indexed as a geo_point.
+
+    Example:
+    ::
+
+        $ python manage.py planning:set_locations_geo_location
+
+    """
+
+    def run(self):
+        collection = app.data.get_mongo_collection('locations')
+        cursor = collection.find(
+            {'position': {'$ne': None}, 'geo_location': {'$exists': False}},
+            {config.ID_FIELD: 1, 'position': 1}
+        )
+
+        updated = 0
+        batch = []
+        for location in cursor:
+            batch.append(location)
+            if len(batch) >= BATCH_SIZE:
+                updated += self._update_locations(collection, batch)
+                batch = []
+        if batch:
+            updated += self._update_locations(collection, batch)
+
+        clear_typeahead_cache()
+        logger.info('Set the geo location of {} locations.'.format(updated))
+
+    def _update_locations(self, collection, locations):
+        requests = []
+        for location in locations:
+            # geo_location is set to None for an incomplete position, so the location is not read again
+            updates = {'position': location.get('position')}
+            set_geo_location(updates)
+            requests.append(UpdateOne(
+                {config.ID_FIELD: location[config.ID_FIELD], 'geo_location': {'$exists': False}},
+                {'$set': {'geo_location': updates['geo_location']}}
+            ))
+
+        collection.bulk_write(requests, ordered=False)
+        ids = [location[config.ID_FIELD] for location in locations]
+        get_resource_service('locations').backend.create_in_search('locations', list(collection.find(
+            {config.ID_FIELD: {'$in': ids}})))
+        return len(locations)
+
+
+superdesk.command('planning:set_locations_geo_location', SetLocationsGeoLocation())
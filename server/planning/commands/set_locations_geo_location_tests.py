@@ -0,0 +1,22 @@
+from planning.commands.set_locations_geo_location import SetLocationsGeoLocation
+from planning.tests import TestCase
+
+
+class SetLocationsGeoLocationTestCase(TestCase):
+
+    def test_run(self):
+        with self.app.app_context():
+            self.app.data.insert('locations', [
+                {'_id': 'location1', 'guid': 'location1', 'name': 'Oslo Spektrum',
+                 'position': {'latitude': 59.91, 'longitude': 10.75}},
+                {'_id': 'location2', 'guid': 'location2', 'name': 'Somewhere', 'position': {'latitude': 59.91}},
+                {'_id': 'location3', 'guid': 'location3', 'name': 'Nowhere'},
+            ])
+
+            SetLocationsGeoLocation().run()
+
+            locations = {location['_id']: location for location in
+                         self.app.data.get_mongo_collection('locations').find()}
+            self.assertEqual([10.75, 59.91], locations['location1']['geo_location'])
+            self.assertIsNone(locations['location2']['geo_location'])
+            self.assertNotIn('geo_location', locations['location3'])
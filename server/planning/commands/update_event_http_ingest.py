@@ -0,0 +1,87 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import logging
+import time
+import superdesk
+from concurrent.futures import ThreadPoolExecutor
+from eve.utils import config
+from flask import current_app as app
+from superdesk import get_resource_service
+from superdesk.io.commands.update_ingest import update_provider, is_closed, is_scheduled, \
+    get_provider_rule_set, get_provider_routing_scheme
+from superdesk.stats import stats
+from planning.common import get_event_http_workers
+from planning.feeding_services.event_http_service import EventHTTPFeedingService
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateEventHTTPIngest(superdesk.Command):
+    """Update the event HTTP providers concurrently
+
+    The providers are updated from a pool of PLANNING_EVENT_HTTP_WORKERS threads,
+    so a slow calendar host doesn't delay the other providers.
+    Each provider is still locked while updated, like with the `ingest:update` command.
+
+    The command is not scheduled, as `ingest:update` already polls these providers,
+    it is meant to update them on demand.
+    """
+
+    option_list = [
+        superdesk.Option('--provider', '-p', dest='provider_name'),
+        superdesk.Option('--workers', '-w', dest='workers', type=int)
+    ]
+
+    def run(self, provider_name=None, workers=None):
+        workers = workers or get_event_http_workers() or 1
+        providers = self._get_providers(provider_name)
+        if not providers:
+            return
+
+        logger.info('Updating {} event HTTP providers with {} workers.'.format(len(providers), workers))
+        started = time.time()
+        current_app = app._get_current_object()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for provider in providers:
+                executor.submit(self._update_provider, current_app, provider)
+
+        logger.info('Updated event HTTP providers in {:.3f}s.'.format(time.time() - started))
+
+    def _get_providers(self, provider_name=None):
+        lookup = {'feeding_service': EventHTTPFeedingService.NAME}
+        if provider_name:
+            lookup['name'] = provider_name
+
+        return [
+            provider for provider in get_resource_service('ingest_providers').get(req=None, lookup=lookup)
+            if not is_closed(provider) and is_scheduled(provider)
+        ]
+
+    def _update_provider(self, current_app, provider):
+        started = time.time()
+        with current_app.app_context():
+            try:
+                update_provider(
+                    provider=provider,
+                    rule_set=get_provider_rule_set(provider),
+                    routing_scheme=get_provider_routing_scheme(provider)
+                )
+            except Exception:
+                logger.exception('Failed to update the event HTTP provider {}.'.format(provider.get('name')))
+            finally:
+                duration = time.time() - started
+                logger.info('Updated the event HTTP provider {} in {:.3f}s.'.format(provider.get('name'), duration))
+                stats.timing('planning.ingest.event_http.{}.update'.format(provider[config.ID_FIELD]),
+                             int(duration * 1000))
+
+
+superdesk.command('planning:update_event_http_ingest', UpdateEventHTTPIngest())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import logging
+import time
+import superdesk
+from eve.utils import config
+from superdesk import get_resource_service
+from superdesk.celery_task_utils import get_lock_id
+from superdesk.io.commands.update_ingest import ingest_items, get_provider_rule_set, get_provider_routing_scheme, \
+    LAST_UPDATED, LAST_ITEM_UPDATE
+from superdesk.lock import lock, unlock
+from superdesk.stats import stats
+from superdesk.utc import utcnow
+from planning.common import get_ingest_batch_size
+from planning.feeding_services.event_file_service import EventFileFeedingService
+from planning.feeding_services.event_file_watcher import InotifyWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class WatchEventFiles(superdesk.Command):
+    """Ingest the files of an event file provider as soon as they are written into its folder
+
+    The folder is scanned once on start, then only the files reported by inotify are ingested
+    instead of listing the whole folder on each scheduled update. The folder is scanned again
+    if inotify events are lost.
+
+    The scheduled updates of the provider keep working as a fallback, so their interval can be
+    increased while the watcher runs. Both use the ingest lock of the provider.
+
+    Example:
+    ::
+
+        $ python manage.py planning:watch_event_files --provider "Event files"
+
+    """
+
+    option_list = [
+        superdesk.Option('--provider', '-p', dest='provider_name', required=True),
+        superdesk.Option('--delay', '-d', dest='delay', type=float, default=1.0,
+                         help='Seconds to wait for the other files dropped at the same time')
+    ]
+
+    def run(self, provider_name, delay=1.0):
+        provider = get_resource_service('ingest_providers').find_one(
+            req=None,
+            name=provider_name,
+            feeding_service=EventFileFeedingService.NAME
+        )
+        if not provider:
+            logger.error('Event file provider {} not found.'.format(provider_name))
+            return
+
+        path = provider.get('config', {}).get('path')
+        if not path:
+            logger.error('Event file provider {} is configured without path.'.format(provider_name))
+            return
+
+        batch_size = get_ingest_batch_size()
+        logger.info('Watching {} for the event file provider {}.'.format(path, provider_name))
+
+        # the watcher is started first, so no file is missed by the full scan
+        with InotifyWatcher(path) as watcher:
+            full_scan = True
+            pending = []
+            while True:
+                filenames = watcher.read(timeout=delay if full_scan or pending else None)
+                if filenames is None:
+                    full_scan = True
+                elif filenames:
+                    pending.extend(filename for filename in filenames if filename not in pending)
+                    if len(pending) < batch_size:
+                        continue
+
+                if (full_scan or pending) and self._ingest(provider, None if full_scan else pending):
+                    full_scan = False
+                    pending = []
+
+    def _ingest(self, provider, filenames=None):
+        """Ingest the given files of the provider, or all the files of its folder
+
+        :return bool: False if the provider is locked by another update or the ingest failed,
+            the files are then kept queued
+        """
+        lock_name = get_lock_id('ingest', provider['name'], provider[config.ID_FIELD])
+        if not lock(lock_name, expire=1810):
+            return False
+
+        started = time.time()
+        try:
+            ingest_provider_service = get_resource_service('ingest_providers')
+            provider = ingest_provider_service.find_one(req=None, _id=provider[config.ID_FIELD])
+
+            feeding_service = EventFileFeedingService()
+            feeding_service.filenames = filenames
+            update = {LAST_UPDATED: utcnow()}
+            for items in feeding_service.update(provider, update):
+                ingest_items(items, provider, feeding_service,
+                             get_provider_rule_set(provider), get_provider_routing_scheme(provider))
+                stats.incr('ingest.ingested_items', len(items))
+                if items:
+                    update[LAST_ITEM_UPDATE] = utcnow()
+
+            ingest_provider_service.system_update(provider[config.ID_FIELD], update, provider)
+        except Exception:
+            logger.exception('Failed to ingest the files of the event file provider {}.'.format(provider.get('name')))
+            return False
+        finally:
+            unlock(lock_name)
+            logger.info('Ingested {} files of the event file provider {} in {:.3f}s.'.format(
+                'all the' if filenames is None else len(filenames), provider.get('name'), time.time() - started))
+        return True
+
+
+superdesk.command('planning:watch_event_files', WatchEventFiles())
@@ -8,10 +8,14 @@
 # AUTHORS and LICENSE files distributed with this source code, or
 # at https://www.sourcefabric.org/superdesk/license
 
-from flask import current_app as app
+import pytz
+from copy import deepcopy
+from flask import current_app as app, has_app_context
+from superdesk import get_resource_service
 from superdesk.utc import utcnow
 from datetime import timedelta
 from collections import namedtuple
+from functools import lru_cache
 from superdesk.resource import not_analyzed
 
 ITEM_STATE = 'state'
@@ -39,6 +43,12 @@ PUBLISHED_STATE_SCHEMA = {
     'mapping': not_analyzed
 }
 
+# How long vocabularies are cached for, as other processes don't get the update events
+VOCABULARIES_CACHE_TTL = timedelta(minutes=10)
+
+# vocabulary _id -> (expiry, {qcode: item})
+_vocabularies_cache = {}
+
 WORKFLOW_STATE_SCHEMA = {
     'type': 'string',
     'allowed': workflow_state,
@@ -59,3 +69,96 @@ def get_max_recurrent_events(current_app=None):
     if current_app is not None:
         return int(current_app.config.get('MAX_RECURRENT_EVENTS', 200))
     return int(app.config.get('MAX_RECURRENT_EVENTS', 200))
+
+
+def is_virtual_recurrence_enabled(current_app=None):
+    if current_app is not None:
+        return bool(current_app.config.get('VIRTUAL_RECURRENT_EVENTS', False))
+    return bool(app.config.get('VIRTUAL_RECURRENT_EVENTS', False))
+
+
+def get_recurring_events_horizon(current_app=None):
+    """Number of weeks ahead recurring series are generated for, 0 if disabled"""
+    if current_app is not None:
+        return int(current_app.config.get('RECURRING_EVENTS_HORIZON_WEEKS', 0) or 0)
+    return int(app.config.get('RECURRING_EVENTS_HORIZON_WEEKS', 0) or 0)
+
+
+def get_ingest_batch_size(current_app=None):
+    """Number of items parsed before being passed to the ingest, for parsers supporting batches"""
+    if current_app is not None:
+        return int(current_app.config.get('PLANNING_INGEST_BATCH_SIZE', 500))
+    return int(app.config.get('PLANNING_INGEST_BATCH_SIZE', 500))
+
+
+def get_event_http_workers(current_app=None):
+    """Number of event HTTP providers updated concurrently by `planning:update_event_http_ingest`, 0 if not set"""
+    if current_app is not None:
+        return int(current_app.config.get('PLANNING_EVENT_HTTP_WORKERS', 0) or 0)
+    return int(app.config.get('PLANNING_EVENT_HTTP_WORKERS', 0) or 0)
+
+
+def get_file_ingest_workers(current_app=None):
+    """Number of processes parsing the event files concurrently, 0 if they are parsed one by one"""
+    if current_app is not None:
+        return int(current_app.config.get('PLANNING_FILE_INGEST_WORKERS', 0) or 0)
+    return int(app.config.get('PLANNING_FILE_INGEST_WORKERS', 0) or 0)
+
+
+def is_ntb_event_pretty_print_enabled(current_app=None):
+    """Indent the xml of the published NTB events, disable it to save time and bandwidth on large publishes"""
+    if current_app is None:
+        if not has_app_context():
+            return True
+        current_app = app
+    return bool(current_app.config.get('PLANNING_NTB_EVENT_PRETTY_PRINT', True))
+
+
+@lru_cache(maxsize=None)
+def get_timezone(tz_name):
+    """Resolve a timezone from its name, caching the result
+
+    :param str tz_name: name of the timezone, i.e. Europe/Oslo
+    :return: pytz timezone, or None if no name is provided
+    """
+    return pytz.timezone(tz_name) if tz_name else None
+
+
+def get_vocabulary_item(vocabulary_id, qcode, active_only=False):
+    """Get an item of a vocabulary by its qcode
+
+    Vocabularies are cached in the process, so a copy of the item is returned
+    which can be modified by the caller.
+
+    :param str vocabulary_id: _id of the vocabulary, i.e. eventoccurstatus
+    :param str qcode: qcode of the item
+    :param bool active_only: if True, inactive items are not returned
+    :return dict: copy of the vocabulary item, or None if not found
+    """
+    item = _get_vocabulary_items(vocabulary_id).get(qcode)
+    if item is None or (active_only and not item.get('is_active', True)):
+        return None
+    return deepcopy(item)
+
+
+def _get_vocabulary_items(vocabulary_id):
+    now = utcnow()
+    cached = _vocabularies_cache.get(vocabulary_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    vocabulary = get_resource_service('vocabularies').find_one(req=None, _id=vocabulary_id)
+    if not vocabulary:
+        return {}
+
+    items = {}
+    for item in vocabulary.get('items') or []:
+        items.setdefault(item.get('qcode'), item)
+
+    _vocabularies_cache[vocabulary_id] = (now + VOCABULARIES_CACHE_TTL, items)
+    return items
+
+
+def clear_vocabularies_cache(*args, **kwargs):
+    """Invalidate the cached vocabularies, called when vocabularies are modified"""
+    _vocabularies_cache.clear()
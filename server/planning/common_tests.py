@@ -0,0 +1,51 @@
+from planning.common import get_vocabulary_item, clear_vocabularies_cache
+from planning.tests import TestCase
+
+
+class VocabulariesCacheTestCase(TestCase):
+    vocab = [{'_id': 'eventoccurstatus', 'items': [{
+        'is_active': True,
+        'qcode': 'eocstat:eos5',
+        'name': 'Planned, occurs certainly'
+    }, {
+        'is_active': False,
+        'qcode': 'eocstat:eos6',
+        'name': 'Cancelled'
+    }]}]
+
+    def setUp(self):
+        super().setUp()
+        self.app.data.insert('vocabularies', self.vocab)
+
+    def test_get_vocabulary_item(self):
+        with self.app.app_context():
+            item = get_vocabulary_item('eventoccurstatus', 'eocstat:eos5')
+            self.assertEqual('Planned, occurs certainly', item['name'])
+
+            self.assertIsNone(get_vocabulary_item('eventoccurstatus', 'eocstat:eos1'))
+            self.assertIsNone(get_vocabulary_item('newscoveragestatus', 'ncostat:notint'))
+
+            self.assertEqual('Cancelled', get_vocabulary_item('eventoccurstatus', 'eocstat:eos6')['name'])
+            self.assertIsNone(get_vocabulary_item('eventoccurstatus', 'eocstat:eos6', active_only=True))
+
+    def test_get_vocabulary_item_returns_copies(self):
+        with self.app.app_context():
+            item = get_vocabulary_item('eventoccurstatus', 'eocstat:eos5')
+            item.pop('is_active')
+            self.assertTrue(get_vocabulary_item('eventoccurstatus', 'eocstat:eos5')['is_active'])
+
+    def test_vocabularies_cache_invalidation(self):
+        with self.app.app_context():
+            item = get_vocabulary_item('eventoccurstatus', 'eocstat:eos5')
+            self.assertEqual('Planned, occurs certainly', item['name'])
+
+            vocabulary = self.app.data.find_one('vocabularies', req=None, _id='eventoccurstatus')
+            items = vocabulary['items']
+            items[0]['name'] = 'Planned'
+            self.app.data.update('vocabularies', 'eventoccurstatus', {'items': items}, vocabulary)
+
+            # cached until the vocabularies are updated through the API
+            item = get_vocabulary_item('eventoccurstatus', 'eocstat:eos5')
+            self.assertEqual('Planned, occurs certainly', item['name'])
+            clear_vocabularies_cache({'items': items}, vocabulary)
+            self.assertEqual('Planned', get_vocabulary_item('eventoccurstatus', 'eocstat:eos5')['name'])
@@ -19,11 +19,11 @@ from superdesk.metadata.utils import generate_guid, item_url
 from superdesk.metadata.item import GUID_NEWSML, metadata_schema
 from superdesk.resource import not_analyzed
 from superdesk import get_resource_service
-from superdesk.notification import push_notification
 from apps.archive.common import set_original_creator, get_user
 from eve.utils import config
 from superdesk.utc import utcnow
 from superdesk.activity import add_activity, ACTIVITY_UPDATE
+from .notifications import push_planning_notification
 
 logger = logging.getLogger(__name__)
 
@@ -48,28 +48,35 @@ class CoverageService(superdesk.Service):
         self._set_assignment_information(updates)
 
     @staticmethod
-    def notify(event, doc, user):
-        push_notification(
+    def notify(event, doc, user, planning=None, updates=None):
+        push_planning_notification(
             event,
+            'coverage',
+            doc,
+            updates=updates,
+            agendas=(planning or {}).get('agendas') or [],
             item=str(doc[config.ID_FIELD]),
             user=str(user),
             planning=str(doc.get('planning_item', ''))
         )
 
     def on_created(self, docs):
+        plannings = get_resource_service('planning').sync_coverages(docs)
         for doc in docs:
-            CoverageService.notify('coverage:created', doc, doc.get('original_creator', ''))
-        get_resource_service('planning').sync_coverages(docs)
+            CoverageService.notify('coverage:created', doc, doc.get('original_creator', ''),
+                                   plannings.get(doc.get('planning_item')))
 
     def on_updated(self, updates, original):
-        CoverageService.notify('coverage:updated', original, updates.get('version_creator', ''))
         doc = deepcopy(original)
         doc.update(updates)
-        get_resource_service('planning').sync_coverages([doc])
+        plannings = get_resource_service('planning').sync_coverages([doc])
+        CoverageService.notify('coverage:updated', doc, updates.get('version_creator', ''),
+                               plannings.get(doc.get('planning_item')), updates)
 
     def on_deleted(self, doc):
-        CoverageService.notify('coverage:deleted', doc, doc.get('version_creator', ''))
-        get_resource_service('planning').sync_coverages([doc])
+        plannings = get_resource_service('planning').sync_coverages([doc])
+        CoverageService.notify('coverage:deleted', doc, doc.get('version_creator', ''),
+                               plannings.get(doc.get('planning_item')))
 
     def _set_assignment_information(self, doc):
         if doc.get('planning') and doc['planning'].get('assigned_to'):
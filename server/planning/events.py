@@ -17,19 +17,23 @@ from superdesk.resource import not_analyzed
 from superdesk.errors import SuperdeskApiError
 from superdesk.metadata.utils import generate_guid
 from superdesk.metadata.item import GUID_NEWSML, ITEM_TYPE, metadata_schema
-from superdesk.notification import push_notification
 from apps.archive.common import set_original_creator, get_user
 from superdesk.users.services import current_user_has_privilege
-from superdesk.utc import utcnow
+from superdesk.utc import utcnow, get_date
+from superdesk.utils import ListCursor
+from .notifications import push_notification, push_planning_notification
 from .common import UPDATE_SINGLE, UPDATE_FUTURE, UPDATE_ALL, UPDATE_METHODS, \
-    get_max_recurrent_events, WORKFLOW_STATE_SCHEMA, PUBLISHED_STATE_SCHEMA
+    get_max_recurrent_events, is_virtual_recurrence_enabled, get_recurring_events_horizon, get_timezone, \
+    WORKFLOW_STATE_SCHEMA, PUBLISHED_STATE_SCHEMA
 from dateutil.rrule import rrule, YEARLY, MONTHLY, WEEKLY, DAILY, MO, TU, WE, TH, FR, SA, SU
 from eve.defaults import resolve_default_values
 from eve.methods.common import resolve_document_etag
 from eve.utils import config, ParsedRequest
 from flask import current_app as app, json
+from bisect import bisect_right
 import itertools
 import copy
+import datetime
 import pytz
 import re
 from deepdiff import DeepDiff
@@ -40,6 +44,12 @@ logger = logging.getLogger(__name__)
 FREQUENCIES = {'DAILY': DAILY, 'WEEKLY': WEEKLY, 'MONTHLY': MONTHLY, 'YEARLY': YEARLY}
 DAYS = {'MO': MO, 'TU': TU, 'WE': WE, 'TH': TH, 'FR': FR, 'SA': SA, 'SU': SU}
 
+# Suffix appended to the series master _id to build the _id of a virtual occurrence
+VIRTUAL_OCCURRENCE_FORMAT = '%Y%m%dT%H%M%S'
+
+# Maximum number of events of a date window, virtual occurrences included, larger windows are rejected
+VIRTUAL_WINDOW_MAX_EVENTS = 10000
+
 organizer_roles = {
     'eorol:artAgent': 'Artistic agent',
     'eorol:general': 'General organiser',
@@ -49,6 +59,17 @@ organizer_roles = {
 }
 
 
+class EventsPageCursor(ListCursor):
+    """Page of events, counting all the events of the query"""
+
+    def __init__(self, docs, total):
+        super().__init__(docs)
+        self.total = total
+
+    def count(self, **kwargs):
+        return self.total
+
+
 class EventsService(superdesk.Service):
     """Service class for the events model."""
 
@@ -65,15 +86,249 @@ class EventsService(superdesk.Service):
         res = self.backend.update_in_mongo(self.datasource, id, document, original)
         return res
 
+    def get(self, req, lookup):
+        """Search events, expanding virtual recurring series for the requested date window
+
+        If virtual recurring events are enabled and the request provides both `start_date` and
+        `end_date` arguments, the search is restricted to events overlapping that window plus
+        the masters of virtual series starting before its end. Each master is then replaced
+        by its occurrences within the window that have not been materialised yet.
+
+        The occurrences are expanded before paginating, so the requested page and the total
+        count include them. Windows with more than `VIRTUAL_WINDOW_MAX_EVENTS` events are rejected.
+        """
+        window = self._get_virtual_window(req)
+        if window is None:
+            return super().get(req, lookup)
+
+        window_start, window_end = window
+        offset, size = self._set_virtual_window_query(req, window_start, window_end)
+
+        cursor = super().get(req, lookup)
+        if cursor.count() > VIRTUAL_WINDOW_MAX_EVENTS:
+            raise_window_too_large()
+
+        docs = list(cursor)
+        masters = [doc for doc in docs if doc.get('virtual_recurrence')]
+        if masters:
+            materialised_ids = self._get_materialised_occurrence_ids(masters)
+            events = []
+            for doc in docs:
+                if doc.get('virtual_recurrence'):
+                    events.extend(generate_virtual_occurrences(doc, window_start, window_end, materialised_ids))
+                else:
+                    events.append(doc)
+
+                if len(events) > VIRTUAL_WINDOW_MAX_EVENTS:
+                    raise_window_too_large()
+
+            events.sort(key=lambda event: _to_naive_utc(event['dates']['start']))
+        else:
+            events = docs
+
+        return EventsPageCursor(events[offset:offset + size] if size else events[offset:], len(events))
+
+    def find_one(self, req, **lookup):
+        """Find an event, falling back to the virtual occurrence of a recurring series"""
+        item = super().find_one(req, **lookup)
+        if item is None and list(lookup.keys()) == [config.ID_FIELD] and is_virtual_recurrence_enabled():
+            item = self.get_virtual_occurrence(lookup[config.ID_FIELD])
+        return item
+
+    def get_virtual_occurrence(self, occurrence_id):
+        """Build the virtual occurrence for the provided _id
+
+        :param str occurrence_id: _id of the occurrence, in the form `<master _id>:<start>`
+        :return dict: the occurrence, or None if it is not part of a virtual series
+        """
+        master_id, start = parse_virtual_occurrence_id(occurrence_id)
+        if master_id is None:
+            return None
+
+        master = super().find_one(req=None, _id=master_id)
+        if not master or not master.get('virtual_recurrence'):
+            return None
+
+        for occurrence in generate_virtual_occurrences(master, start, start):
+            if occurrence[config.ID_FIELD] == occurrence_id:
+                return occurrence
+
+        return None
+
+    def materialise_occurrence(self, occurrence):
+        """Store a virtual occurrence as a real event document
+
+        This is required before an occurrence is edited, locked or linked to a Planning item.
+
+        :param dict occurrence: virtual occurrence as returned by `get_virtual_occurrence`
+        :return dict: the stored event
+        """
+        if not occurrence.get('_virtual'):
+            return occurrence
+
+        # stored meanwhile, i.e. when the series was stored by a series operation
+        stored = super().find_one(req=None, _id=occurrence[config.ID_FIELD])
+        if stored:
+            return stored
+
+        event = {key: value for key, value in occurrence.items() if not key.startswith('_')}
+        event[config.ID_FIELD] = occurrence[config.ID_FIELD]
+        # tells on_create not to expand the recurring rule of the occurrence again
+        event['_virtual'] = True
+
+        self.post([event])
+        app.on_inserted_events([event])
+
+        return super().find_one(req=None, _id=event[config.ID_FIELD])
+
+    def store_virtual_series(self, recurrence_id):
+        """Store the occurrences of a virtual series, turning it into a regular series
+
+        The series operations (update, spike, cancel, reschedule...) work on the stored events of
+        a series, so they store a virtual one first. The occurrences are generated up to the
+        recurring events horizon, like for a series created with virtual occurrences disabled,
+        and the master becomes the first event of the series.
+
+        :param str recurrence_id: recurrence_id of the series
+        """
+        master = super().find_one(req=None, recurrence_id=recurrence_id, virtual_recurrence=True)
+        if not master:
+            return
+
+        materialised_ids = self._get_materialised_occurrence_ids([master])
+        events = []
+        for occurrence in generate_series_occurrences(master, until=get_recurring_horizon_date()):
+            if occurrence[config.ID_FIELD] in materialised_ids:
+                continue
+            event = {key: value for key, value in occurrence.items() if not key.startswith('_')}
+            event[config.ID_FIELD] = occurrence[config.ID_FIELD]
+            event['_virtual'] = True
+            events.append(event)
+
+        if events:
+            self.post(events)
+            app.on_inserted_events(events)
+
+        self.system_update(master[config.ID_FIELD], {'virtual_recurrence': False}, master)
+
+    def _get_virtual_window(self, req):
+        if req is None or not req.args or not is_virtual_recurrence_enabled():
+            return None
+
+        start_date = req.args.get('start_date')
+        end_date = req.args.get('end_date')
+        if not start_date or not end_date:
+            return None
+
+        try:
+            return _to_naive_utc(get_date(start_date)), _to_naive_utc(get_date(end_date))
+        except Exception:
+            raise SuperdeskApiError.badRequestError('Invalid start_date or end_date')
+
+    def _set_virtual_window_query(self, req, window_start, window_end):
+        """Restrict the elastic query to events that can occur within the window
+
+        The query returns all the events of the window, to be paginated once the virtual series
+        are expanded.
+
+        :return tuple: offset and size of the requested page, size being 0 if not limited
+        """
+        args = dict(req.args.items())
+        source = json.loads(args['source']) if args.get('source') else {}
+        window_query = {
+            'bool': {
+                'must': {'range': {'dates.start': {'lte': window_end.isoformat()}}},
+                'should': [
+                    {'range': {'dates.end': {'gte': window_start.isoformat()}}},
+                    {'term': {'virtual_recurrence': True}}
+                ],
+                'minimum_should_match': 1
+            }
+        }
+
+        source['query'] = {
+            'bool': {
+                'must': source.get('query', {'match_all': {}}),
+                'filter': window_query
+            }
+        }
+
+        max_results = getattr(req, 'max_results', 0) or 0
+        page = getattr(req, 'page', 1) or 1
+        offset = int(source.pop('from', (page - 1) * max_results))
+        size = int(source.pop('size', max_results))
+        source['from'] = 0
+        source['size'] = VIRTUAL_WINDOW_MAX_EVENTS
+
+        args['source'] = json.dumps(source)
+        req.args = args
+        return offset, size
+
+    def _get_materialised_occurrence_ids(self, masters):
+        recurrence_ids = [master['recurrence_id'] for master in masters]
+        events = self.get_from_mongo(req=None, lookup={
+            'recurrence_id': {'$in': recurrence_ids},
+            'virtual_recurrence': {'$ne': True}
+        })
+        return set([event[config.ID_FIELD] for event in events])
+
     def on_fetched(self, docs):
+        self._set_next_occurrences(docs['_items'])
         for doc in docs['_items']:
             self._set_has_planning_flag(doc)
 
+    def _set_next_occurrences(self, docs):
+        recurrence_ids = set([doc['recurrence_id'] for doc in docs if doc.get('recurrence_id')])
+        if not recurrence_ids:
+            return
+
+        next_occurrences = self.get_series_next_occurrences(list(recurrence_ids))
+        for doc in docs:
+            if doc.get('recurrence_id'):
+                doc['_next_occurrence'] = next_occurrences.get(doc['recurrence_id'])
+
+    def get_series_next_occurrences(self, recurrence_ids, after=None):
+        """Get the next occurrence of a batch of series
+
+        Stored series are resolved with a single aggregation, while virtual series
+        are computed from the recurring rules of their master.
+
+        :param list recurrence_ids: recurrence_id of the series
+        :param datetime after: date to look from, defaults to now
+        :return dict: start of the next occurrence keyed by recurrence_id
+        """
+        if after is None:
+            after = utcnow()
+
+        pipeline = [
+            {'$match': {
+                'recurrence_id': {'$in': recurrence_ids},
+                'dates.start': {'$gte': after},
+                'virtual_recurrence': {'$ne': True}
+            }},
+            {'$group': {'_id': '$recurrence_id', 'next_occurrence': {'$min': '$dates.start'}}}
+        ]
+        next_occurrences = {
+            series['_id']: series['next_occurrence']
+            for series in app.data.get_mongo_collection(self.datasource).aggregate(pipeline)
+        }
+
+        missing_ids = [recurrence_id for recurrence_id in recurrence_ids if recurrence_id not in next_occurrences]
+        if missing_ids:
+            masters = self.get_from_mongo(req=None, lookup={
+                'recurrence_id': {'$in': missing_ids},
+                'virtual_recurrence': True
+            })
+            next_occurrences.update(get_next_occurrences(masters, after))
+
+        return next_occurrences
+
     def on_fetched_item(self, doc):
         self._set_has_planning_flag(doc)
 
     def _set_has_planning_flag(self, doc):
-        doc['has_planning'] = self.has_planning_items(doc)
+        # Virtual occurrences are materialised before they can be linked to a Planning item
+        doc['has_planning'] = not doc.get('_virtual') and self.has_planning_items(doc)
 
     def has_planning_items(self, doc):
         plannings = list(get_resource_service('planning').find(where={
@@ -111,9 +366,18 @@ class EventsService(superdesk.Service):
             if 'update_method' in event:
                 del event['update_method']
 
+            # materialised virtual occurrence, already part of its series
+            if event.pop('_virtual', False):
+                continue
+
             # generates events based on recurring rules
             if event['dates'].get('recurring_rule', None):
-                generated_events.extend(generate_recurring_events(event))
+                if is_virtual_recurrence_enabled():
+                    # keep the event as the master of the series, occurrences are expanded on read
+                    set_virtual_recurrence_master(event)
+                    continue
+
+                generated_events.extend(generate_recurring_events(event, until=get_recurring_horizon_date()))
                 # remove the event that contains the recurring rule. We don't need it anymore
                 docs.remove(event)
         if generated_events:
@@ -142,11 +406,31 @@ class EventsService(superdesk.Service):
                 continue
 
             notifications_sent.append(event_id)
-            push_notification(
-                event_type,
-                item=event_id,
-                user=user_id
-            )
+            if doc.get('recurrence_id'):
+                push_notification(
+                    event_type,
+                    item=event_id,
+                    user=user_id
+                )
+            else:
+                push_planning_notification(
+                    event_type,
+                    'events',
+                    doc,
+                    item=event_id,
+                    user=user_id
+                )
+
+    def insert_occurrences(self, events):
+        """Store occurrences generated for an existing series of recurring events
+
+        Unlike `create`, the recurring rules of the events are not expanded again.
+        """
+        for event in events:
+            resolve_default_values(event, app.config['DOMAIN'][self.datasource]['defaults'])
+        self.backend.create(self.datasource, events)
+        app.on_inserted_events(events)
+        self.on_created(events)
 
     def can_edit(self, item, user_id):
         # Check privileges
@@ -155,6 +439,9 @@ class EventsService(superdesk.Service):
         return True, ''
 
     def update(self, id, updates, original):
+        if original.get('_virtual'):
+            original = self.materialise_occurrence(original)
+
         item = self.backend.update(self.datasource, id, updates, original)
         return item
 
@@ -216,8 +503,13 @@ class EventsService(superdesk.Service):
                 recurrence_id=str(generated_events[0]['recurrence_id'])
             )
         else:
-            push_notification(
+            doc = deepcopy(original)
+            doc.update(updates)
+            push_planning_notification(
                 'events:updated',
+                'events',
+                doc,
+                updates=updates,
                 item=str(original[config.ID_FIELD]),
                 user=str(updates.get('version_creator', ''))
             )
@@ -437,6 +729,7 @@ class EventsService(superdesk.Service):
         future = []
 
         selected_start = selected.get('dates', {}).get('start', utcnow())
+        self.store_virtual_series(selected['recurrence_id'])
 
         req = ParsedRequest()
         req.sort = '[("dates.start", 1)]'
@@ -507,6 +800,13 @@ events_schema = {
         'nullable': True
     },
 
+    # Set on the master of a series whose occurrences are expanded on read
+    # instead of being stored (see VIRTUAL_RECURRENT_EVENTS)
+    'virtual_recurrence': {
+        'type': 'boolean',
+        'nullable': True
+    },
+
     # Audit Information
     'original_creator': metadata_schema['original_creator'],
     'version_creator': metadata_schema['version_creator'],
@@ -525,6 +825,10 @@ events_schema = {
     'event_lastmodified': {
         'type': 'datetime'
     },
+    'event_sequence': {
+        'type': 'integer',
+        'nullable': True
+    },
     # Event Details
     # NewsML-G2 Event properties See IPTC-G2-Implementation_Guide 15.2
     'name': {
@@ -791,6 +1095,11 @@ class EventsResource(superdesk.Resource):
     privileges = {'POST': 'planning_event_management',
                   'PATCH': 'planning_event_management'}
 
+    mongo_indexes = {
+        'recurrence_id_1': ([('recurrence_id', 1)], {'background': True}),
+        'original_source_1': ([('original_source', 1)], {'background': True}),
+    }
+
 
 def generate_recurring_dates(start, frequency, interval=1, endRepeatMode='count',
                              until=None, byday=None, count=5, tz=None):
@@ -806,6 +1115,131 @@ def generate_recurring_dates(start, frequency, interval=1, endRepeatMode='count'
     :param count int: number of occurrences of the rule
     :return list: list of datetime
 
+    """
+    dates = get_recurring_rule(start, frequency, interval=interval, until=until, byday=byday, count=count, tz=tz)
+
+    # if a timezone has been applied, returns UTC
+    if tz:
+        return local_dates_to_utc(dates, tz)
+    else:
+        return (date for date in dates)
+
+
+def get_recurring_dates_between(start, window_start, window_end, frequency, interval=1, endRepeatMode='count',
+                                until=None, byday=None, count=5, tz=None):
+    """Returns the dates of the recurring rule between the naive UTC window_start and window_end
+
+    Unlike iterating over `generate_recurring_dates`, the dates before the window are not built.
+    With a timezone the window is widened by a day, to be applied in local time, so the dates
+    returned must still be filtered on the window.
+
+    :return iterator: iterator of datetime
+    """
+    if endRepeatMode == 'until':
+        count = None
+    elif endRepeatMode == 'count':
+        until = None
+
+    rule = get_recurring_rule(start, frequency, interval=interval, until=until, byday=byday, count=count, tz=tz)
+
+    if tz:
+        margin = datetime.timedelta(days=1)
+        local_start = pytz.UTC.localize(window_start).astimezone(tz).replace(tzinfo=None) - margin
+        local_end = pytz.UTC.localize(window_end).astimezone(tz).replace(tzinfo=None) + margin
+        return local_dates_to_utc(rule.between(local_start, local_end, inc=True), tz)
+
+    if start.tzinfo:
+        window_start = pytz.UTC.localize(window_start)
+        window_end = pytz.UTC.localize(window_end)
+    return iter(rule.between(window_start, window_end, inc=True))
+
+
+def local_dates_to_utc(dates, tz):
+    """Convert naive dates in the local time of the timezone to naive UTC dates
+
+    Instead of localizing every date, the UTC offset is computed once for each
+    interval between two DST transitions and applied to all the dates within it.
+    Dates close to a transition (ambiguous or non-existent) are localized one by one.
+
+    :param iterable dates: naive local dates, in ascending order
+    :param tz: pytz timezone
+    :return generator: generator of naive UTC dates
+    """
+    offset, interval_start, interval_end = None, None, None
+    for date in dates:
+        if offset is None or not interval_start <= date < interval_end:
+            offset, interval_start, interval_end = _get_utc_offset_interval(date, tz)
+
+        if offset is None:
+            yield tz.localize(date).astimezone(pytz.UTC).replace(tzinfo=None)
+        else:
+            yield date - offset
+
+
+def _get_utc_offset_interval(date, tz):
+    """Get the UTC offset of a local date and the local time interval sharing that offset
+
+    :return tuple: (offset, interval start, interval end), or (None, None, None)
+        if the date is too close to a DST transition
+    """
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        # fixed offset timezone
+        return tz.localize(date).utcoffset(), datetime.datetime.min, datetime.datetime.max
+
+    utc_date = tz.localize(date).astimezone(pytz.UTC).replace(tzinfo=None)
+    index = max(bisect_right(transitions, utc_date) - 1, 0)
+    transition_info = tz._transition_info
+    offset = transition_info[index][0]
+
+    # around a transition, local times can exist twice or not at all,
+    # so the interval excludes them on both sides
+    if index == 0:
+        interval_start = datetime.datetime.min
+    else:
+        interval_start = transitions[index] + max(offset, transition_info[index - 1][0])
+
+    if index + 1 == len(transitions):
+        interval_end = datetime.datetime.max
+    else:
+        interval_end = transitions[index + 1] + min(offset, transition_info[index + 1][0])
+
+    if not interval_start <= date < interval_end:
+        return None, None, None
+
+    return offset, interval_start, interval_end
+
+
+def get_next_recurring_date(after, start, frequency, interval=1, endRepeatMode='count',
+                            until=None, byday=None, count=5, tz=None, inc=True):
+    """Returns the first date of the recurring rules after the provided date
+
+    Unlike `generate_recurring_dates`, the dates before `after` are not yielded one by one
+
+    :param after datetime: date to look from
+    :param inc bool: if True, `after` is returned if it is an occurrence itself
+    :return datetime: the next date (in UTC if a timezone is given), or None if the rule has ended
+    """
+    dates = get_recurring_rule(start, frequency, interval=interval, until=until, byday=byday, count=count, tz=tz)
+
+    if tz:
+        after = _to_naive_utc(after)
+        after = pytz.UTC.localize(after).astimezone(tz).replace(tzinfo=None)
+    elif start.tzinfo and not after.tzinfo:
+        after = pytz.UTC.localize(after)
+    elif not start.tzinfo:
+        after = _to_naive_utc(after)
+
+    date = dates.after(after, inc=inc)
+    if date is not None and tz:
+        return tz.localize(date).astimezone(pytz.UTC).replace(tzinfo=None)
+    return date
+
+
+def get_recurring_rule(start, frequency, interval=1, until=None, byday=None, count=5, tz=None):
+    """Compile the recurring rules into a `dateutil.rrule.rrule`
+
+    If tz is given, the rule works on naive dates in the local time of the timezone
     """
     # if tz is given, respect the timzone by starting from the local time
     # NOTE: rrule uses only naive datetime
@@ -841,7 +1275,7 @@ def generate_recurring_dates(start, frequency, interval=1, endRepeatMode='count'
         # byday uses DAYS constants
         byweekday = byday and [DAYS.get(d) for d in byday.split()] or None
     # TODO: use dateutil.rrule.rruleset to incude ex_date and ex_rule
-    dates = rrule(
+    return rrule(
         FREQUENCIES.get(frequency),
         dtstart=start,
         until=until,
@@ -849,11 +1283,6 @@ def generate_recurring_dates(start, frequency, interval=1, endRepeatMode='count'
         count=count,
         interval=interval,
     )
-    # if a timezone has been applied, returns UTC
-    if tz:
-        return (tz.localize(dt).astimezone(pytz.UTC).replace(tzinfo=None) for dt in dates)
-    else:
-        return (date for date in dates)
 
 
 def setRecurringMode(event):
@@ -869,7 +1298,22 @@ def overwrite_event_expiry_date(event):
         event['expiry'] = event['dates']['end']
 
 
-def generate_recurring_events(event):
+def get_recurring_horizon_date():
+    """Date up to which recurring series are generated, None if series are generated in full"""
+    horizon_weeks = get_recurring_events_horizon()
+    if not horizon_weeks:
+        return None
+    return utcnow() + datetime.timedelta(weeks=horizon_weeks)
+
+
+def generate_recurring_events(event, until=None):
+    """Generate the events of a series based on the recurring rules of the provided event
+
+    :param dict event: the first event of the series
+    :param datetime until: if provided, occurrences starting after this date are not generated.
+        The first occurrence is always generated.
+    :return list: list of generated events
+    """
     generated_events = []
     setRecurringMode(event)
 
@@ -878,21 +1322,22 @@ def generate_recurring_events(event):
 
     # compute the difference between start and end in the original event
     time_delta = event['dates']['end'] - event['dates']['start']
+
+    dates = generate_recurring_dates(
+        start=event['dates']['start'],
+        tz=get_timezone(event['dates'].get('tz')),
+        **event['dates']['recurring_rule']
+    )
+
+    if until is not None:
+        until = max(_to_naive_utc(until), _to_naive_utc(event['dates']['start']))
+        dates = itertools.takewhile(lambda date: _to_naive_utc(date) <= until, dates)
+
     # for all the dates based on the recurring rules:
-    for date in itertools.islice(generate_recurring_dates(
-            start=event['dates']['start'],
-            tz=event['dates'].get('tz') and pytz.timezone(event['dates']['tz'] or None),
-            **event['dates']['recurring_rule']
-    ), 0, get_max_recurrent_events()):  # set a limit to prevent too many events to be created
+    # set a limit to prevent too many events to be created
+    for date in itertools.islice(dates, 0, get_max_recurrent_events()):
         # create event with the new dates
-        new_event = copy.deepcopy(event)
-
-        # Remove fields not required by the new events
-        for key in list(new_event.keys()):
-            if key.startswith('_'):
-                new_event.pop(key)
-            elif key.startswith('lock_'):
-                new_event.pop(key)
+        new_event = _get_occurrence_template(event)
 
         new_event['dates']['start'] = date
         new_event['dates']['end'] = date + time_delta
@@ -911,10 +1356,156 @@ def generate_recurring_events(event):
 
 
 def set_next_occurrence(updates):
-    new_dates = [date for date in itertools.islice(generate_recurring_dates(
+    next_date = get_next_recurring_date(
+        after=updates['dates']['start'],
         start=updates['dates']['start'],
-        tz=updates['dates'].get('tz') and pytz.timezone(updates['dates']['tz'] or None),
-        **updates['dates']['recurring_rule']), 0, 10)]
+        tz=get_timezone(updates['dates'].get('tz')),
+        **updates['dates']['recurring_rule'])
+    if next_date is None:
+        return
+
     time_delta = updates['dates']['end'] - updates['dates']['start']
-    updates['dates']['start'] = new_dates[0]
-    updates['dates']['end'] = new_dates[0] + time_delta
+    updates['dates']['start'] = next_date
+    updates['dates']['end'] = next_date + time_delta
+
+
+def get_next_occurrences(masters, after):
+    """Compute the next occurrence of each series from the recurring rules of their master
+
+    :param list masters: master events of the series
+    :param datetime after: date to look from
+    :return dict: next occurrence (naive UTC) keyed by recurrence_id
+    """
+    next_dates = {}
+    for master in masters:
+        next_date = get_next_recurring_date(
+            after=after,
+            start=master['dates']['start'],
+            tz=get_timezone(master['dates'].get('tz')),
+            **master['dates']['recurring_rule'])
+        next_dates[master['recurrence_id']] = next_date and _to_naive_utc(next_date)
+
+    return next_dates
+
+
+def set_virtual_recurrence_master(event):
+    """Prepare an event with a recurring rule to be stored as the master of a virtual series"""
+    setRecurringMode(event)
+    event['recurrence_id'] = event.get('recurrence_id') or generate_guid(type=GUID_NEWSML)
+    event['virtual_recurrence'] = True
+
+
+def get_virtual_occurrence_id(master_id, start):
+    return '{}:{}'.format(master_id, _to_naive_utc(start).strftime(VIRTUAL_OCCURRENCE_FORMAT))
+
+
+def parse_virtual_occurrence_id(occurrence_id):
+    """Split the _id of a virtual occurrence into the master _id and the occurrence start
+
+    :return tuple: (master _id, start) or (None, None) if the _id is not a virtual occurrence one
+    """
+    master_id, _, start = str(occurrence_id).rpartition(':')
+    if not master_id:
+        return None, None
+
+    try:
+        return master_id, datetime.datetime.strptime(start, VIRTUAL_OCCURRENCE_FORMAT)
+    except ValueError:
+        return None, None
+
+
+def generate_virtual_occurrences(master, window_start, window_end, exclude_ids=None):
+    """Expand the recurring rule of a virtual series master into occurrences
+
+    Only the occurrences overlapping the window are returned, skipping those
+    whose _id is in `exclude_ids` (i.e. the ones already materialised).
+
+    :param dict master: master event of the series
+    :param datetime window_start: start of the window (naive UTC)
+    :param datetime window_end: end of the window (naive UTC)
+    :param set exclude_ids: _ids of occurrences not to generate
+    :return generator: generator of virtual occurrences
+    """
+    exclude_ids = exclude_ids or set()
+    time_delta = master['dates']['end'] - master['dates']['start']
+
+    dates = get_recurring_dates_between(
+        start=master['dates']['start'],
+        window_start=window_start - time_delta,
+        window_end=window_end,
+        tz=get_timezone(master['dates'].get('tz')),
+        **master['dates']['recurring_rule']
+    )
+
+    for date in dates:
+        date = _to_naive_utc(date)
+        if date > window_end or date + time_delta < window_start:
+            continue
+
+        occurrence = _get_virtual_occurrence(master, date, time_delta)
+        if occurrence[config.ID_FIELD] not in exclude_ids:
+            yield occurrence
+
+
+def generate_series_occurrences(master, until=None):
+    """Generate the occurrences of a virtual series to be stored, the master being the first one
+
+    :param dict master: master event of the series
+    :param datetime until: if provided, occurrences starting after this date are not generated
+    :return generator: generator of occurrences
+    """
+    time_delta = master['dates']['end'] - master['dates']['start']
+    master_start = _to_naive_utc(master['dates']['start'])
+
+    dates = generate_recurring_dates(
+        start=master['dates']['start'],
+        tz=get_timezone(master['dates'].get('tz')),
+        **master['dates']['recurring_rule']
+    )
+    if until is not None:
+        until = _to_naive_utc(until)
+        dates = itertools.takewhile(lambda date: _to_naive_utc(date) <= until, dates)
+
+    for date in itertools.islice(dates, 0, get_max_recurrent_events()):
+        date = _to_naive_utc(date)
+        if date != master_start:
+            yield _get_virtual_occurrence(master, date, time_delta)
+
+
+def _get_virtual_occurrence(master, date, time_delta):
+    occurrence = _get_occurrence_template(master)
+    occurrence.pop('virtual_recurrence', None)
+    occurrence['dates']['start'] = pytz.UTC.localize(date)
+    occurrence['dates']['end'] = pytz.UTC.localize(date + time_delta)
+    occurrence['guid'] = occurrence[config.ID_FIELD] = get_virtual_occurrence_id(master[config.ID_FIELD], date)
+    occurrence['recurrence_id'] = master['recurrence_id']
+    overwrite_event_expiry_date(occurrence)
+
+    # the etag only depends on the master, so it stays the same until the occurrence is materialised
+    resolve_document_etag(occurrence, 'events')
+    occurrence['_virtual'] = True
+    return occurrence
+
+
+def raise_window_too_large():
+    raise SuperdeskApiError.badRequestError(
+        'More than {} events between start_date and end_date, use a smaller date range'.format(
+            VIRTUAL_WINDOW_MAX_EVENTS))
+
+
+def _get_occurrence_template(event):
+    """Copy an event, removing fields not required by the occurrences of its series"""
+    new_event = copy.deepcopy(event)
+    for key in list(new_event.keys()):
+        if key.startswith('_'):
+            new_event.pop(key)
+        elif key.startswith('lock_'):
+            new_event.pop(key)
+
+    return new_event
+
+
+def _to_naive_utc(date):
+    if date.tzinfo:
+        return date.astimezone(pytz.UTC).replace(tzinfo=None)
+    return date
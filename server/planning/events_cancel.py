@@ -10,11 +10,11 @@
 
 from superdesk import get_resource_service
 from superdesk.services import BaseService
-from superdesk.notification import push_notification
+from .notifications import push_notification
 from .item_lock import LOCK_USER, LOCK_SESSION
 from eve.utils import config
 from apps.archive.common import get_user, get_auth
-from .common import UPDATE_SINGLE, UPDATE_FUTURE, WORKFLOW_STATE
+from .common import UPDATE_SINGLE, UPDATE_FUTURE, WORKFLOW_STATE, get_vocabulary_item
 from copy import deepcopy
 from .events import EventsResource, events_schema
 from flask import current_app as app
@@ -44,13 +44,7 @@ class EventsCancelService(BaseService):
         if 'skip_on_update' in updates:
             del updates['skip_on_update']
         else:
-            eocstat_map = get_resource_service('vocabularies').find_one(
-                req=None,
-                _id='eventoccurstatus'
-            )
-
-            occur_cancel_state = [x for x in eocstat_map.get('items', []) if
-                                  x['qcode'] == 'eocstat:eos6'][0]
+            occur_cancel_state = get_vocabulary_item('eventoccurstatus', 'eocstat:eos6')
             occur_cancel_state.pop('is_active', None)
 
             if not original.get('dates', {}).get('recurring_rule', None) or \
@@ -14,7 +14,7 @@ from superdesk.resource import Resource
 from superdesk.services import BaseService
 from superdesk.metadata.utils import item_url
 from flask import request, current_app as app
-from .common import ITEM_STATE, WORKFLOW_STATE
+from .common import ITEM_STATE, WORKFLOW_STATE, get_vocabulary_item
 from eve.utils import config
 
 
@@ -70,10 +70,9 @@ class EventsDuplicateService(BaseService):
         new_doc.pop('previous_recurrence_id', None)
         new_doc[ITEM_STATE] = WORKFLOW_STATE.IN_PROGRESS
         new_doc['duplicate_from'] = original[config.ID_FIELD]
-        eocstat_map = get_resource_service('vocabularies').find_one(req=None, _id='eventoccurstatus')
-        if eocstat_map:
-            new_doc['occur_status'] = [x for x in eocstat_map.get('items', []) if
-                                       x['qcode'] == 'eocstat:eos5' and x.get('is_active', True)][0]
-            new_doc['occur_status'].pop('is_active', None)
+        occur_status = get_vocabulary_item('eventoccurstatus', 'eocstat:eos5', active_only=True)
+        if occur_status:
+            occur_status.pop('is_active', None)
+            new_doc['occur_status'] = occur_status
 
         return new_doc
@@ -35,6 +35,19 @@ class EventsHistoryService(HistoryService):
         self.delete(lookup=lookup)
 
     def _save_history(self, event, update, operation):
+        self.post([self._get_history(event, update, operation)])
+
+    def _save_history_batch(self, events, updates, operation):
+        """Save the history of several events at once
+
+        :param list events: the events
+        :param list updates: the updates of each event
+        :param str operation: history operation
+        """
+        if events:
+            self.post([self._get_history(event, update, operation) for event, update in zip(events, updates)])
+
+    def _get_history(self, event, update, operation):
         history = {
             'event_id': event[config.ID_FIELD],
             'user_id': self.get_user_id(),
@@ -47,4 +60,4 @@ class EventsHistoryService(HistoryService):
                 history['operation'] = 'publish'
             elif 'canceled' == update.get('state', ''):
                 history['operation'] = 'unpublish'
-        self.post([history])
+        return history
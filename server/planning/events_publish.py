@@ -1,14 +1,21 @@
 
-from flask import abort
+from copy import deepcopy
+from flask import abort, current_app as app
+from eve.methods.common import resolve_document_etag
 from eve.utils import config
+from pymongo import UpdateOne
 
 from superdesk import get_resource_service
+from superdesk.errors import SuperdeskApiError
 from superdesk.resource import Resource
 from superdesk.services import BaseService
+from superdesk.utc import utcnow
+from apps.archive.common import get_user
 from apps.publish.enqueue import get_enqueue_service
 
 from .events import EventsResource
 from .common import WORKFLOW_STATE, PUBLISHED_STATE, published_state
+from .notifications import push_notification, push_planning_notification
 
 
 class EventsPublishResource(EventsResource):
@@ -56,3 +63,191 @@ class EventsPublishService(BaseService):
         if event.get('pubstatus') == PUBLISHED_STATE.CANCELLED:
             return WORKFLOW_STATE.KILLED
         return WORKFLOW_STATE.PUBLISHED
+
+
+class EventsPublishBatchResource(EventsResource):
+    schema = {
+        'events': {
+            'type': 'list',
+            'required': True,
+            'minlength': 1,
+            'schema': {
+                'type': 'dict',
+                'schema': {
+                    'event': {'type': 'string', 'required': True},
+                    'etag': {'type': 'string', 'required': True},
+                }
+            }
+        },
+        'pubstatus': {'type': 'string', 'required': True, 'allowed': published_state},
+    }
+
+    url = 'events/publish_batch'
+    resource_title = endpoint_name = 'events_publish_batch'
+    resource_methods = ['POST']
+    item_methods = []
+
+
+class EventsPublishBatchService(EventsPublishService):
+    """Publish several events at once, i.e. the occurrences of a recurring series
+
+    The etags and locks of all the events are validated before any of them is enqueued,
+    then their states are updated with one bulk write and their history saved in one insert.
+    """
+
+    def create(self, docs):
+        ids = []
+        for doc in docs:
+            events = self._get_events(doc['events'])
+            originals = deepcopy(events)
+            for event in events:
+                event['pubstatus'] = doc['pubstatus']
+                self.validate_event(event)
+            self.publish_events(events, originals)
+            ids.append(events[0][config.ID_FIELD])
+        return ids
+
+    def _get_events(self, items):
+        """Get the events, aborting with 412 if any of them is missing or was modified"""
+        ids = []
+        for item in items:
+            if item['event'] not in ids:
+                ids.append(item['event'])
+
+        events_service = get_resource_service('events')
+        events = {
+            event[config.ID_FIELD]: event
+            for event in events_service.get_from_mongo(req=None, lookup={
+                config.ID_FIELD: {'$in': ids}
+            })
+        }
+
+        # occurrences of virtual series, stored once validated
+        for event_id in ids:
+            if event_id not in events:
+                occurrence = events_service.get_virtual_occurrence(event_id)
+                if occurrence:
+                    events[event_id] = occurrence
+
+        for item in items:
+            event = events.get(item['event'])
+            if not event or event.get(config.ETAG) != item['etag']:
+                abort(412)
+        return [events_service.materialise_occurrence(events[event_id]) for event_id in ids]
+
+    def publish_events(self, events, originals):
+        user = get_user()
+        user_id = user.get(config.ID_FIELD) if user else None
+        updates = []
+        for event in events:
+            self._validate_lock(event, user_id)
+            update = {'state': self._get_publish_state(event), 'pubstatus': event['pubstatus']}
+            if user_id:
+                update['version_creator'] = user_id
+            updates.append(update)
+
+        self._update_events(originals, updates)
+
+        enqueued = 0
+        try:
+            enqueue_service = get_enqueue_service('publish')
+            for event in events:
+                event.setdefault(config.VERSION, 1)
+                event.setdefault('item_id', event['_id'])
+                enqueue_service.enqueue_item(event, 'event')
+                enqueued += 1
+        finally:
+            if enqueued < len(events):
+                # the events which couldn't be enqueued get their previous state back,
+                # those already enqueued are published
+                self._revert_events(originals[enqueued:], updates[enqueued:])
+
+            if enqueued:
+                get_resource_service('events_history')._save_history_batch(
+                    events[:enqueued], updates[:enqueued], 'publish')
+                for event, update in zip(events[:enqueued], updates[:enqueued]):
+                    self._notify_event_updated(event, update)
+
+    def _validate_lock(self, event, user_id):
+        """Same check as updating the event, it can't be locked by another user"""
+        lock_user = event.get('lock_user', None)
+        if lock_user and str(lock_user) != (str(user_id) if user_id else None):
+            raise SuperdeskApiError.forbiddenError('The item was locked by another user')
+
+    def _update_events(self, events, updates):
+        """Update the events in mongo with one bulk write, then reindex them in elastic
+
+        The events are only updated if they weren't modified since they were validated,
+        otherwise the changes already written are reverted and the request aborted with 412.
+        """
+        now = utcnow()
+        requests = []
+        for event, update in zip(events, updates):
+            update[config.LAST_UPDATED] = now
+            updated = deepcopy(event)
+            updated.update(update)
+            resolve_document_etag(updated, 'events')
+            update[config.ETAG] = updated[config.ETAG]
+            requests.append(UpdateOne(
+                {config.ID_FIELD: event[config.ID_FIELD], config.ETAG: event[config.ETAG]},
+                {'$set': update}
+            ))
+
+        collection = app.data.get_mongo_collection('events')
+        result = collection.bulk_write(requests, ordered=False)
+        if result.matched_count < len(requests):
+            self._revert_events(events, updates, reindex=False)
+            abort(412)
+
+        self._reindex_events(events)
+
+    def _revert_events(self, events, updates, reindex=True):
+        """Restore the fields of the events updated by `_update_events`, unless modified since"""
+        app.data.get_mongo_collection('events').bulk_write([
+            UpdateOne(
+                {config.ID_FIELD: event[config.ID_FIELD], config.ETAG: update[config.ETAG]},
+                self._get_revert(event, update)
+            )
+            for event, update in zip(events, updates)
+        ], ordered=False)
+
+        if reindex:
+            self._reindex_events(events)
+
+    def _reindex_events(self, events):
+        get_resource_service('events').backend.create_in_search('events', list(
+            app.data.get_mongo_collection('events').find({
+                config.ID_FIELD: {'$in': [event[config.ID_FIELD] for event in events]}
+            })
+        ))
+
+    def _get_revert(self, event, update):
+        revert = {}
+        for field in update:
+            if field in event:
+                revert.setdefault('$set', {})[field] = event[field]
+            else:
+                revert.setdefault('$unset', {})[field] = ''
+        return revert
+
+    def _notify_event_updated(self, event, update):
+        """Push the notification sent when the event is updated"""
+        if event.get('recurrence_id'):
+            push_notification(
+                'events:updated:recurring',
+                item=str(event[config.ID_FIELD]),
+                recurrence_id=str(event['recurrence_id']),
+                user=str(update.get('version_creator', ''))
+            )
+            return
+
+        doc = deepcopy(event)
+        doc.update(update)
+        push_planning_notification(
+            'events:updated',
+            'events',
+            doc,
+            updates=update,
+            item=str(event[config.ID_FIELD]),
+            user=str(update.get('version_creator', ''))
+        )
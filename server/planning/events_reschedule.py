@@ -10,18 +10,17 @@
 
 from superdesk import get_resource_service
 from superdesk.services import BaseService
-from superdesk.notification import push_notification
+from .notifications import push_notification
 from superdesk.metadata.utils import generate_guid
 from superdesk.metadata.item import GUID_NEWSML
 from .item_lock import LOCK_USER, LOCK_SESSION
 from eve.utils import config
 from apps.archive.common import get_user, get_auth, set_original_creator
-from .common import UPDATE_SINGLE, UPDATE_FUTURE, WORKFLOW_STATE, ITEM_STATE
+from .common import UPDATE_SINGLE, UPDATE_FUTURE, WORKFLOW_STATE, ITEM_STATE, get_timezone
 from copy import deepcopy
 from .events import EventsResource, events_schema, generate_recurring_dates, set_next_occurrence
 from flask import current_app as app
 from itertools import islice
-import pytz
 
 event_cancel_schema = deepcopy(events_schema)
 event_cancel_schema['reason'] = {
@@ -206,14 +205,14 @@ Event Rescheduled
         # Generate the dates for the new event series
         new_dates = [date for date in islice(generate_recurring_dates(
             start=new_start_date,
-            tz=updates['dates'].get('tz') and pytz.timezone(updates['dates']['tz'] or None),
+            tz=get_timezone(updates['dates'].get('tz')),
             **updated_rule
         ), 0, 200)]
 
         # Generate the dates for the original events
         original_dates = [date for date in islice(generate_recurring_dates(
             start=original_start_date,
-            tz=original['dates'].get('tz') and pytz.timezone(original['dates']['tz'] or None),
+            tz=get_timezone(original['dates'].get('tz')),
             **original_rule
         ), 0, 200)]
 
@@ -13,7 +13,7 @@ from superdesk.errors import SuperdeskApiError
 from .common import ITEM_EXPIRY, ITEM_STATE, set_item_expiry, UPDATE_SINGLE, UPDATE_FUTURE, \
     WORKFLOW_STATE
 from superdesk.services import BaseService
-from superdesk.notification import push_notification
+from .notifications import push_notification
 from apps.archive.common import get_user
 from superdesk import config, get_resource_service
 from superdesk.utc import utcnow
@@ -79,6 +79,7 @@ class EventsSpikeService(BaseService):
         if update_method == UPDATE_SINGLE:
             return
 
+        get_resource_service('events').store_virtual_series(recurrence_id)
         start = utcnow()
 
         if update_method == UPDATE_FUTURE:
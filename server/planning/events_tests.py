@@ -1,8 +1,16 @@
-from planning.events import generate_recurring_dates
+from planning.events import generate_recurring_dates, generate_virtual_occurrences, \
+    get_virtual_occurrence_id, parse_virtual_occurrence_id, get_next_recurring_date, set_next_occurrence, \
+    local_dates_to_utc, generate_series_occurrences
+from planning.common import get_timezone
+from eve.utils import ParsedRequest
+from flask import json
+from mock import patch
 import datetime
 import pytz
 from superdesk import get_resource_service
+from superdesk.errors import SuperdeskApiError
 from superdesk.utc import utcnow
+from superdesk.utils import ListCursor
 from planning.tests import TestCase
 
 
@@ -74,6 +82,114 @@ class EventTestCase(TestCase):
             datetime.datetime(2016, 12, 1, 23, 00),  # it's friday in Berlin
         ])
 
+    def test_recurring_dates_across_dst(self):
+        oslo = pytz.timezone('Europe/Oslo')
+        # Daily at 10:00 in Oslo, across the switch to summer time (27 March 2016)
+        self.assertEquals(list(generate_recurring_dates(
+            start=datetime.datetime(2016, 3, 25, 9, 0),
+            frequency='DAILY',
+            count=4,
+            endRepeatMode='count',
+            tz=oslo
+        )), [
+            datetime.datetime(2016, 3, 25, 9, 0),  # UTC+1
+            datetime.datetime(2016, 3, 26, 9, 0),
+            datetime.datetime(2016, 3, 27, 8, 0),  # UTC+2
+            datetime.datetime(2016, 3, 28, 8, 0),
+        ])
+        # and across the switch back to winter time (30 October 2016)
+        self.assertEquals(list(generate_recurring_dates(
+            start=datetime.datetime(2016, 10, 29, 8, 0),
+            frequency='DAILY',
+            count=3,
+            endRepeatMode='count',
+            tz=oslo
+        )), [
+            datetime.datetime(2016, 10, 29, 8, 0),  # UTC+2
+            datetime.datetime(2016, 10, 30, 9, 0),  # UTC+1
+            datetime.datetime(2016, 10, 31, 9, 0),
+        ])
+
+    def test_local_dates_to_utc(self):
+        oslo = get_timezone('Europe/Oslo')
+        self.assertIs(oslo, get_timezone('Europe/Oslo'))
+        self.assertIsNone(get_timezone(None))
+
+        # every 30 minutes over both 2016 transitions, including the non-existent
+        # (27 March 02:30) and ambiguous (30 October 02:30) local times
+        dates = []
+        for start in [datetime.datetime(2016, 3, 26), datetime.datetime(2016, 10, 29)]:
+            dates.extend(start + datetime.timedelta(minutes=30 * i) for i in range(48 * 3))
+
+        self.assertEquals(
+            list(local_dates_to_utc(dates, oslo)),
+            [oslo.localize(date).astimezone(pytz.UTC).replace(tzinfo=None) for date in dates]
+        )
+
+        # fixed offset timezones
+        self.assertEquals(
+            list(local_dates_to_utc([datetime.datetime(2016, 3, 27, 2, 30)], get_timezone('UTC'))),
+            [datetime.datetime(2016, 3, 27, 2, 30)]
+        )
+        self.assertEquals(
+            list(local_dates_to_utc([datetime.datetime(2016, 3, 27, 2, 30)], get_timezone('Etc/GMT-1'))),
+            [datetime.datetime(2016, 3, 27, 1, 30)]
+        )
+
+    def test_get_next_recurring_date(self):
+        # Every other thursday and friday afternoon
+        rule = {
+            'start': datetime.datetime(2016, 1, 1, 15, 0),
+            'frequency': 'WEEKLY',
+            'byday': 'TH FR',
+            'interval': 2,
+            'until': datetime.datetime(2016, 2, 1),
+            'endRepeatMode': 'until',
+        }
+        self.assertEquals(
+            datetime.datetime(2016, 1, 14, 15, 0),
+            get_next_recurring_date(after=datetime.datetime(2016, 1, 2), **rule)
+        )
+        self.assertEquals(
+            datetime.datetime(2016, 1, 14, 15, 0),
+            get_next_recurring_date(after=datetime.datetime(2016, 1, 14, 15, 0), **rule)
+        )
+        self.assertEquals(
+            datetime.datetime(2016, 1, 15, 15, 0),
+            get_next_recurring_date(after=datetime.datetime(2016, 1, 14, 15, 0), inc=False, **rule)
+        )
+        self.assertIsNone(get_next_recurring_date(after=datetime.datetime(2016, 1, 30), **rule))
+
+        # Time zone, returns UTC
+        self.assertEquals(
+            datetime.datetime(2016, 11, 24, 23, 00),
+            get_next_recurring_date(
+                after=datetime.datetime(2016, 11, 18, tzinfo=pytz.UTC),
+                start=datetime.datetime(2016, 11, 17, 23, 00),
+                frequency='WEEKLY',
+                byday='FR',
+                count=3,
+                endRepeatMode='count',
+                tz=pytz.timezone('Europe/Berlin')
+            )
+        )
+
+    def test_set_next_occurrence(self):
+        updates = {'dates': {
+            'start': datetime.datetime(2016, 1, 2, 15, 0),
+            'end': datetime.datetime(2016, 1, 2, 17, 0),
+            'recurring_rule': {
+                'frequency': 'WEEKLY',
+                'byday': 'MO',
+                'interval': 1,
+                'count': 5,
+                'endRepeatMode': 'count'
+            }
+        }}
+        set_next_occurrence(updates)
+        self.assertEquals(datetime.datetime(2016, 1, 4, 15, 0), updates['dates']['start'])
+        self.assertEquals(datetime.datetime(2016, 1, 4, 17, 0), updates['dates']['end'])
+
     def test_get_recurring_timeline(self):
         with self.app.app_context():
             generated_events = generate_recurring_events(10)
@@ -105,6 +221,174 @@ class EventTestCase(TestCase):
                 self.assertEquals(e['dates']['start'], expected_time)
                 expected_time += datetime.timedelta(days=1)
 
+    def test_virtual_occurrence_id(self):
+        start = datetime.datetime(2017, 3, 1, 10, 30)
+        occurrence_id = get_virtual_occurrence_id('urn:newsml:localhost:2017-03-01T10:00:00.0:abc', start)
+        self.assertEquals('urn:newsml:localhost:2017-03-01T10:00:00.0:abc:20170301T103000', occurrence_id)
+        self.assertEquals(
+            ('urn:newsml:localhost:2017-03-01T10:00:00.0:abc', start),
+            parse_virtual_occurrence_id(occurrence_id)
+        )
+        self.assertEquals((None, None), parse_virtual_occurrence_id('urn:newsml:localhost:2017-03-01T10:00:00.0:abc'))
+
+    def test_generate_virtual_occurrences(self):
+        with self.app.app_context():
+            master = {
+                '_id': 'master1',
+                'name': 'Daily event',
+                'recurrence_id': 'rec1',
+                'virtual_recurrence': True,
+                'dates': {
+                    'start': datetime.datetime(2017, 1, 1, 10, 0, tzinfo=pytz.UTC),
+                    'end': datetime.datetime(2017, 1, 1, 11, 0, tzinfo=pytz.UTC),
+                    'recurring_rule': {
+                        'frequency': 'DAILY',
+                        'interval': 1,
+                        'endRepeatMode': 'until',
+                        'until': datetime.datetime(2017, 12, 31, tzinfo=pytz.UTC)
+                    }
+                }
+            }
+            excluded = get_virtual_occurrence_id('master1', datetime.datetime(2017, 6, 2, 10, 0))
+
+            occurrences = list(generate_virtual_occurrences(
+                master,
+                datetime.datetime(2017, 6, 1),
+                datetime.datetime(2017, 6, 4),
+                {excluded}
+            ))
+
+            self.assertEquals(
+                [o['dates']['start'] for o in occurrences],
+                [
+                    datetime.datetime(2017, 6, 1, 10, 0, tzinfo=pytz.UTC),
+                    datetime.datetime(2017, 6, 3, 10, 0, tzinfo=pytz.UTC),
+                ]
+            )
+            for occurrence in occurrences:
+                self.assertTrue(occurrence['_virtual'])
+                self.assertEquals('rec1', occurrence['recurrence_id'])
+                self.assertNotIn('virtual_recurrence', occurrence)
+                self.assertEquals(occurrence['_id'], occurrence['guid'])
+                self.assertEquals(
+                    occurrence['dates']['end'] - occurrence['dates']['start'],
+                    datetime.timedelta(hours=1)
+                )
+
+    def test_get_virtual_window_paginates_occurrences(self):
+        with self.app.app_context():
+            self.app.config['VIRTUAL_RECURRENT_EVENTS'] = True
+            master = {
+                '_id': 'master1',
+                'name': 'Daily event',
+                'recurrence_id': 'rec1',
+                'virtual_recurrence': True,
+                'dates': {
+                    'start': datetime.datetime(2017, 1, 1, 10, 0, tzinfo=pytz.UTC),
+                    'end': datetime.datetime(2017, 1, 1, 11, 0, tzinfo=pytz.UTC),
+                    'recurring_rule': {
+                        'frequency': 'DAILY',
+                        'interval': 1,
+                        'endRepeatMode': 'count',
+                        'count': 100
+                    }
+                }
+            }
+            event = {
+                '_id': 'event1',
+                'name': 'Single event',
+                'dates': {
+                    'start': datetime.datetime(2017, 1, 2, 12, 0, tzinfo=pytz.UTC),
+                    'end': datetime.datetime(2017, 1, 2, 13, 0, tzinfo=pytz.UTC),
+                }
+            }
+
+            req = ParsedRequest()
+            req.args = {'start_date': '2017-01-01T00:00:00+0000', 'end_date': '2017-01-04T23:59:59+0000'}
+            req.max_results = 2
+            req.page = 2
+
+            service = get_resource_service('events')
+            with patch('superdesk.Service.get', return_value=ListCursor([master, event])) as get, \
+                    patch.object(service, '_get_materialised_occurrence_ids', return_value=set()):
+                cursor = service.get(req, {})
+
+            # the elastic query is not paginated, the page is taken from the expanded events
+            source = json.loads(get.call_args[0][0].args['source'])
+            self.assertEqual(0, source['from'])
+            self.assertEqual(10000, source['size'])
+
+            self.assertEqual(5, cursor.count())
+            self.assertEqual(
+                [
+                    datetime.datetime(2017, 1, 2, 12, 0, tzinfo=pytz.UTC),
+                    datetime.datetime(2017, 1, 3, 10, 0, tzinfo=pytz.UTC)
+                ],
+                [doc['dates']['start'] for doc in cursor]
+            )
+
+            with patch('superdesk.Service.get', return_value=ListCursor([master, event])), \
+                    patch.object(service, '_get_materialised_occurrence_ids', return_value=set()), \
+                    patch('planning.events.VIRTUAL_WINDOW_MAX_EVENTS', 4):
+                self.assertRaises(SuperdeskApiError, service.get, req, {})
+
+    def test_generate_series_occurrences(self):
+        with self.app.app_context():
+            master = {
+                '_id': 'master1',
+                'name': 'Daily event',
+                'recurrence_id': 'rec1',
+                'virtual_recurrence': True,
+                'dates': {
+                    'start': datetime.datetime(2017, 1, 1, 10, 0, tzinfo=pytz.UTC),
+                    'end': datetime.datetime(2017, 1, 1, 11, 0, tzinfo=pytz.UTC),
+                    'recurring_rule': {
+                        'frequency': 'DAILY',
+                        'interval': 1,
+                        'endRepeatMode': 'count',
+                        'count': 10
+                    }
+                }
+            }
+
+            occurrences = list(generate_series_occurrences(master, until=datetime.datetime(2017, 1, 4, 10, 0)))
+            self.assertEqual(
+                [
+                    get_virtual_occurrence_id('master1', datetime.datetime(2017, 1, day, 10, 0))
+                    for day in (2, 3, 4)
+                ],
+                [occurrence['_id'] for occurrence in occurrences]
+            )
+
+    def test_store_virtual_series(self):
+        with self.app.app_context():
+            self.app.config['VIRTUAL_RECURRENT_EVENTS'] = True
+            service = get_resource_service('events')
+            service.post([{
+                'name': 'Daily event',
+                'dates': {
+                    'start': datetime.datetime(2017, 1, 1, 10, 0, tzinfo=pytz.UTC),
+                    'end': datetime.datetime(2017, 1, 1, 11, 0, tzinfo=pytz.UTC),
+                    'recurring_rule': {
+                        'frequency': 'DAILY',
+                        'interval': 1,
+                        'endRepeatMode': 'count',
+                        'count': 5
+                    }
+                }
+            }])
+            master = service.find_one(req=None, virtual_recurrence=True)
+            occurrence_id = get_virtual_occurrence_id(master['_id'], datetime.datetime(2017, 1, 3, 10, 0))
+            service.materialise_occurrence(service.get_virtual_occurrence(occurrence_id))
+
+            historic, past, future = service.get_recurring_timeline(master)
+
+            self.assertEqual(4, len(historic + past + future))
+            self.assertFalse(service.find_one(req=None, _id=master['_id'])['virtual_recurrence'])
+            self.assertEqual(5, len(list(service.get_from_mongo(req=None, lookup={
+                'recurrence_id': master['recurrence_id']
+            }))))
+
 
 def generate_recurring_events(num_events):
     events = []
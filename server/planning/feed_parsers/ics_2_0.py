@@ -10,20 +10,25 @@
 
 import logging
 import datetime
+import itertools
 
 from superdesk.errors import ParserError
 from superdesk.io.feed_parsers import FileFeedParser
 from superdesk.metadata.utils import generate_guid
 from superdesk.metadata.item import ITEM_TYPE, CONTENT_TYPE, GUID_FIELD, GUID_NEWSML, FORMAT, FORMATS, CONTENT_STATE
 from superdesk.utc import utcnow
-from icalendar import vRecur, vCalAddress, vGeo
+from icalendar import Event, vRecur, vCalAddress, vGeo
 from icalendar.parser import tzid_from_dt
-from superdesk import get_resource_service
+from flask import current_app as app
+from planning.common import get_vocabulary_item, get_ingest_batch_size
 import pytz
 
 utc = pytz.UTC
 logger = logging.getLogger(__name__)
 
+# fields of the stored events set in the newsroom, kept when a changed component updates them
+WORKFLOW_FIELDS = ['state', 'pubstatus', 'occur_status']
+
 
 class IcsTwoFeedParser(FileFeedParser):
     """ICS specific parser.
@@ -42,129 +47,332 @@ class IcsTwoFeedParser(FileFeedParser):
     def parse(self, cal, provider=None):
 
         try:
-            items = []
-
-            for component in cal.walk():
-                if component.name == "VEVENT":
-                    item = {
-                        ITEM_TYPE: CONTENT_TYPE.TEXT,
-                        GUID_FIELD: generate_guid(type=GUID_NEWSML),
-                        FORMAT: FORMATS.PRESERVED
-                    }
-                    item['name'] = component.get('summary')
-                    item['definition_short'] = component.get('summary')
-                    item['definition_long'] = component.get('description')
-                    item['original_source'] = component.get('uid')
-                    item['state'] = CONTENT_STATE.PROGRESS
-                    item['pubstatus'] = None
-                    eocstat_map = get_resource_service('vocabularies').find_one(req=None, _id='eventoccurstatus')
-                    if eocstat_map:
-                        item['occur_status'] = [x for x in eocstat_map.get('items', []) if
-                                                x['qcode'] == 'eocstat:eos5' and x.get('is_active', True)][0]
-                        item['occur_status'].pop('is_active', None)
-
-                    # add dates
-                    # check if component .dt return date instead of datetime, if so, convert to datetime
-                    dtstart = component.get('dtstart').dt
-                    dates_start = dtstart if isinstance(dtstart, datetime.datetime) \
-                        else datetime.datetime.combine(dtstart, datetime.datetime.min.time())
-                    if not dates_start.tzinfo:
-                        dates_start = utc.localize(dates_start)
-                    try:
-                        dtend = component.get('dtend').dt
-                        dates_end = dtend if isinstance(dtend, datetime.datetime) \
-                            else datetime.datetime.combine(dtend, datetime.datetime.min.time())
-                        if not dates_end.tzinfo:
-                            dates_end = utc.localize(dates_end)
-                    except AttributeError as e:
-                        dates_end = None
-                    item['dates'] = {
-                        'start': dates_start,
-                        'end': dates_end,
-                        'tz': '',
-                        'recurring_rule': {}
-                    }
-                    # parse ics RRULE to fit eventsML recurring_rule
-                    r_rule = component.get('rrule')
-                    if isinstance(r_rule, vRecur):
-                        r_rule_dict = vRecur.from_ical(r_rule)
-                        if 'FREQ' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['frequency'] = ''.join(r_rule_dict.get('FREQ'))
-                        if 'INTERVAL' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['interval'] = r_rule_dict.get('INTERVAL')[0]
-                        if 'UNTIL' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['until'] = r_rule_dict.get('UNTIL')[0]
-                        if 'COUNT' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['count'] = r_rule_dict.get('COUNT')
-                        if 'BYMONTH' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['bymonth'] = ' '.join(r_rule_dict.get('BYMONTH'))
-                        if 'BYDAY' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['byday'] = ' '.join(r_rule_dict.get('BYDAY'))
-                        if 'BYHOUR' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['byhour'] = ' '.join(r_rule_dict.get('BYHOUR'))
-                        if 'BYMIN' in r_rule_dict.keys():
-                            item['dates']['recurring_rule']['bymin'] = ' '.join(r_rule_dict.get('BYMIN'))
-
-                    # set timezone info if date is a datetime
-                    if isinstance(component.get('dtstart').dt, datetime.datetime):
-                        item['dates']['tz'] = tzid_from_dt(component.get('dtstart').dt)
-
-                    # add participants
-                    item['participant'] = []
-                    if component.get('attendee'):
-                        for attendee in component.get('attendee'):
-                            if isinstance(attendee, vCalAddress):
-                                item['participant'].append({
-                                    'name': vCalAddress.from_ical(attendee),
-                                    'qcode': ''
-                                })
-
-                    # add organizers
-                    item['organizer'] = [{
-                        'name': component.get('organizer', ''),
-                        'qcode': ''
-                    }]
-
-                    # add location
-                    item['location'] = [{
-                        'name': component.get('location', ''),
-                        'qcode': '',
-                        'geo': ''
-                    }]
-                    if component.get('geo'):
-                        item['location'][0]['geo'] = vGeo.from_ical(component.get('geo').to_ical())
-
-                    # IMPORTANT: firstcreated must be less than 2 days past
-                    # we must preserve the original event created and updated in some other fields
-                    if component.get('created'):
-                        item['event_created'] = component.get('created').dt
-                    if component.get('last-modified'):
-                        item['event_lastmodified'] = component.get('last-modified').dt
-                    item['firstcreated'] = utcnow()
-                    item['versioncreated'] = utcnow()
-                    items.append(item)
-            original_source_ids = [_['original_source'] for _ in items if _.get('original_source', None)]
-            existing_items = list(get_resource_service('events').get_from_mongo(req=None, lookup={
-                'original_source': {'$in': original_source_ids}
-            }))
-
-            def original_source_exists(item):
-                """Return true if the item exists in `existing_items`"""
-                for c in existing_items:
-                    if c['original_source'] == item['original_source']:
-                        if c['dates']['start'] == item['dates']['start']:
-                            return True
-                return False
+            now = utcnow()
+            components = [component for component in cal.walk() if component.name == 'VEVENT']
+            return self._parse_components(components, provider, now)
+        except Exception as ex:
+            raise ParserError.parseMessageError(ex, provider)
+
+    def parse_stream(self, lines, provider=None, batch_size=None):
+        """Parse an iCalendar stream, yielding the items in batches
 
-            def is_future(item):
-                """Return true if the item is reccuring or in the future"""
-                if not item['dates'].get('recurring_rule'):
-                    if item['dates']['start'] < utcnow() - datetime.timedelta(days=1):
-                        return False
-                return True
+        Unlike `parse`, the whole calendar is never loaded in memory: the VEVENT components
+        are read one by one and the items are yielded as soon as a batch is complete.
 
-            items = [_ for _ in items if is_future(_)]
-            items = [_ for _ in items if not original_source_exists(_)]
-            return items
+        :param iterable lines: lines of the iCalendar data, i.e. a file opened in binary mode
+        :param dict provider: ingest provider
+        :param int batch_size: maximum number of items per batch
+        :return generator: generator of lists of items
+        """
+        batch_size = batch_size or get_ingest_batch_size()
+
+        try:
+            now = utcnow()
+            components = iter_ics_components(lines)
+            while True:
+                batch = list(itertools.islice(components, batch_size))
+                if not batch:
+                    break
+                yield self._parse_components(batch, provider, now)
         except Exception as ex:
             raise ParserError.parseMessageError(ex, provider)
+
+    def parse_component(self, component, now):
+        """Convert a VEVENT component to an event item
+
+        :param component: icalendar VEVENT component
+        :param datetime now: date used for firstcreated and versioncreated
+        :return dict: event item
+        """
+        item = {
+            ITEM_TYPE: CONTENT_TYPE.TEXT,
+            GUID_FIELD: generate_guid(type=GUID_NEWSML),
+            FORMAT: FORMATS.PRESERVED
+        }
+        item['name'] = component.get('summary')
+        item['definition_short'] = component.get('summary')
+        item['definition_long'] = component.get('description')
+        item['original_source'] = component.get('uid')
+        item['state'] = CONTENT_STATE.PROGRESS
+        item['pubstatus'] = None
+        occur_status = get_vocabulary_item('eventoccurstatus', 'eocstat:eos5', active_only=True)
+        if occur_status:
+            occur_status.pop('is_active', None)
+            item['occur_status'] = occur_status
+
+        # add dates
+        dates_start = self._get_start(component)
+        try:
+            dtend = component.get('dtend').dt
+            dates_end = dtend if isinstance(dtend, datetime.datetime) \
+                else datetime.datetime.combine(dtend, datetime.datetime.min.time())
+            if not dates_end.tzinfo:
+                dates_end = utc.localize(dates_end)
+        except AttributeError as e:
+            dates_end = None
+        item['dates'] = {
+            'start': dates_start,
+            'end': dates_end,
+            'tz': '',
+            'recurring_rule': {}
+        }
+        # parse ics RRULE to fit eventsML recurring_rule
+        r_rule = component.get('rrule')
+        if isinstance(r_rule, vRecur):
+            r_rule_dict = vRecur.from_ical(r_rule)
+            if 'FREQ' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['frequency'] = ''.join(r_rule_dict.get('FREQ'))
+            if 'INTERVAL' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['interval'] = r_rule_dict.get('INTERVAL')[0]
+            if 'UNTIL' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['until'] = r_rule_dict.get('UNTIL')[0]
+            if 'COUNT' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['count'] = r_rule_dict.get('COUNT')
+            if 'BYMONTH' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['bymonth'] = ' '.join(r_rule_dict.get('BYMONTH'))
+            if 'BYDAY' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['byday'] = ' '.join(r_rule_dict.get('BYDAY'))
+            if 'BYHOUR' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['byhour'] = ' '.join(r_rule_dict.get('BYHOUR'))
+            if 'BYMIN' in r_rule_dict.keys():
+                item['dates']['recurring_rule']['bymin'] = ' '.join(r_rule_dict.get('BYMIN'))
+
+        # set timezone info if date is a datetime
+        if isinstance(component.get('dtstart').dt, datetime.datetime):
+            item['dates']['tz'] = tzid_from_dt(component.get('dtstart').dt)
+
+        # add participants
+        item['participant'] = []
+        if component.get('attendee'):
+            for attendee in component.get('attendee'):
+                if isinstance(attendee, vCalAddress):
+                    item['participant'].append({
+                        'name': vCalAddress.from_ical(attendee),
+                        'qcode': ''
+                    })
+
+        # add organizers
+        item['organizer'] = [{
+            'name': component.get('organizer', ''),
+            'qcode': ''
+        }]
+
+        # add location
+        item['location'] = [{
+            'name': component.get('location', ''),
+            'qcode': '',
+            'geo': ''
+        }]
+        if component.get('geo'):
+            item['location'][0]['geo'] = vGeo.from_ical(component.get('geo').to_ical())
+
+        # IMPORTANT: firstcreated must be less than 2 days past
+        # we must preserve the original event created and updated in some other fields
+        if component.get('created'):
+            item['event_created'] = component.get('created').dt
+        if component.get('last-modified'):
+            item['event_lastmodified'] = component.get('last-modified').dt
+        if component.get('sequence') is not None:
+            item['event_sequence'] = int(component.get('sequence'))
+        item['firstcreated'] = now
+        item['versioncreated'] = now
+        return item
+
+    def _get_start(self, component):
+        # check if component .dt return date instead of datetime, if so, convert to datetime
+        dtstart = component.get('dtstart').dt
+        dates_start = dtstart if isinstance(dtstart, datetime.datetime) \
+            else datetime.datetime.combine(dtstart, datetime.datetime.min.time())
+        if not dates_start.tzinfo:
+            dates_start = utc.localize(dates_start)
+        return dates_start
+
+    def _parse_components(self, components, provider, now):
+        if (provider or {}).get('config', {}).get('delta_ingest'):
+            return self._parse_delta(components, now)
+
+        items = [self.parse_component(component, now) for component in components]
+        return self._filter_items(items, now)
+
+    def _filter_items(self, items, now):
+        """Remove the items in the past or already ingested"""
+        existing_items = self._get_existing_items(items)
+        return [item for item in items
+                if self._is_future(item, now) and self._get_item_key(item) not in existing_items]
+
+    def _is_future(self, item, now):
+        """Return true if the item is reccuring or in the future"""
+        if not item['dates'].get('recurring_rule'):
+            if item['dates']['start'] < now - datetime.timedelta(days=1):
+                return False
+        return True
+
+    def _parse_delta(self, components, now):
+        """Parse only the components which are new or changed since they were ingested
+
+        Components are matched with the stored events by UID, and are changed if their
+        SEQUENCE or LAST-MODIFIED is greater than the stored one. The items of changed
+        components keep the guid of the stored event, so the ingest updates it, see `_get_delta_item`.
+        Components without stored event are parsed as new ones, whatever their LAST-MODIFIED.
+
+        :param list components: VEVENT components
+        :param datetime now: current date
+        :return list: list of items to ingest
+        """
+        stored_events = self._get_stored_events([component.get('uid') for component in components])
+
+        items = []
+        for component in components:
+            stored_event = self._match_stored_event(component, stored_events.get(component.get('uid')))
+            if stored_event is None:
+                item = self.parse_component(component, now)
+                if self._is_future(item, now):
+                    items.append(item)
+                continue
+
+            last_modified = component.get('last-modified')
+            last_modified = _to_naive_utc(last_modified.dt) if last_modified else None
+            if self._is_changed(component, last_modified, stored_event):
+                items.append(self._get_delta_item(component, stored_event, now))
+
+        return items
+
+    def _get_delta_item(self, component, stored_event, now):
+        """Parse a changed component into the item updating its stored event
+
+        The ingest patches the stored event with the item, so only the fields coming from
+        the source are updated: the workflow fields are those of the stored event,
+        and so is the location once linked to the locations collection.
+        """
+        item = self.parse_component(component, now)
+        item[GUID_FIELD] = stored_event[GUID_FIELD]
+        item.pop('firstcreated', None)
+
+        for field in WORKFLOW_FIELDS:
+            if field in stored_event:
+                item[field] = stored_event[field]
+            else:
+                item.pop(field, None)
+
+        if any(location.get('qcode') for location in stored_event.get('location') or []):
+            item['location'] = stored_event['location']
+
+        return item
+
+    def _get_stored_events(self, uids):
+        """Get the stored events with the provided UIDs, with only the fields required to detect changes
+        and those kept when they are updated
+
+        :param list uids: list of UIDs
+        :return dict: lists of events keyed by UID
+        """
+        uids = list({str(uid) for uid in uids if uid})
+        if not uids:
+            return {}
+
+        fields = ['original_source', GUID_FIELD, 'dates.start', 'event_lastmodified', 'event_sequence', 'location']
+        cursor = app.data.get_mongo_collection('events').find(
+            {'original_source': {'$in': uids}},
+            {field: 1 for field in fields + WORKFLOW_FIELDS}
+        )
+
+        stored_events = {}
+        for event in cursor:
+            stored_events.setdefault(event['original_source'], []).append(event)
+        return stored_events
+
+    def _match_stored_event(self, component, stored_events):
+        """Get the stored event of a component, the one with the same UID starting at the same time"""
+        if not stored_events:
+            return None
+
+        start = _to_naive_utc(self._get_start(component))
+        for event in stored_events:
+            if _to_naive_utc(event.get('dates', {}).get('start')) == start:
+                return event
+        return None
+
+    def _is_changed(self, component, last_modified, stored_event):
+        sequence = component.get('sequence')
+        stored_sequence = stored_event.get('event_sequence')
+        if sequence is not None and stored_sequence is not None and int(sequence) != stored_sequence:
+            return int(sequence) > stored_sequence
+
+        stored_last_modified = _to_naive_utc(stored_event.get('event_lastmodified'))
+        if last_modified and stored_last_modified:
+            return last_modified > stored_last_modified
+
+        # nothing to compare, the event starts at the same time so it is considered unchanged
+        return False
+
+    def _get_existing_items(self, items):
+        """Get the keys of the stored events which have the same source and start as the parsed items
+
+        :param list items: parsed items
+        :return set: set of (original_source, dates.start) tuples
+        """
+        original_source_ids = list({item['original_source'] for item in items if item.get('original_source')})
+        if not original_source_ids:
+            return set()
+
+        cursor = app.data.get_mongo_collection('events').find(
+            {'original_source': {'$in': original_source_ids}},
+            {'original_source': 1, 'dates.start': 1}
+        )
+        return {self._get_item_key(event) for event in cursor if event.get('dates', {}).get('start')}
+
+    def _get_item_key(self, item):
+        return item.get('original_source'), _to_naive_utc(item['dates']['start'])
+
+
+def iter_ics_components(lines, name='VEVENT'):
+    """Read the components of an iCalendar stream one at a time
+
+    Folded lines are unfolded and each component is parsed on its own,
+    so only one component is held in memory at a time.
+
+    :param iterable lines: lines of the iCalendar data, as bytes or str
+    :param str name: name of the components to read
+    :return generator: generator of icalendar components
+    """
+    begin = 'BEGIN:' + name
+    end = 'END:' + name
+    component_lines = None
+
+    for line in _unfold_ics_lines(lines):
+        if component_lines is None:
+            if line.upper() == begin:
+                component_lines = [line]
+            continue
+
+        component_lines.append(line)
+        if line.upper() == end:
+            yield Event.from_ical('\r\n'.join(component_lines))
+            component_lines = None
+
+
+def _to_naive_utc(date):
+    if isinstance(date, datetime.datetime) and date.tzinfo:
+        return date.astimezone(utc).replace(tzinfo=None)
+    return date
+
+
+def _unfold_ics_lines(lines):
+    previous = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+
+        if line[:1] in (' ', '\t') and previous is not None:
+            previous += line[1:]
+            continue
+
+        if previous:
+            yield previous
+        previous = line
+
+    if previous:
+        yield previous
@@ -1,6 +1,8 @@
 
-from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
+from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser, iter_ics_components
 import os
+import datetime
+import pytz
 from icalendar import Calendar
 from planning.tests import TestCase
 
@@ -16,7 +18,8 @@ class IcsTwoFeedParserTestCase(TestCase):
         super().setUp()
         self.app.data.insert('vocabularies', self.vocab)
         dir_path = os.path.dirname(os.path.realpath(__file__))
-        calendar = open(os.path.join(dir_path, 'events.ics'))
+        self.calendar_path = os.path.join(dir_path, 'events.ics')
+        calendar = open(self.calendar_path)
         self.calendar = Calendar.from_ical(calendar.read())
 
     def test_ntb_event_xml_feed_parser_can_parse(self):
@@ -26,3 +29,109 @@ class IcsTwoFeedParserTestCase(TestCase):
         with self.app.app_context():
             events = IcsTwoFeedParser().parse(self.calendar)
             self.assertTrue(len(events) >= 2)
+
+    def test_ics_feed_parser_skips_existing_events(self):
+        with self.app.app_context():
+            events = IcsTwoFeedParser().parse(self.calendar)
+            self.assertIn('4fq4noc9oho71100i8comsj0ek@google.com', [event['original_source'] for event in events])
+
+            self.app.data.insert('events', [{
+                'guid': 'existing',
+                'name': 'Existing event',
+                'original_source': '4fq4noc9oho71100i8comsj0ek@google.com',
+                'dates': {
+                    'start': datetime.datetime(2017, 5, 11, 8, 0, tzinfo=pytz.UTC),
+                    'end': datetime.datetime(2017, 5, 11, 9, 0, tzinfo=pytz.UTC)
+                }
+            }])
+
+            new_events = IcsTwoFeedParser().parse(self.calendar)
+            self.assertEqual(len(events) - 1, len(new_events))
+            self.assertNotIn('4fq4noc9oho71100i8comsj0ek@google.com',
+                             [event['original_source'] for event in new_events])
+
+    def test_ics_feed_parser_parse_stream(self):
+        with self.app.app_context():
+            events = IcsTwoFeedParser().parse(self.calendar)
+
+            with open(self.calendar_path, 'rb') as f:
+                batches = list(IcsTwoFeedParser().parse_stream(f, batch_size=1))
+
+            # one batch per VEVENT, past events being removed from their batch
+            self.assertEqual(4, len(batches))
+            self.assertEqual(
+                [(event['original_source'], event['dates']['start']) for event in events],
+                [(event['original_source'], event['dates']['start']) for batch in batches for event in batch]
+            )
+
+    def test_iter_ics_components(self):
+        lines = [
+            b'BEGIN:VCALENDAR',
+            b'BEGIN:VEVENT',
+            b'UID:event1',
+            b'SUMMARY:A summary folded',
+            b'\r\n',
+            b'  over two lines',
+            b'BEGIN:VALARM',
+            b'ACTION:DISPLAY',
+            b'END:VALARM',
+            b'END:VEVENT',
+            b'',
+            b'BEGIN:VEVENT',
+            b'UID:event2',
+            b'END:VEVENT',
+            b'END:VCALENDAR',
+        ]
+
+        components = list(iter_ics_components(lines))
+        self.assertEqual(['event1', 'event2'], [component.get('uid') for component in components])
+        self.assertEqual('A summary folded over two lines', components[0].get('summary'))
+        self.assertEqual(['VALARM'], [sub.name for sub in components[0].subcomponents])
+
+    def test_ics_feed_parser_delta_ingest(self):
+        provider = {'config': {'delta_ingest': True}}
+        stored_event = {
+            'guid': 'existing',
+            'name': 'Existing event',
+            'original_source': '4fq4noc9oho71100i8comsj0ek@google.com',
+            'event_lastmodified': datetime.datetime(2017, 2, 20, 15, 33, 22, tzinfo=pytz.UTC),
+            'event_sequence': 0,
+            'state': 'scheduled',
+            'pubstatus': 'usable',
+            'location': [{'name': 'Oslo', 'qcode': 'location1'}],
+            'dates': {
+                'start': datetime.datetime(2017, 5, 11, 8, 0, tzinfo=pytz.UTC),
+                'end': datetime.datetime(2017, 5, 11, 9, 0, tzinfo=pytz.UTC)
+            }
+        }
+
+        with self.app.app_context():
+            self.app.data.insert('events', [stored_event])
+
+            # unchanged since ingested, while the new event is ingested
+            # even if it was modified before the stored one
+            new_events = IcsTwoFeedParser().parse(self.calendar, provider)
+            self.assertEqual(['bq4qem23j08nb898278se1pmtk@google.com'],
+                             [event['original_source'] for event in new_events])
+
+            # modified since ingested, the stored event is updated
+            self.app.data.update('events', 'existing', {
+                'event_lastmodified': datetime.datetime(2017, 2, 20, 10, 0, tzinfo=pytz.UTC)
+            }, stored_event)
+            events = IcsTwoFeedParser().parse(self.calendar, provider)
+            updated = [event for event in events if event['original_source'] == stored_event['original_source']]
+            self.assertEqual(1, len(updated))
+            self.assertEqual('existing', updated[0]['guid'])
+            self.assertEqual(0, updated[0]['event_sequence'])
+            self.assertEqual('Scrum', updated[0]['name'])
+            # the workflow fields and the linked location are kept
+            self.assertEqual('scheduled', updated[0]['state'])
+            self.assertEqual('usable', updated[0]['pubstatus'])
+            self.assertEqual([{'name': 'Oslo', 'qcode': 'location1'}], updated[0]['location'])
+
+            # nothing was modified since the events were ingested
+            self.app.data.update('events', 'existing', {
+                'event_lastmodified': datetime.datetime(2017, 2, 20, 15, 33, 22, tzinfo=pytz.UTC)
+            }, stored_event)
+            self.app.data.insert('events', [dict(event, _id=event['guid']) for event in new_events])
+            self.assertEqual([], IcsTwoFeedParser().parse(self.calendar, provider))
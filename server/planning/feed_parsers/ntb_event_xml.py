@@ -15,15 +15,20 @@ from superdesk.io.feed_parsers import XMLFeedParser
 from superdesk.metadata.item import ITEM_TYPE, CONTENT_TYPE, GUID_FIELD, GUID_NEWSML, FORMAT, FORMATS
 from superdesk.metadata.utils import generate_guid
 from superdesk.utc import utcnow
+from planning.common import get_ingest_batch_size
 
 logger = logging.getLogger(__name__)
 
+# tag of the event documents, either the root of the file or the children of a container document
+EVENT_TAG = 'document'
+
 
 class NTBEventXMLFeedParser(XMLFeedParser):
     """NTB Event XML parser.
 
     Feed Parser which can parse an NTB created XML file exported from Outlook
     the firstcreated and versioncreated times are localised.
+    The file holds either one event document, or a container of event documents.
     """
 
     NAME = 'ntb_event_xml'
@@ -34,43 +39,100 @@ class NTBEventXMLFeedParser(XMLFeedParser):
         return True
 
     def parse(self, xml, provider=None, content=None):
-        items = []
+        """Parse an NTB event document, or a container document holding many of them
+
+        :param xml: root element of the document
+        :param dict provider: ingest provider
+        :return list: event items
+        """
+        try:
+            now = utcnow()
+            # a single event document doesn't have any event child
+            documents = xml.findall(EVENT_TAG) or [xml]
+            return [self.parse_event(document, now) for document in documents]
+        except Exception as ex:
+            raise ParserError.parseMessageError(ex, provider)
+
+    def parse_stream(self, source, provider=None, batch_size=None):
+        """Parse an NTB event XML file incrementally, yielding the items in batches
+
+        The events of a container document are parsed as soon as they are read and removed
+        from the tree, so the memory used doesn't grow with the number of events.
+
+        :param source: file name or file object opened in binary mode
+        :param dict provider: ingest provider
+        :param int batch_size: maximum number of items per batch
+        :return generator: generator of lists of items
+        """
+        batch_size = batch_size or get_ingest_batch_size()
+
         try:
-            # parse xml file, only expecting one event per file
-            if not ET.iselement(xml.find('guid')):
-                guid = generate_guid(type=GUID_NEWSML)
-            else:
-                guid = xml.find('guid').text
-
-            item = {
-                ITEM_TYPE: CONTENT_TYPE.TEXT,
-                GUID_FIELD: guid,
-                FORMAT: FORMATS.PRESERVED
-            }
-            item['name'] = xml.find('title').text
-            item['definition_short'] = xml.find('title').text
-            item['definition_long'] = xml.find('content').text
-            item['dates'] = {
-                'start': xml.find('timeStart').text,
-                'end': xml.find('timeEnd').text,
-                'tz': '',
-                'recurring_rule': {}
-            }
-            # add location
-            item['location'] = [{
-                'name': xml.find('location').text,
-                'qcode': '',
-                'geo': ''
-            }]
-            if ET.iselement(xml.find('geo')):
-                geo = xml.find('geo')
-                item['location'][0]['geo'] = '%s, %s' % (geo.find('latitude').text, geo.find('longitude').text)
-            # IMPORTANT: firstcreated must be less than 2 days past
-            # we must preserve the original event created and updated in some other fields
-            item['firstcreated'] = utcnow()
-            item['versioncreated'] = utcnow()
-            items.append(item)
-
-            return items
+            now = utcnow()
+            items = []
+            root = None
+            depth = 0
+            events = 0
+            for event, element in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth == 1 and element.tag == EVENT_TAG:
+                    items.append(self.parse_event(element, now))
+                    events += 1
+                    root.remove(element)
+                    if len(items) >= batch_size:
+                        yield items
+                        items = []
+                elif depth == 0 and not events:
+                    # single event document
+                    items.append(self.parse_event(root, now))
+
+            if items:
+                yield items
         except Exception as ex:
             raise ParserError.parseMessageError(ex, provider)
+
+    def parse_event(self, xml, now):
+        """Convert an NTB event document to an event item
+
+        :param xml: event document element
+        :param datetime now: date used for firstcreated and versioncreated
+        :return dict: event item
+        """
+        if not ET.iselement(xml.find('guid')):
+            guid = generate_guid(type=GUID_NEWSML)
+        else:
+            guid = xml.find('guid').text
+
+        item = {
+            ITEM_TYPE: CONTENT_TYPE.TEXT,
+            GUID_FIELD: guid,
+            FORMAT: FORMATS.PRESERVED
+        }
+        item['name'] = xml.find('title').text
+        item['definition_short'] = xml.find('title').text
+        item['definition_long'] = xml.find('content').text
+        item['dates'] = {
+            'start': xml.find('timeStart').text,
+            'end': xml.find('timeEnd').text,
+            'tz': '',
+            'recurring_rule': {}
+        }
+        # add location
+        item['location'] = [{
+            'name': xml.find('location').text,
+            'qcode': '',
+            'geo': ''
+        }]
+        if ET.iselement(xml.find('geo')):
+            geo = xml.find('geo')
+            item['location'][0]['geo'] = '%s, %s' % (geo.find('latitude').text, geo.find('longitude').text)
+        # IMPORTANT: firstcreated must be less than 2 days past
+        # we must preserve the original event created and updated in some other fields
+        item['firstcreated'] = now
+        item['versioncreated'] = now
+        return item
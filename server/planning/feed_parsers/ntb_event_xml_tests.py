@@ -1,4 +1,5 @@
 
+import io
 import xml.etree.ElementTree as ET
 from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.tests import TestCase
@@ -57,3 +58,34 @@ class NTBEventXMLFeedParserTestCase(TestCase):
             self.assertEqual(
                 {'end': '2016-09-16T16:00:00', 'tz': '', 'start': '2016-09-05T09:00:00', 'recurring_rule': {}},
                 self.event[0].get('dates'))
+
+    def test_ntb_event_xml_feed_parser_parse_container(self):
+        documents = ''.join(
+            '<document><guid>event{0}</guid><title>Event {0}</title><location>Oslo</location>'
+            '<timeStart>2016-09-05T09:00:00</timeStart><timeEnd>2016-09-05T16:00:00</timeEnd>'
+            '<content>Event {0}.</content></document>'.format(index)
+            for index in range(5)
+        )
+        xml = '<?xml version="1.0" encoding="UTF-8"?><documents><time>2016-08-10T15:02:02</time>{}</documents>'.format(
+            documents
+        ).encode('utf-8')
+
+        with self.app.app_context():
+            events = NTBEventXMLFeedParser().parse(ET.fromstring(xml))
+            self.assertEqual(['event{}'.format(index) for index in range(5)], [event['guid'] for event in events])
+
+            batches = list(NTBEventXMLFeedParser().parse_stream(io.BytesIO(xml), batch_size=2))
+            self.assertEqual(
+                [['event0', 'event1'], ['event2', 'event3'], ['event4']],
+                [[event['guid'] for event in events] for events in batches]
+            )
+            self.assertEqual('Event 4.', batches[2][0]['definition_long'])
+            self.assertEqual(1, len({event['firstcreated'] for events in batches for event in events}))
+            self.assertEqual(batches[0][0]['firstcreated'], batches[0][0]['versioncreated'])
+
+    def test_ntb_event_xml_feed_parser_parse_stream_single_event(self):
+        with self.app.app_context():
+            batches = list(NTBEventXMLFeedParser().parse_stream(io.BytesIO(ET.tostring(self.xml))))
+            self.assertEqual(1, len(batches))
+            self.assertEqual('MARKS XML TEST', batches[0][0]['name'])
+            self.assertEqual('69.65482639999999, 18.96509590000005', batches[0][0]['location'][0]['geo'])
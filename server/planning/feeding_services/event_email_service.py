@@ -8,23 +8,47 @@
 # AUTHORS and LICENSE files distributed with this source code, or
 # at https://www.sourcefabric.org/superdesk/license
 
+import base64
 import imaplib
 import email
 import io
 import logging
+import os
+import quopri
+import re
 
-from superdesk.errors import IngestEmailError
+from superdesk.errors import IngestEmailError, SuperdeskIngestError
 from superdesk.io.feeding_services import FeedingService
 from superdesk.upload import url_for_media
-from superdesk.media.media_operations import process_file_from_stream
 from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
-from xml.etree import ElementTree
-from icalendar import Calendar
+from planning.locations import resolve_ingest_locations
 
 
 logger = logging.getLogger(__name__)
 
+# number of messages fetched with a single FETCH command
+FETCH_BATCH_SIZE = 50
+
+# content types of the attachments supported by the parsers
+PARSER_CONTENT_TYPES = {
+    IcsTwoFeedParser.NAME: 'text/calendar',
+    NTBEventXMLFeedParser.NAME: 'text/xml',
+}
+
+# content types and file extensions of the attachments, mapped to the parser content types
+ATTACHMENT_CONTENT_TYPES = {
+    'text/calendar': 'text/calendar',
+    'application/ics': 'text/calendar',
+    'text/xml': 'text/xml',
+    'application/xml': 'text/xml',
+}
+ATTACHMENT_EXTENSIONS = {
+    '.ics': 'text/calendar',
+    '.ical': 'text/calendar',
+    '.xml': 'text/xml',
+}
+
 
 class EventEmailFeedingService(FeedingService):
     """
@@ -42,7 +66,23 @@ class EventEmailFeedingService(FeedingService):
     """
     service = 'events'
 
+    def update(self, provider, update):
+        try:
+            for items in super().update(provider, update):
+                # the locations are resolved for the whole batch, before the events are saved
+                resolve_ingest_locations(items, provider)
+                yield items
+        except SuperdeskIngestError as error:
+            # the messages are read while the items are ingested, after `super().update` returned
+            self.close_provider(provider, error)
+            raise error
+
     def _update(self, provider, update):
+        """Yield the items of the unseen messages, in batches of FETCH_BATCH_SIZE messages
+
+        The messages of a batch are flagged as seen when the next batch is requested,
+        that is once the items of the batch are ingested, so a failed ingest leaves them unseen.
+        """
         config = provider.get('config', {})
         server = config.get('server', '')
         port = int(config.get('port', 993))
@@ -56,59 +96,272 @@ class EventEmailFeedingService(FeedingService):
 
             rv, data = imap.select(config.get('mailbox', None), readonly=False)
             if rv == 'OK':
-                rv, data = imap.search(None, config.get('filter', '(UNSEEN)'))
+                # messages are referenced by UID, which unlike the sequence numbers
+                # don't change if messages are expunged during the update
+                rv, data = imap.uid('SEARCH', None, config.get('filter', '(UNSEEN)'))
                 if rv == 'OK':
-                    new_items = []
-                    for num in data[0].split():
-                        rv, data = imap.fetch(num, '(RFC822)')
-                        if rv == 'OK':
-                            try:
-                                logger.info('Ingesting events from email')
-                                parser = self.get_feed_parser(provider, data)
-                                for response_part in data:
-                                    if isinstance(response_part, tuple):
-                                        if isinstance(response_part[1], bytes):
-                                            msg = email.message_from_bytes(response_part[1])
-                                        else:
-                                            msg = email.message_from_string(response_part[1])
-                                        # this will loop through all the available multiparts in email
-                                        for part in msg.walk():
-                                            # parse attached files only
-                                            if part.get('Content-Disposition') is None:
-                                                continue
-                                            fileName = part.get_filename()
-                                            if bool(fileName):
-                                                attachment = part.get_payload(decode=True)
-                                                content = io.BytesIO(attachment)
-                                                res = process_file_from_stream(content, part.get_content_type())
-                                                file_name, content_type, metadata = res
-                                                if isinstance(parser, NTBEventXMLFeedParser):
-                                                    if content_type != 'text/xml':
-                                                        continue
-                                                    content.seek(0)
-                                                    xml = ElementTree.parse(content)
-                                                    logger.info('Ingesting events with xml parser')
-                                                    new_items.append(parser.parse(xml.getroot(), provider))
-                                                elif isinstance(parser, IcsTwoFeedParser):
-                                                    if content_type != 'text/calendar':
-                                                        continue
-                                                    content.seek(0)
-                                                    cal = Calendar.from_ical(content.read())
-                                                    logger.info('Ingesting events with ics parser')
-                                                    new_items.append(parser.parse(cal, provider))
-                                                else:
-                                                    logger.warn('Ingesting events with unknown parser')
-                                                    new_items.append(parser.parse(data, provider))
-                                rv, data = imap.store(num, '+FLAGS', '\\Seen')
-                            except IngestEmailError:
-                                continue
+                    parser = self.get_feed_parser(provider)
+                    uids = [_to_str(uid) for uid in data[0].split()]
+                    for index in range(0, len(uids), FETCH_BATCH_SIZE):
+                        batch = uids[index:index + FETCH_BATCH_SIZE]
+                        new_items = []
+                        seen = self._ingest_messages(imap, batch, parser, provider, new_items)
+                        yield from new_items
+                        if seen:
+                            # mark all the processed messages in one go
+                            imap.uid('STORE', _to_message_set(seen), '+FLAGS', '\\Seen')
                 imap.close()
             imap.logout()
         except IngestEmailError:
             raise
         except Exception as ex:
             raise IngestEmailError.emailError(ex, provider)
-        return new_items
+
+    def _ingest_messages(self, imap, uids, parser, provider, new_items):
+        """Ingest the events attached to a batch of messages
+
+        The structure of the messages is fetched first, so only the attachments
+        supported by the parser are downloaded, with one FETCH per part number.
+        Messages whose structure can't be read are downloaded in full.
+
+        :return list: UIDs of the processed messages, those with a part which couldn't be fetched excluded
+        """
+        content_type = PARSER_CONTENT_TYPES.get(getattr(parser, 'NAME', None))
+        if content_type is None:
+            return self._ingest_full_messages(imap, uids, parser, provider, new_items)
+
+        rv, data = imap.uid('FETCH', _to_message_set(uids), '(UID BODYSTRUCTURE)')
+        if rv != 'OK':
+            return []
+
+        structures = {response.get('UID'): response for response in _parse_fetch_response(data).values()}
+        parts = {}
+        full_messages = []
+        for uid in uids:
+            structure = structures.get(uid, {}).get('BODYSTRUCTURE')
+            if not isinstance(structure, list):
+                full_messages.append(uid)
+                continue
+
+            for part, part_type, filename, encoding in iter_body_parts(structure):
+                if classify_attachment(part_type, filename) == content_type:
+                    parts.setdefault(part, []).append((uid, encoding))
+
+        failed = set()
+        for part, messages in parts.items():
+            encodings = {uid: encoding for uid, encoding in messages}
+            rv, data = imap.uid('FETCH', _to_message_set(encodings), '(UID BODY.PEEK[{}])'.format(part))
+            if rv != 'OK':
+                failed.update(encodings)
+                continue
+
+            fetched = set()
+            for uid, body in _get_fetched_bodies(data):
+                if uid not in encodings:
+                    continue
+                attachment = _decode_part(body, encodings[uid])
+                new_items.extend(self._parse_attachment(parser, attachment, provider))
+                fetched.add(uid)
+            failed.update(set(encodings) - fetched)
+
+        if failed:
+            logger.warning('Failed to fetch the attachments of the messages {}.'.format(
+                _to_message_set(sorted(failed))))
+
+        seen = [uid for uid in uids if uid not in full_messages and uid not in failed]
+        if full_messages:
+            seen.extend(self._ingest_full_messages(imap, full_messages, parser, provider, new_items))
+        return seen
+
+    def _ingest_full_messages(self, imap, uids, parser, provider, new_items):
+        content_type = PARSER_CONTENT_TYPES.get(getattr(parser, 'NAME', None))
+        seen = []
+        for uid in uids:
+            rv, data = imap.uid('FETCH', uid, '(RFC822)')
+            if rv == 'OK' and any(isinstance(response_part, tuple) for response_part in data):
+                try:
+                    logger.info('Ingesting events from email')
+                    for response_part in data:
+                        if isinstance(response_part, tuple):
+                            if isinstance(response_part[1], bytes):
+                                msg = email.message_from_bytes(response_part[1])
+                            else:
+                                msg = email.message_from_string(response_part[1])
+                            # this will loop through all the available multiparts in email
+                            for part in msg.walk():
+                                # parse attached files only
+                                if part.get('Content-Disposition') is None:
+                                    continue
+                                fileName = part.get_filename()
+                                if bool(fileName):
+                                    if content_type is None:
+                                        logger.warn('Ingesting events with unknown parser')
+                                        new_items.append(parser.parse(data, provider))
+                                        continue
+
+                                    # attachments are not decoded unless the parser supports them
+                                    if classify_attachment(part.get_content_type(), fileName) != content_type:
+                                        continue
+
+                                    attachment = part.get_payload(decode=True)
+                                    new_items.extend(self._parse_attachment(parser, attachment, provider))
+                    seen.append(uid)
+                except IngestEmailError:
+                    continue
+        return seen
+
+    def _parse_attachment(self, parser, attachment, provider):
+        """Parse the decoded content of an attachment, returning a list of lists of items"""
+        if isinstance(parser, NTBEventXMLFeedParser):
+            logger.info('Ingesting events with xml parser')
+        else:
+            logger.info('Ingesting events with ics parser')
+        return list(parser.parse_stream(io.BytesIO(attachment), provider))
 
     def prepare_href(self, href, mimetype=None):
         return url_for_media(href, mimetype)
+
+
+def classify_attachment(content_type, filename=None):
+    """Get the parser content type of an attachment from its MIME type or file extension
+
+    This avoids processing the attachments (PDFs, images...) which can't be parsed.
+
+    :param str content_type: MIME type of the attachment
+    :param str filename: file name of the attachment
+    :return str: 'text/calendar', 'text/xml' or None
+    """
+    classified = ATTACHMENT_CONTENT_TYPES.get((content_type or '').lower())
+    if classified is None and filename:
+        classified = ATTACHMENT_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    return classified
+
+
+def iter_body_parts(structure, prefix=''):
+    """Iterate over the leaf parts of a parsed BODYSTRUCTURE
+
+    :param list structure: BODYSTRUCTURE of a message, see `_parse_fetch_response`
+    :param str prefix: part number of the structure
+    :return generator: generator of (part number, content type, filename, encoding) tuples
+    """
+    if structure and isinstance(structure[0], list):
+        # multipart: the sub parts followed by the subtype and extension data
+        for index, sub_structure in enumerate(structure, start=1):
+            if not isinstance(sub_structure, list):
+                break
+            yield from iter_body_parts(sub_structure, '{}.{}'.format(prefix, index) if prefix else str(index))
+        return
+
+    if len(structure) < 7:
+        return
+
+    content_type = '{}/{}'.format(structure[0], structure[1]).lower()
+    params = _to_params(structure[2])
+    filename = params.get('name')
+    for extension in structure[7:]:
+        # the disposition is a list of its type and parameters
+        if isinstance(extension, list) and len(extension) == 2 and isinstance(extension[0], str) \
+                and extension[0].lower() in ('attachment', 'inline'):
+            filename = _to_params(extension[1]).get('filename') or filename
+            break
+
+    yield prefix or '1', content_type, filename, (structure[5] or '7bit').lower()
+
+
+_UID_RE = re.compile(r'\bUID (\d+)', re.IGNORECASE)
+_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}$|([^\s()"]+))')
+
+
+def _parse_fetch_response(data):
+    """Parse the data of a FETCH response into a dict of the fetched items keyed by message number
+
+    i.e. [b'1 (UID 5 BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 12 1))'] is parsed into
+    {'1': {'UID': '5', 'BODYSTRUCTURE': ['TEXT', 'PLAIN', None, None, None, '7BIT', '12', '1']}}
+    """
+    stack = [[]]
+    for response_part in data:
+        literal = None
+        if isinstance(response_part, tuple):
+            response_part, literal = response_part[0], response_part[1]
+
+        text = _to_str(response_part or '')
+        position = 0
+        while position < len(text):
+            match = _TOKEN_RE.match(text, position)
+            if not match or match.end() == position:
+                break
+            position = match.end()
+            opening, closing, quoted, literal_size, atom = match.groups()
+            if opening:
+                stack.append([])
+            elif closing:
+                if len(stack) > 1:
+                    value = stack.pop()
+                    stack[-1].append(value)
+            elif quoted is not None:
+                stack[-1].append(re.sub(r'\\(.)', r'\1', quoted))
+            elif literal_size is not None:
+                stack[-1].append(_to_str(literal or ''))
+                literal = None
+            elif atom is not None:
+                stack[-1].append(None if atom.upper() == 'NIL' else atom)
+
+    responses = {}
+    tokens = stack[0]
+    for num, items in zip(tokens[::2], tokens[1::2]):
+        if isinstance(items, list):
+            responses[num] = {
+                str(key).upper(): value for key, value in zip(items[::2], items[1::2])
+            }
+    return responses
+
+
+def _get_fetched_bodies(data):
+    """Get the (UID, body) pairs of a UID FETCH BODY[...] response, keeping the bodies as bytes
+
+    The UID is returned either before the body, i.e. (b'1 (UID 5 BODY[2] {12}', body), b')'
+    or after it, i.e. (b'1 (BODY[2] {12}', body), b' UID 5)'
+    """
+    pending = None
+    for response_part in data:
+        if isinstance(response_part, tuple):
+            body = response_part[1]
+            body = body if isinstance(body, bytes) else body.encode('utf-8')
+            uid = _get_uid(response_part[0])
+            if uid is not None:
+                yield uid, body
+                pending = None
+            else:
+                pending = body
+        elif pending is not None:
+            uid = _get_uid(response_part)
+            if uid is not None:
+                yield uid, pending
+            pending = None
+
+
+def _get_uid(response_part):
+    match = _UID_RE.search(_to_str(response_part or ''))
+    return match.group(1) if match else None
+
+
+def _decode_part(body, encoding):
+    if encoding == 'base64':
+        return base64.b64decode(body)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(body)
+    return body
+
+
+def _to_params(params):
+    if not isinstance(params, list):
+        return {}
+    return {str(key).lower(): value for key, value in zip(params[::2], params[1::2])}
+
+
+def _to_message_set(uids):
+    return ','.join(_to_str(uid) for uid in uids)
+
+
+def _to_str(value):
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else str(value)
@@ -1,9 +1,87 @@
 import imaplib
+import os
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
 from mock import Mock, patch
-from planning.feeding_services.event_email_service import EventEmailFeedingService
+from planning.feeding_services.event_email_service import EventEmailFeedingService, iter_body_parts, \
+    classify_attachment, _parse_fetch_response
+from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
 from planning.tests import TestCase
 
 
+class LocalIMAP(object):
+    """IMAP server stand-in, serving the messages as imaplib returns them"""
+
+    def __init__(self, messages, failing_parts=None):
+        # the UIDs differ from the sequence numbers
+        self.messages = {str(100 + num): (num, msg) for num, msg in enumerate(messages, start=1)}
+        self.failing_parts = failing_parts or []
+        self.commands = []
+
+    def login(self, user, password):
+        return 'OK', []
+
+    def select(self, mailbox, readonly=False):
+        return 'OK', [str(len(self.messages)).encode()]
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            return 'OK', [' '.join(self.messages).encode()]
+        if command == 'FETCH':
+            return self.fetch(*args)
+        if command == 'STORE':
+            return self.store(*args)
+        return 'NO', []
+
+    def fetch(self, message_set, message_parts):
+        self.commands.append(('FETCH', message_set, message_parts))
+        data = []
+        for uid in message_set.split(','):
+            num, msg = self.messages[uid]
+            if message_parts == '(UID BODYSTRUCTURE)':
+                data.append('{} (UID {} BODYSTRUCTURE {})'.format(num, uid, self._get_structure(msg)).encode())
+            elif message_parts == '(RFC822)':
+                body = msg.as_bytes()
+                data.extend([('{} (UID {} RFC822 {{{}}}'.format(num, uid, len(body)).encode(), body), b')'])
+            else:
+                part = message_parts[len('(UID BODY.PEEK['):-len('])')]
+                if part in self.failing_parts:
+                    return 'NO', [b'Failed to fetch']
+                body = msg.get_payload()[int(part) - 1].get_payload().encode()
+                # the UID is sent after the body
+                data.extend([('{} (BODY[{}] {{{}}}'.format(num, part, len(body)).encode(), body),
+                             ' UID {})'.format(uid).encode()])
+        return 'OK', data
+
+    def store(self, message_set, command, flags):
+        self.commands.append(('STORE', message_set, flags))
+        return 'OK', []
+
+    def close(self):
+        pass
+
+    def logout(self):
+        pass
+
+    def _get_structure(self, msg):
+        if msg.is_multipart():
+            return '({} "{}")'.format(''.join(self._get_structure(part) for part in msg.get_payload()),
+                                      msg.get_content_subtype().upper())
+
+        maintype, subtype = msg.get_content_maintype().upper(), msg.get_content_subtype().upper()
+        payload = msg.get_payload()
+        structure = '"{}" "{}" ("CHARSET" "utf-8") NIL NIL "{}" {}'.format(
+            maintype, subtype, msg.get('Content-Transfer-Encoding', '7bit').upper(), len(payload)
+        )
+        if maintype == 'TEXT':
+            structure += ' {}'.format(len(payload.splitlines()))
+        disposition = 'NIL'
+        if msg.get_filename():
+            disposition = '("ATTACHMENT" ("FILENAME" "{}"))'.format(msg.get_filename())
+        return '({} NIL {} NIL)'.format(structure, disposition)
+
+
 class EventEmailFeedingServiceTestCase(TestCase):
 
     def setUp(self):
@@ -29,8 +107,111 @@ class EventEmailFeedingServiceTestCase(TestCase):
             mock_imaplib.IMAP4_SSL.return_value = mock_conn
             mock_conn.login.return_value = ('OK', [])
             mock_conn.select.return_value = ('OK', [])
-            mock_conn.search.return_value = ('OK', ['(UNSEEN SUBJECT "test subject")'])
-            mock_conn.fetch.return_value = ('OK', [('1 (RFC822 {858569}', 'body of the message', ')')])
-            mock_conn.store.return_value = ('OK', [])
+            responses = {
+                'SEARCH': ('OK', [b'1']),
+                'FETCH': ('OK', [('1 (UID 1 RFC822 {858569}', 'body of the message', ')')]),
+                'STORE': ('OK', []),
+            }
+            mock_conn.uid.side_effect = lambda command, *args: responses[command]
             events = list(service._update(provider, None))
             self.assertEqual(len(events), 0)
+
+
+class EventEmailFeedingServiceBatchTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(os.path.dirname(__file__), '..', 'feed_parsers', 'events.ics'), 'rb') as f:
+            self.calendar = calendar = f.read()
+
+        invitation = MIMEMultipart()
+        invitation.attach(MIMEText('See the attached calendar'))
+        attachment = MIMEApplication(calendar, 'calendar', name='events.ics')
+        attachment.replace_header('Content-Type', 'text/calendar; name="events.ics"')
+        attachment.add_header('Content-Disposition', 'attachment', filename='events.ics')
+        invitation.attach(attachment)
+
+        document = MIMEMultipart()
+        document.attach(MIMEText('See the attached document'))
+        pdf = MIMEApplication(b'%PDF-1.4', 'pdf', name='document.pdf')
+        pdf.add_header('Content-Disposition', 'attachment', filename='document.pdf')
+        document.attach(pdf)
+
+        self.imap = LocalIMAP([invitation, document, invitation])
+        self.provider = {'feed_parser': 'ics20', 'config': {'server': 'localhost', 'mailbox': 'INBOX'}}
+
+    @patch('planning.feeding_services.event_email_service.imaplib')
+    def test_update_fetches_calendar_parts_in_batch(self, mock_imaplib):
+        mock_imaplib.IMAP4_SSL.return_value = self.imap
+        with self.app.app_context():
+            service = EventEmailFeedingService()
+            service.get_feed_parser = Mock(return_value=IcsTwoFeedParser())
+            batches = service._update(self.provider, {})
+            self.assertEqual(2, len(next(batches)))
+            self.assertEqual(2, len(next(batches)))
+            # the messages are only flagged as seen once their items are ingested
+            self.assertNotIn('STORE', [command[0] for command in self.imap.commands])
+            self.assertEqual([], list(batches))
+
+        self.assertEqual([
+            ('FETCH', '101,102,103', '(UID BODYSTRUCTURE)'),
+            ('FETCH', '101,103', '(UID BODY.PEEK[2])'),
+            ('STORE', '101,102,103', '\\Seen'),
+        ], self.imap.commands)
+        service.get_feed_parser.assert_called_once_with(self.provider)
+
+    @patch('planning.feeding_services.event_email_service.imaplib')
+    def test_update_keeps_unfetched_messages_unseen(self, mock_imaplib):
+        self.imap.failing_parts = ['2']
+        mock_imaplib.IMAP4_SSL.return_value = self.imap
+        with self.app.app_context():
+            service = EventEmailFeedingService()
+            service.get_feed_parser = Mock(return_value=IcsTwoFeedParser())
+            batches = list(service._update(self.provider, {}))
+
+        self.assertEqual([], batches)
+        # only the message without calendar is flagged as seen
+        self.assertEqual(('STORE', '102', '\\Seen'), self.imap.commands[-1])
+
+    def test_iter_body_parts(self):
+        structures = _parse_fetch_response([
+            b'1 (UID 4 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL)'
+            b'("TEXT" "CALENDAR" ("NAME" "invite.ics") NIL NIL "BASE64" 120 2 NIL NIL NIL) "MIXED"))',
+            (b'2 (BODYSTRUCTURE ("APPLICATION" "PDF" NIL NIL {8}', b'a "note"'),
+            b' "BASE64" 100 NIL ("ATTACHMENT" ("FILENAME" "doc.pdf")) NIL))'
+        ])
+
+        self.assertEqual('4', structures['1']['UID'])
+        self.assertEqual([
+            ('1', 'text/plain', None, '7bit'),
+            ('2', 'text/calendar', 'invite.ics', 'base64')
+        ], list(iter_body_parts(structures['1']['BODYSTRUCTURE'])))
+        self.assertEqual([
+            ('1', 'application/pdf', 'doc.pdf', 'base64')
+        ], list(iter_body_parts(structures['2']['BODYSTRUCTURE'])))
+
+    def test_classify_attachment(self):
+        self.assertEqual('text/calendar', classify_attachment('text/calendar'))
+        self.assertEqual('text/calendar', classify_attachment('application/octet-stream', 'Invite.ICS'))
+        self.assertEqual('text/xml', classify_attachment('application/xml', 'events'))
+        self.assertEqual('text/xml', classify_attachment('text/plain', 'events.xml'))
+        self.assertIsNone(classify_attachment('application/pdf', 'document.pdf'))
+        self.assertIsNone(classify_attachment('image/jpeg'))
+
+    @patch('planning.feeding_services.event_email_service.imaplib')
+    def test_update_full_messages(self, mock_imaplib):
+        invitation = MIMEMultipart()
+        attachment = MIMEApplication(self.calendar, 'octet-stream', name='invite.ics')
+        attachment.add_header('Content-Disposition', 'attachment', filename='invite.ics')
+        invitation.attach(attachment)
+        imap = LocalIMAP([invitation])
+        mock_imaplib.IMAP4_SSL.return_value = imap
+
+        with self.app.app_context():
+            service = EventEmailFeedingService()
+            new_items = []
+            seen = service._ingest_full_messages(imap, ['101'], IcsTwoFeedParser(), self.provider, new_items)
+
+        self.assertEqual(['101'], seen)
+        self.assertEqual(1, len(new_items))
+        self.assertEqual(2, len(new_items[0]))
@@ -10,20 +10,29 @@
 
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
 
-from xml.etree import ElementTree
+from flask import Flask, current_app as app
 from superdesk.errors import ParserError, ProviderError
 from superdesk.io.feeding_services.file_service import FileFeedingService
 from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
+from planning.locations import resolve_ingest_locations
+from planning.common import get_file_ingest_workers, get_ingest_batch_size
 from superdesk.notification import push_notification
 from superdesk.utc import utc
 from superdesk.utils import get_sorted_files, FileSortAttributes
-from icalendar import Calendar
 
 logger = logging.getLogger(__name__)
 
+# app of the worker process, created with the config of the first parsed file
+_worker_app = None
+
+# config read by the NTB event XML parser, the only values sent to the worker processes
+WORKER_CONFIG_KEYS = ['SERVER_DOMAIN', 'GENERATE_SHORT_GUID', 'PLANNING_INGEST_BATCH_SIZE']
+
 
 class EventFileFeedingService(FileFeedingService):
     """
@@ -46,6 +55,18 @@ class EventFileFeedingService(FileFeedingService):
     """
     service = 'events'
 
+    """
+    Names of the files to ingest, set when the files are queued by the folder watcher.
+    All the files of the folder are ingested if None.
+    """
+    filenames = None
+
+    def update(self, provider, update):
+        for items in super().update(provider, update):
+            # the locations are resolved for the whole batch, before the events are saved
+            resolve_ingest_locations(items, provider)
+            yield items
+
     def _update(self, provider, update):
         self.provider = provider
         self.path = provider.get('config', {}).get('path', None)
@@ -56,7 +77,13 @@ class EventFileFeedingService(FileFeedingService):
             return []
 
         registered_parser = self.get_feed_parser(provider)
-        for filename in get_sorted_files(self.path, sort_by=FileSortAttributes.created):
+        workers = get_file_ingest_workers()
+        if workers and isinstance(registered_parser, NTBEventXMLFeedParser):
+            yield from self._update_parallel(provider, workers)
+            push_notification('ingest:update')
+            return
+
+        for filename in self._get_files():
             try:
                 last_updated = None
                 file_path = os.path.join(self.path, filename)
@@ -64,19 +91,25 @@ class EventFileFeedingService(FileFeedingService):
                     stat = os.lstat(file_path)
                     last_updated = datetime.fromtimestamp(stat.st_mtime, tz=utc)
 
-                    if self.is_latest_content(last_updated, provider.get('last_updated')):
+                    if self._is_new_file(last_updated, provider):
                         if isinstance(registered_parser, NTBEventXMLFeedParser):
                             logger.info('Ingesting xml events')
+                            # the events of a container document are ingested in batches
                             with open(file_path, 'rb') as f:
-                                xml = ElementTree.parse(f)
-                                parser = self.get_feed_parser(provider, xml.getroot())
-                                item = parser.parse(xml.getroot(), provider)
+                                for items in registered_parser.parse_stream(f, provider):
+                                    self.after_extracting(items, provider)
+                                    yield items
+                            self.move_file(self.path, filename, provider=provider, success=True)
+                            continue
                         elif isinstance(registered_parser, IcsTwoFeedParser):
                             logger.info('Ingesting ics events')
+                            # events are ingested in batches while the file is read
                             with open(file_path, 'rb') as f:
-                                cal = Calendar.from_ical(f.read())
-                                parser = self.get_feed_parser(provider, cal)
-                                item = parser.parse(cal, provider)
+                                for items in registered_parser.parse_stream(f, provider):
+                                    self.after_extracting(items, provider)
+                                    yield items
+                            self.move_file(self.path, filename, provider=provider, success=True)
+                            continue
                         else:
                             logger.info('Ingesting events with unknown parser')
                             parser = self.get_feed_parser(provider, file_path)
@@ -97,3 +130,104 @@ class EventFileFeedingService(FileFeedingService):
                 raise ParserError.parseFileError('{}-{}'.format(provider['name'], self.NAME), filename, ex, provider)
 
         push_notification('ingest:update')
+
+    def _get_files(self):
+        if self.filenames is not None:
+            return self.filenames
+        return get_sorted_files(self.path, sort_by=FileSortAttributes.created)
+
+    def _is_new_file(self, last_updated, provider):
+        """Test if a file has to be ingested
+
+        The files queued by the folder watcher were just written so they are always ingested,
+        even if their modification time is older than the last update of the provider (i.e. copied
+        with their original time). Otherwise only the files modified since the last update are.
+        """
+        return self.filenames is not None or self.is_latest_content(last_updated, provider.get('last_updated'))
+
+    def _update_parallel(self, provider, workers):
+        """Parse the queued NTB event XML files in a pool of processes
+
+        The files are parsed in their sorted order and the events are yielded in batches of
+        PLANNING_INGEST_BATCH_SIZE items, moving the files once their batch is ingested.
+        A file which can't be parsed is moved to the error folder instead of stopping the update.
+        """
+        file_paths = []
+        for filename in self._get_files():
+            file_path = os.path.join(self.path, filename)
+            if not os.path.isfile(file_path):
+                continue
+
+            last_updated = datetime.fromtimestamp(os.lstat(file_path).st_mtime, tz=utc)
+            if self._is_new_file(last_updated, provider):
+                file_paths.append((filename, file_path))
+            else:
+                self.move_file(self.path, filename, provider=provider, success=True)
+
+        if not file_paths:
+            return
+
+        logger.info('Ingesting xml events from {} files with {} workers'.format(len(file_paths), workers))
+        batch_size = get_ingest_batch_size()
+        parse_event_file = partial(_parse_event_file, get_worker_config())
+        items = []
+        parsed_files = []
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map keeps the order of the files, whichever worker finishes first
+            results = executor.map(parse_event_file, [path for _, path in file_paths],
+                                   chunksize=max(1, len(file_paths) // (workers * 4)))
+            for (filename, _), (parsed, error) in zip(file_paths, results):
+                if error is not None:
+                    logger.error('Failed to parse the file {} of the provider {}: {}'.format(
+                        filename, provider.get('name'), error))
+                    self.move_file(self.path, filename, provider=provider, success=False)
+                    continue
+
+                items.extend(parsed)
+                parsed_files.append(filename)
+                if len(items) >= batch_size:
+                    yield from self._yield_parsed_files(provider, items, parsed_files)
+                    items, parsed_files = [], []
+
+        if items or parsed_files:
+            yield from self._yield_parsed_files(provider, items, parsed_files)
+
+    def _yield_parsed_files(self, provider, items, filenames):
+        if items:
+            self.after_extracting(items, provider)
+            yield items
+
+        for filename in filenames:
+            self.move_file(self.path, filename, provider=provider, success=True)
+
+
+def get_worker_config():
+    """Get the app config sent to the worker processes, limited to the WORKER_CONFIG_KEYS"""
+    return {key: app.config[key] for key in WORKER_CONFIG_KEYS if key in app.config}
+
+
+def _push_worker_app(config):
+    """Push an app context in the worker process, the parser uses the app config i.e. to generate guids"""
+    global _worker_app
+    if _worker_app is None:
+        _worker_app = Flask(__name__)
+        _worker_app.config.update(config)
+        _worker_app.app_context().push()
+
+
+def _parse_event_file(config, file_path):
+    """Parse an NTB event XML file in a worker process
+
+    Errors are returned instead of raised, so one broken file doesn't stop the others.
+
+    :param dict config: app config, see `get_worker_config`
+    :param str file_path: path of the file
+    :return tuple: (list of items, None) or (None, error message)
+    """
+    try:
+        _push_worker_app(config)
+        with open(file_path, 'rb') as f:
+            return [item for items in NTBEventXMLFeedParser().parse_stream(f) for item in items], None
+    except Exception as ex:
+        return None, '{}: {}'.format(type(ex).__name__, ex)
@@ -1,11 +1,26 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
 from mock import patch
-from planning.feeding_services.event_file_service import EventFileFeedingService
+from superdesk.utc import utcnow
+from planning.feeding_services.event_file_service import EventFileFeedingService, get_worker_config
+from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.tests import TestCase
 
 
-os = object()
 get_sorted_files = object()
 
+NTB_EVENT_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<document>
+<guid>{guid}</guid>
+<title>{title}</title>
+<location>Oslo</location>
+<timeStart>2016-09-05T09:00:00</timeStart>
+<timeEnd>2016-09-05T16:00:00</timeEnd>
+<content>Content</content>
+</document>"""
+
 
 class EventFileFeedingServiceTestCase(TestCase):
 
@@ -29,3 +44,74 @@ class EventFileFeedingServiceTestCase(TestCase):
 
             events = list(service._update(provider, None))
             self.assertEqual(len(events), 0)
+
+    def test_update_parallel(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for index in range(5):
+            with open(os.path.join(path, 'event{}.xml'.format(index)), 'w') as f:
+                if index == 2:
+                    f.write('<document><title>broken')
+                else:
+                    f.write(NTB_EVENT_XML.format(guid='event{}'.format(index), title='Event {}'.format(index)))
+
+        service = EventFileFeedingService()
+        provider = {'name': 'files', 'feed_parser': 'ntb_event_xml', 'config': {'path': path}}
+        self.app.config['PLANNING_FILE_INGEST_WORKERS'] = 2
+        self.app.config['PLANNING_INGEST_BATCH_SIZE'] = 3
+
+        with self.app.app_context(), \
+                patch.object(service, 'get_feed_parser', return_value=NTBEventXMLFeedParser()), \
+                patch('planning.feeding_services.event_file_service.get_sorted_files',
+                      return_value=['event{}.xml'.format(index) for index in range(5)]), \
+                patch('planning.feeding_services.event_file_service.push_notification'):
+            batches = list(service._update(provider, {}))
+
+        # the broken file doesn't stop the update, and the order of the files is kept
+        self.assertEqual(
+            [[item['guid'] for item in items] for items in batches],
+            [['event0', 'event1', 'event3'], ['event4']]
+        )
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(path, '_PROCESSED'))),
+            ['event0.xml', 'event1.xml', 'event3.xml', 'event4.xml']
+        )
+        self.assertEqual(os.listdir(os.path.join(path, '_ERROR')), ['event2.xml'])
+        self.assertEqual(sorted(os.listdir(path)), ['_ERROR', '_PROCESSED'])
+
+    def test_get_worker_config(self):
+        self.app.config['PLANNING_INGEST_BATCH_SIZE'] = 3
+        self.app.config['SERVER_DOMAIN'] = 'example.com'
+        self.app.config['SECRET_KEY'] = 'secret'
+
+        with self.app.app_context():
+            config = get_worker_config()
+
+        # only the config read by the parser is sent to the worker processes
+        self.assertEqual(3, config['PLANNING_INGEST_BATCH_SIZE'])
+        self.assertEqual('example.com', config['SERVER_DOMAIN'])
+        self.assertNotIn('SECRET_KEY', config)
+
+    def test_update_queued_files(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for index in range(3):
+            with open(os.path.join(path, 'event{}.xml'.format(index)), 'w') as f:
+                f.write(NTB_EVENT_XML.format(guid='event{}'.format(index), title='Event {}'.format(index)))
+
+        service = EventFileFeedingService()
+        service.filenames = ['event2.xml', 'event0.xml', 'missing.xml']
+        # the queued files are ingested even if modified before the last update
+        provider = {'name': 'files', 'feed_parser': 'ntb_event_xml', 'config': {'path': path},
+                    'last_updated': utcnow() + timedelta(minutes=5)}
+
+        with self.app.app_context(), \
+                patch.object(service, 'get_feed_parser', return_value=NTBEventXMLFeedParser()), \
+                patch('planning.feeding_services.event_file_service.get_sorted_files') as get_sorted_files, \
+                patch('planning.feeding_services.event_file_service.push_notification'):
+            batches = list(service._update(provider, {}))
+
+        # only the queued files are ingested, without listing the folder
+        self.assertFalse(get_sorted_files.called)
+        self.assertEqual([[item['guid'] for item in items] for items in batches], [['event2'], ['event0']])
+        self.assertEqual(sorted(os.listdir(path)), ['_ERROR', '_PROCESSED', 'event1.xml'])
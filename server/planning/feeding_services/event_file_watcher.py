@@ -0,0 +1,114 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+# struct inotify_event: wd, mask, cookie, len, followed by the name
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return _libc
+
+
+def is_inotify_supported():
+    """Test if the file watcher can be used on this platform (Linux only)"""
+    try:
+        return hasattr(_get_libc(), 'inotify_init1')
+    except OSError:
+        return False
+
+
+class InotifyWatcher:
+    """Watch a folder for the files written or moved into it
+
+    Only the files which were closed after writing (or moved in once complete) are reported,
+    so a file is never picked while still being copied into the folder.
+    Hidden files are ignored, as they are usually written before being renamed.
+    """
+
+    def __init__(self, path):
+        if not is_inotify_supported():
+            raise OSError('inotify is not supported on this platform')
+
+        libc = _get_libc()
+        self.path = path
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'Failed to initialise inotify')
+
+        if libc.inotify_add_watch(self._fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, 'Failed to watch {}'.format(path))
+
+    def read(self, timeout=None):
+        """Wait for files to be written into the folder
+
+        :param float timeout: seconds to wait for an event, None to wait forever
+        :return: list of file names in the order of the events, or None if events were lost
+            and the folder must be scanned again
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        filenames = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning('Events were lost watching {}'.format(self.path))
+                return None
+
+            if name and not name.startswith(b'.') and not mask & IN_ISDIR:
+                filename = os.fsdecode(name)
+                if filename not in filenames:
+                    filenames.append(filename)
+        return filenames
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+import unittest
+from planning.feeding_services.event_file_watcher import InotifyWatcher, is_inotify_supported
+from planning.tests import TestCase
+
+
+@unittest.skipUnless(is_inotify_supported(), 'inotify is not supported')
+class InotifyWatcherTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_read(self):
+        with InotifyWatcher(self.path) as watcher:
+            self.assertEqual(watcher.read(timeout=0), [])
+
+            with open(os.path.join(self.path, 'event1.xml'), 'w') as f:
+                f.write('<document/>')
+            # files moved into the folder once complete, the hidden file being ignored
+            with open(os.path.join(self.path, '.event2.xml'), 'w') as f:
+                f.write('<document/>')
+            os.rename(os.path.join(self.path, '.event2.xml'), os.path.join(self.path, 'event2.xml'))
+            os.mkdir(os.path.join(self.path, '_PROCESSED'))
+
+            self.assertEqual(watcher.read(timeout=1), ['event1.xml', 'event2.xml'])
+            self.assertEqual(watcher.read(timeout=0), [])
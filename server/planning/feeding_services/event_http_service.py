@@ -9,18 +9,71 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 import datetime
+import hashlib
 import requests
+import tempfile
+import threading
+import time
 import traceback
+from urllib.parse import urlparse
 
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from superdesk.io.feeding_services.http_service import HTTPFeedingService
 from superdesk.errors import IngestApiError
 from superdesk.logging import logger
+from superdesk.stats import stats
 from superdesk.utc import utcnow
 from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
+from planning.locations import resolve_ingest_locations
 from flask import current_app as app
-from icalendar import Calendar
+from eve.utils import config
+
+# size of the chunks read from streamed responses
+CHUNK_SIZE = 64 * 1024
+
+# responses bigger than this are downloaded to a temporary file instead of memory
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+# provider field storing the validators and content hash of the last update
+HTTP_CACHE = 'http_cache'
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 15)
+
+# number of hosts to keep a connection pool for, and of connections kept per host,
+# a host being updated from at most POOL_MAXSIZE threads at once without opening new connections
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+
+# failed requests are retried after 0.5s, 1s, 2s
+RETRIES = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(url):
+    """Get the session used by the event HTTP providers for the host of the url
+
+    Sessions are kept for the lifetime of the process, whatever thread updates the provider,
+    so connections are kept alive between the updates of the providers,
+    and failed requests are retried with an exponential backoff.
+    Each host gets its own session, the connection pool of its adapter being thread safe,
+    and the lock only guards the creation of the sessions.
+    """
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                                  max_retries=RETRIES)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+    return session
 
 
 class EventHTTPFeedingService(HTTPFeedingService):
@@ -43,6 +96,12 @@ class EventHTTPFeedingService(HTTPFeedingService):
     """
     service = 'events'
 
+    def update(self, provider, update):
+        for items in super().update(provider, update):
+            # the locations are resolved for the whole batch, before the events are saved
+            resolve_ingest_locations(items, provider)
+            yield items
+
     def _update(self, provider, update):
         updated = utcnow()
 
@@ -61,13 +120,82 @@ class EventHTTPFeedingService(HTTPFeedingService):
         payload = {}
 
         parser = self.get_feed_parser(provider)
-
+        http_cache = provider.get(HTTP_CACHE) or {}
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as content:
+            fetched = self._fetch(payload, http_cache, content)
+            if fetched is None:
+                logger.info('Events from %s not modified', self.URL)
+                return
+
+            # persisted with the provider once all the events are ingested
+            headers, content_hash = fetched
+            new_http_cache = {
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_hash': content_hash
+            }
+
+            if http_cache.get('content_hash') == new_http_cache['content_hash']:
+                logger.info('Events from %s not changed', self.URL)
+                if update is not None:
+                    update[HTTP_CACHE] = new_http_cache
+                return
+
+            logger.info('Ingesting events from %s', self.URL)
+            content.seek(0)
+
+            if isinstance(parser, IcsTwoFeedParser):
+                yield from parser.parse_stream(content, provider)
+            elif isinstance(parser, NTBEventXMLFeedParser):
+                yield from parser.parse_stream(content, provider)
+            else:
+                items = parser.parser(content.read())
+
+                if isinstance(items, list):
+                    yield items
+                else:
+                    yield [items]
+
+        if update is not None:
+            update[HTTP_CACHE] = new_http_cache
+
+    def _fetch(self, payload, http_cache, content):
+        """Download the feed into `content`, unless it was not modified since the last update
+
+        The validators from the previous update are sent along with the request, and the
+        downloaded content is hashed so an unchanged feed can be detected without parsing it.
+
+        :param dict payload: request parameters
+        :param dict http_cache: ETag, Last-Modified and content hash of the previous update
+        :param content: file object to write the content to
+        :return tuple: response headers and content hash, or None if the server returned 304 Not Modified
+        """
+        headers = {'Accept-Encoding': 'gzip, deflate'}
+        if http_cache.get('etag'):
+            headers['If-None-Match'] = http_cache['etag']
+        if http_cache.get('last_modified'):
+            headers['If-Modified-Since'] = http_cache['last_modified']
+
+        started = time.time()
         try:
-            response = requests.get(self.URL, params=payload, timeout=15)
-            # TODO: check if file has been updated since provider last_updated
-            # although some ptovider do not include 'Last-Modified' in headers
-            # so unsure how to do this
-            logger.info('Http Headers: %s', response.headers)
+            response = get_http_session(self.URL).get(self.URL, params=payload, headers=headers, timeout=TIMEOUT,
+                                                      stream=True)
+            logger.debug('Http Headers: %s', response.headers)
+
+            if response.status_code == 304:
+                response.close()
+                return None
+
+            if response.status_code == 404:
+                response.close()
+                raise LookupError('Not found %s' % payload)
+
+            # gzip and deflate encodings are decoded by requests while iterating
+            content_hash = hashlib.sha1()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                content_hash.update(chunk)
+                content.write(chunk)
         except requests.exceptions.Timeout as ex:
             # Maybe set up for a retry, or continue in a retry loop
             raise IngestApiError.apiTimeoutError(ex, self.provider)
@@ -77,25 +205,19 @@ class EventHTTPFeedingService(HTTPFeedingService):
         except requests.exceptions.RequestException as ex:
             # catastrophic error. bail.
             raise IngestApiError.apiRequestError(ex, self.provider)
+        except LookupError:
+            raise
         except Exception as error:
             traceback.print_exc()
             raise IngestApiError.apiGeneralError(error, self.provider)
 
-        if response.status_code == 404:
-            raise LookupError('Not found %s' % payload)
+        finally:
+            self._record_fetch_time(time.time() - started)
 
-        logger.info('Ingesting: %s', str(response.content))
+        return response.headers, content_hash.hexdigest()
 
-        if isinstance(parser, NTBEventXMLFeedParser):
-            xml = ET.fromstring(response.content)
-            items = parser.parse(xml, provider)
-        elif isinstance(parser, IcsTwoFeedParser):
-            cal = Calendar.from_ical(response.content)
-            items = parser.parse(cal, provider)
-        else:
-            items = parser.parser(response.content)
-
-        if isinstance(items, list):
-            yield items
-        else:
-            yield [items]
+    def _record_fetch_time(self, duration):
+        logger.info('Fetched events from %s in %.3fs', self.URL, duration)
+        if self.provider.get(config.ID_FIELD):
+            stats.timing('planning.ingest.event_http.{}.fetch'.format(self.provider[config.ID_FIELD]),
+                         int(duration * 1000))
@@ -1,7 +1,51 @@
-from planning.feeding_services.event_http_service import EventHTTPFeedingService
+import gzip
+import os
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from planning.feeding_services.event_http_service import EventHTTPFeedingService, HTTP_CACHE, get_http_session
 from planning.tests import TestCase
 
 
+class EventsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class EventsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the events.ics test calendar, supporting ETag and gzip"""
+
+    protocol_version = 'HTTP/1.1'
+    etag = '"v1"'
+    requests = []
+    connections = set()
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        self.connections.add(self.client_address)
+        if self.etag and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        with open(os.path.join(os.path.dirname(__file__), '..', 'feed_parsers', 'events.ics'), 'rb') as f:
+            body = f.read()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar')
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
 class EventHTTPFeedingServiceTestCase(TestCase):
 
     def setUp(self):
@@ -34,3 +78,88 @@ class EventHTTPFeedingServiceTestCase(TestCase):
             }
             events = list(service._update(provider, None))
             self.assertEqual(len(events), 1)
+
+
+class EventHTTPFeedingServiceConditionalTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        EventsRequestHandler.etag = '"v1"'
+        EventsRequestHandler.requests = []
+        EventsRequestHandler.connections = set()
+        self.server = EventsServer(('127.0.0.1', 0), EventsRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.provider = {
+            'feed_parser': 'ics20',
+            'config': {'url': 'http://127.0.0.1:{}/events.ics'.format(self.server.server_port)}
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_update_not_modified(self):
+        with self.app.app_context():
+            update = {}
+            events = list(EventHTTPFeedingService()._update(self.provider, update))
+            self.assertEqual(1, len(events))
+            self.assertEqual(2, len(events[0]))
+            self.assertIn('gzip', EventsRequestHandler.requests[0]['Accept-Encoding'])
+            self.assertEqual('"v1"', update[HTTP_CACHE]['etag'])
+            self.assertTrue(update[HTTP_CACHE]['content_hash'])
+
+            self.provider[HTTP_CACHE] = update[HTTP_CACHE]
+            update = {}
+            events = list(EventHTTPFeedingService()._update(self.provider, update))
+            self.assertEqual([], events)
+            self.assertEqual('"v1"', EventsRequestHandler.requests[1]['If-None-Match'])
+            self.assertNotIn(HTTP_CACHE, update)
+
+    def test_update_same_content(self):
+        with self.app.app_context():
+            EventsRequestHandler.etag = None
+
+            update = {}
+            events = list(EventHTTPFeedingService()._update(self.provider, update))
+            self.assertEqual(1, len(events))
+
+            self.provider[HTTP_CACHE] = update[HTTP_CACHE]
+            update = {}
+            events = list(EventHTTPFeedingService()._update(self.provider, update))
+            self.assertEqual([], events)
+            self.assertEqual(self.provider[HTTP_CACHE]['content_hash'], update[HTTP_CACHE]['content_hash'])
+
+    def test_update_without_provider_update(self):
+        with self.app.app_context():
+            EventsRequestHandler.etag = None
+            update = {}
+            self.assertEqual(1, len(list(EventHTTPFeedingService()._update(self.provider, update))))
+            self.assertEqual(1, len(list(EventHTTPFeedingService()._update(self.provider, None))))
+
+            # unchanged content
+            self.provider[HTTP_CACHE] = update[HTTP_CACHE]
+            self.assertEqual([], list(EventHTTPFeedingService()._update(self.provider, None)))
+
+    def test_http_session_is_shared(self):
+        url = self.provider['config']['url']
+        session = get_http_session(url)
+        self.assertIs(session, get_http_session(url))
+
+        # the session outlives the thread which created it, another host gets its own
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(get_http_session(url)))
+        thread.start()
+        thread.join()
+        self.assertIs(session, sessions[0])
+        self.assertIsNot(session, get_http_session('http://other.example.com/events.ics'))
+
+        self.assertEqual(3, session.get_adapter(url).max_retries.total)
+
+        with self.app.app_context():
+            list(EventHTTPFeedingService()._update(self.provider, {}))
+            list(EventHTTPFeedingService()._update(self.provider, {}))
+
+        # the connection is kept alive between the updates
+        self.assertEqual(2, len(EventsRequestHandler.requests))
+        self.assertEqual(1, len(EventsRequestHandler.connections))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Superdesk Planning geo search"""
+
+import superdesk
+import logging
+from superdesk import get_resource_service
+from superdesk.errors import SuperdeskApiError
+from superdesk.utc import get_date
+from planning.common import WORKFLOW_STATE
+
+logger = logging.getLogger(__name__)
+
+# geo_point field searched for each repo
+GEO_FIELDS = {
+    'events': 'location.location',
+    'locations': 'geo_location',
+}
+
+DEFAULT_MAX_RESULTS = 200
+MAX_RESULTS = 1000
+
+
+class PlanningGeoSearchService(superdesk.Service):
+    """Search the events or locations around a point or within a bounding box
+
+    The search runs as a single elastic query, so the map views only download the items they show.
+
+    Request arguments:
+
+    - repo: `events` (default) or `locations`
+    - lat, lon and distance (in km): items within distance of the point, sorted by distance
+    - bbox: `top,left,bottom,right` coordinates of the bounding box
+    - start_date and end_date: events occurring within this date range
+    - state: comma separated workflow states of the events, all but spiked if not set
+    - max_results: maximum number of items returned (default 200, up to 1000)
+    """
+
+    def get(self, req, lookup):
+        args = req.args if req is not None and req.args else {}
+        repo = args.get('repo') or 'events'
+        if repo not in GEO_FIELDS:
+            raise SuperdeskApiError.badRequestError('Invalid repo {}'.format(repo))
+
+        source = get_geo_search_query(
+            GEO_FIELDS[repo],
+            lat=args.get('lat'),
+            lon=args.get('lon'),
+            distance=args.get('distance'),
+            bbox=args.get('bbox'),
+            start_date=args.get('start_date') if repo == 'events' else None,
+            end_date=args.get('end_date') if repo == 'events' else None,
+            states=[state for state in (args.get('state') or '').split(',') if state] if repo == 'events' else None,
+            exclude_spiked=repo == 'events',
+            max_results=args.get('max_results')
+        )
+        return get_resource_service(repo).search(source)
+
+
+def get_geo_search_query(field, lat=None, lon=None, distance=None, bbox=None, start_date=None, end_date=None,
+                         states=None, exclude_spiked=False, max_results=None):
+    """Get the elastic query of a geo search
+
+    :param str field: geo_point field
+    :param lat: latitude of the point
+    :param lon: longitude of the point
+    :param distance: distance from the point, in km
+    :param str bbox: top,left,bottom,right coordinates of the bounding box
+    :param start_date: start of the date range of the events
+    :param end_date: end of the date range of the events
+    :param list states: workflow states of the items
+    :param bool exclude_spiked: leave the spiked items out, if no states are given
+    :param max_results: maximum number of items
+    :return dict: elastic query source
+    """
+    if (lat is None or lon is None or distance is None) and not bbox:
+        raise SuperdeskApiError.badRequestError('Either lat, lon and distance or bbox are required')
+
+    filters = []
+    must_not = []
+    sort = []
+    if states:
+        filters.append({'terms': {'state': states}})
+    elif exclude_spiked:
+        must_not.append({'term': {'state': WORKFLOW_STATE.SPIKED}})
+
+    try:
+        if lat is not None and lon is not None and distance is not None:
+            point = {'lat': float(lat), 'lon': float(lon)}
+            filters.append({'geo_distance': {'distance': '{}km'.format(float(distance)), field: point}})
+            sort.append({'_geo_distance': {field: point, 'order': 'asc', 'unit': 'km'}})
+        else:
+            top, left, bottom, right = [float(coordinate) for coordinate in bbox.split(',')]
+            filters.append({'geo_bounding_box': {field: {
+                'top_left': {'lat': top, 'lon': left},
+                'bottom_right': {'lat': bottom, 'lon': right}
+            }}})
+
+        if start_date:
+            filters.append({'range': {'dates.end': {'gte': get_date(start_date).isoformat()}}})
+        if end_date:
+            filters.append({'range': {'dates.start': {'lte': get_date(end_date).isoformat()}}})
+
+        size = min(int(max_results or DEFAULT_MAX_RESULTS), MAX_RESULTS)
+    except Exception:
+        raise SuperdeskApiError.badRequestError('Invalid geo search arguments')
+
+    query = {'filter': filters}
+    if must_not:
+        query['must_not'] = must_not
+    source = {
+        'query': {'bool': query},
+        'size': size,
+    }
+    if sort:
+        source['sort'] = sort
+    return source
+
+
+class PlanningGeoSearchResource(superdesk.Resource):
+    endpoint_name = 'planning_geo_search'
+    url = 'planning_geo_search'
+    schema = {}
+    resource_methods = ['GET']
+    item_methods = []
+    datasource = {
+        'source': 'events',
+        'search_backend': 'elastic'
+    }
@@ -0,0 +1,45 @@
+from superdesk.errors import SuperdeskApiError
+from planning.geo_search import get_geo_search_query
+from planning.tests import TestCase
+
+
+class GeoSearchTestCase(TestCase):
+
+    def test_distance_query(self):
+        source = get_geo_search_query('location.location', lat='59.91', lon='10.75', distance='5',
+                                      start_date='2017-06-01T00:00:00+0000', end_date='2017-06-30T00:00:00+0000')
+        point = {'lat': 59.91, 'lon': 10.75}
+        self.assertEqual(200, source['size'])
+        self.assertEqual([{'_geo_distance': {'location.location': point, 'order': 'asc', 'unit': 'km'}}],
+                         source['sort'])
+        self.assertEqual([
+            {'geo_distance': {'distance': '5.0km', 'location.location': point}},
+            {'range': {'dates.end': {'gte': '2017-06-01T00:00:00+00:00'}}},
+            {'range': {'dates.start': {'lte': '2017-06-30T00:00:00+00:00'}}},
+        ], source['query']['bool']['filter'])
+        self.assertNotIn('must_not', source['query']['bool'])
+
+    def test_spiked_events(self):
+        source = get_geo_search_query('location.location', bbox='60,10,59,11', exclude_spiked=True)
+        self.assertEqual([{'term': {'state': 'spiked'}}], source['query']['bool']['must_not'])
+
+        # the spiked events are only returned if asked for
+        source = get_geo_search_query('location.location', bbox='60,10,59,11', exclude_spiked=True,
+                                      states=['spiked'])
+        self.assertNotIn('must_not', source['query']['bool'])
+        self.assertEqual({'terms': {'state': ['spiked']}}, source['query']['bool']['filter'][0])
+
+    def test_bounding_box_query(self):
+        source = get_geo_search_query('geo_location', bbox='60,10,59,11', max_results=5000)
+        self.assertEqual(1000, source['size'])
+        self.assertNotIn('sort', source)
+        self.assertEqual([{'geo_bounding_box': {'geo_location': {
+            'top_left': {'lat': 60.0, 'lon': 10.0},
+            'bottom_right': {'lat': 59.0, 'lon': 11.0}
+        }}}], source['query']['bool']['filter'])
+
+    def test_invalid_query(self):
+        with self.assertRaises(SuperdeskApiError):
+            get_geo_search_query('geo_location', lat='59.91', lon='10.75')
+        with self.assertRaises(SuperdeskApiError):
+            get_geo_search_query('geo_location', bbox='60,10,59')
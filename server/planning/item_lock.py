@@ -12,7 +12,7 @@ import logging
 import superdesk
 
 from superdesk.errors import SuperdeskApiError
-from superdesk.notification import push_notification
+from .notifications import push_notification
 from superdesk.users.services import current_user_has_privilege
 from superdesk.utc import utcnow
 from superdesk.lock import lock, unlock
@@ -10,12 +10,79 @@
 
 import superdesk
 import logging
+import re
+from copy import deepcopy
+from datetime import timedelta
+from eve.utils import config
+from eve.methods.common import resolve_document_etag
+from flask import current_app as app
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from superdesk.metadata.utils import generate_guid
 from superdesk.metadata.item import GUID_NEWSML
+from superdesk.utc import utcnow
+from superdesk.utils import ListCursor
 from apps.archive.common import set_original_creator
 
 logger = logging.getLogger(__name__)
 
+# the ingest locations index is fully reloaded after this delay, to drop the deleted locations
+LOCATIONS_INDEX_TTL = timedelta(minutes=10)
+
+# in-memory index of the locations keyed by normalised name, used to resolve the ingested locations
+_locations_index = {'expiry': None, 'updated': None, 'locations': {}}
+
+_NAME_SEPARATORS_RE = re.compile(r'[^\w]+')
+
+# mongo error code of the inserts violating a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+# typeahead results are cached per query for this delay
+TYPEAHEAD_CACHE_TTL = timedelta(seconds=30)
+TYPEAHEAD_CACHE_SIZE = 1000
+TYPEAHEAD_MAX_RESULTS = 10
+
+# fields of the locations returned by the typeahead
+TYPEAHEAD_FIELDS = ['guid', 'name', 'unique_name', 'type', 'position', 'address.locality', 'address.area',
+                    'address.country']
+
+# (query, size) -> (expiry, locations)
+_typeahead_cache = {}
+
+# elastic analysis used by the typeahead, matching the start of each word of the indexed names
+TYPEAHEAD_ANALYSIS = {
+    'filter': {
+        'planning_edge_ngram': {
+            'type': 'edge_ngram',
+            'min_gram': 1,
+            'max_gram': 20
+        }
+    },
+    'analyzer': {
+        'planning_typeahead': {
+            'type': 'custom',
+            'tokenizer': 'standard',
+            'filter': ['lowercase', 'asciifolding', 'planning_edge_ngram']
+        },
+        'planning_typeahead_search': {
+            'type': 'custom',
+            'tokenizer': 'standard',
+            'filter': ['lowercase', 'asciifolding']
+        }
+    }
+}
+
+typeahead_mapping = {
+    'type': 'string',
+    'fields': {
+        'typeahead': {
+            'type': 'string',
+            'analyzer': 'planning_typeahead',
+            'search_analyzer': 'planning_typeahead_search'
+        }
+    }
+}
+
 not_analyzed = {'type': 'string', 'index': 'not_analyzed'}
 not_indexed = {'type': 'string', 'index': 'no'}
 venue_types = {
@@ -31,6 +98,96 @@ class LocationsService(superdesk.Service):
         for doc in docs:
             doc['guid'] = generate_guid(type=GUID_NEWSML)
             set_original_creator(doc)
+            set_geo_location(doc)
+
+    def on_update(self, updates, original):
+        if 'position' in updates:
+            set_geo_location(updates)
+
+    def on_replace(self, document, original):
+        set_geo_location(document)
+
+    def typeahead(self, query, size=TYPEAHEAD_MAX_RESULTS):
+        """Get the locations whose name or locality start with the words of the query
+
+        Only a small projection of the locations is returned, and the results are cached
+        per query for TYPEAHEAD_CACHE_TTL.
+
+        :param str query: text typed by the user
+        :param int size: maximum number of locations
+        :return list: locations
+        """
+        query = ' '.join((query or '').lower().split())
+        if not query:
+            return []
+
+        now = utcnow()
+        key = (query, size)
+        cached = _typeahead_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return deepcopy(cached[1])
+
+        source = {
+            'query': {
+                'multi_match': {
+                    'query': query,
+                    'type': 'cross_fields',
+                    'operator': 'and',
+                    'fields': ['name.typeahead^2', 'address.locality.typeahead']
+                }
+            },
+            '_source': TYPEAHEAD_FIELDS,
+            'size': size
+        }
+        locations = list(self.search(source))
+
+        if len(_typeahead_cache) >= TYPEAHEAD_CACHE_SIZE:
+            for expired in [cache_key for cache_key, value in _typeahead_cache.items() if value[0] <= now]:
+                del _typeahead_cache[expired]
+            if len(_typeahead_cache) >= TYPEAHEAD_CACHE_SIZE:
+                _typeahead_cache.clear()
+        _typeahead_cache[key] = (now + TYPEAHEAD_CACHE_TTL, locations)
+        return deepcopy(locations)
+
+
+class LocationsTypeaheadService(superdesk.Service):
+    """Typeahead of the locations picker, see `LocationsService.typeahead`"""
+
+    def get(self, req, lookup):
+        args = req.args if req is not None and req.args else {}
+        try:
+            size = min(int(args.get('max_results') or TYPEAHEAD_MAX_RESULTS), 50)
+        except ValueError:
+            size = TYPEAHEAD_MAX_RESULTS
+        return ListCursor(superdesk.get_resource_service('locations').typeahead(args.get('q'), size))
+
+
+def clear_typeahead_cache(*args, **kwargs):
+    """Invalidate the cached typeahead results, called when locations are modified"""
+    _typeahead_cache.clear()
+
+
+def init_typeahead_analysis(app):
+    """Add the typeahead analysis to the elastic settings, before the index is initialised
+
+    An existing index is updated with the `planning:init_typeahead_analysis` command.
+    """
+    settings = app.config.setdefault('ELASTICSEARCH_SETTINGS', {}).setdefault('settings', {})
+    analysis = settings.setdefault('analysis', {})
+    for key, values in TYPEAHEAD_ANALYSIS.items():
+        analysis.setdefault(key, {}).update(values)
+
+
+def set_geo_location(doc):
+    """Copy the position of a location to its `geo_location` as [longitude, latitude]
+
+    This order is understood both by the mongo 2dsphere index and the elastic geo_point mapping.
+    """
+    position = doc.get('position') or {}
+    if position.get('latitude') is not None and position.get('longitude') is not None:
+        doc['geo_location'] = [float(position['longitude']), float(position['latitude'])]
+    else:
+        doc['geo_location'] = None
 
 
 locations_schema = {
@@ -92,6 +249,7 @@ locations_schema = {
     'name': {
         'type': 'string',
         'unique': True,
+        'mapping': typeahead_mapping
     },
     'type': {
         'type': 'string',
@@ -109,6 +267,13 @@ locations_schema = {
             'gps_datum': {'type': 'string'},
         }
     },
+    # position as [longitude, latitude], set from position for the geo queries
+    'geo_location': {
+        'type': 'list',
+        'nullable': True,
+        'schema': {'type': 'float'},
+        'mapping': {'type': 'geo_point'}
+    },
     'address': {
         'type': 'dict',
         'schema': {
@@ -120,7 +285,10 @@ locations_schema = {
                 'type': 'list',
                 'mapping': {'type': 'string'}
             },
-            'locality': {'type': 'string'},
+            'locality': {
+                'type': 'string',
+                'mapping': typeahead_mapping
+            },
             'area': {'type': 'string'},
             'country': {'type': 'string'},
             'postal_code': {'type': 'string'},
@@ -155,6 +323,181 @@ locations_schema = {
 }
 
 
+def normalise_location_name(name):
+    """Normalise a location name for matching, ignoring the case, punctuation, spacing and word order
+
+    The words are sorted so the variations of an address (street number vs number street) match,
+    the same key being used to find the duplicates in `planning:dedupe_locations`.
+
+    :param str name: location name, i.e. 'Fr. Nansens plass 17, Tromsø'
+    :return str: normalised name, i.e. '17 fr nansens plass tromsø'
+    """
+    return ' '.join(sorted(_NAME_SEPARATORS_RE.sub(' ', (name or '').lower()).split()))
+
+
+def resolve_ingest_locations(items, provider=None):
+    """Link the free text locations of ingested events to the locations collection
+
+    The location names are resolved against an in-memory index of the locations, refreshed
+    with the locations updated since the previous call. The missing locations are created
+    with a single bulk upsert on `unique_name`, then the event locations get their `qcode`.
+
+    :param list items: ingested event items
+    :param dict provider: ingest provider
+    """
+    event_locations = [
+        location for item in items for location in (item.get('location') or [])[:1]
+        if not location.get('qcode') and normalise_location_name(location.get('name'))
+    ]
+    if not event_locations:
+        return
+
+    index = _refresh_locations_index()
+    missing = {}
+    for location in event_locations:
+        key = normalise_location_name(location['name'])
+        if key not in index and key not in missing:
+            missing[key] = _get_new_location(location, provider)
+
+    if missing:
+        for location in _upsert_locations(list(missing.values())):
+            _add_to_locations_index(index, location)
+
+    for location in event_locations:
+        found = index.get(normalise_location_name(location['name']))
+        if found:
+            _set_event_location(location, found)
+
+
+def clear_locations_index(*args, **kwargs):
+    """Invalidate the ingest locations index, called when locations are deleted"""
+    _locations_index.update({'expiry': None, 'updated': None, 'locations': {}})
+
+
+def _refresh_locations_index():
+    now = utcnow()
+    if _locations_index['expiry'] is None or _locations_index['expiry'] <= now:
+        clear_locations_index()
+        _locations_index['expiry'] = now + LOCATIONS_INDEX_TTL
+
+    query = {}
+    if _locations_index['updated'] is not None:
+        query[config.LAST_UPDATED] = {'$gte': _locations_index['updated']}
+
+    index = _locations_index['locations']
+    projection = {'guid': 1, 'name': 1, 'unique_name': 1, 'type': 1, 'position': 1, config.LAST_UPDATED: 1}
+    for location in app.data.get_mongo_collection('locations').find(query, projection):
+        _add_to_locations_index(index, location)
+        updated = location.get(config.LAST_UPDATED)
+        if updated and (_locations_index['updated'] is None or updated > _locations_index['updated']):
+            _locations_index['updated'] = updated
+    return index
+
+
+def _add_to_locations_index(index, location):
+    for name in (location.get('unique_name'), location.get('name')):
+        key = normalise_location_name(name)
+        if key:
+            index[key] = {
+                'guid': location.get('guid'),
+                'name': location.get('name'),
+                'type': location.get('type'),
+                'position': location.get('position'),
+            }
+
+
+def _get_new_location(event_location, provider=None):
+    name = ' '.join(event_location['name'].split())
+    location = {
+        'guid': generate_guid(type=GUID_NEWSML),
+        'unique_name': name,
+        'name': name,
+        'type': 'Unclassified',
+    }
+
+    position = _parse_geo(event_location.get('geo'))
+    if position:
+        location['position'] = position
+        set_geo_location(location)
+
+    if provider:
+        location['ingest_provider'] = provider.get(config.ID_FIELD)
+        location['source'] = provider.get('source')
+    return location
+
+
+def _upsert_locations(locations):
+    """Create the missing locations with one bulk write, returning the locations created
+
+    The upsert on `unique_name` doesn't overwrite a location created meanwhile by another process.
+    """
+    now = utcnow()
+    for location in locations:
+        location.update({
+            config.DATE_CREATED: now,
+            config.LAST_UPDATED: now,
+            'firstcreated': now,
+            'versioncreated': now,
+        })
+        resolve_document_etag(location, 'locations')
+
+    collection = app.data.get_mongo_collection('locations')
+    try:
+        result = collection.bulk_write(
+            [UpdateOne({'unique_name': location['unique_name']}, {'$setOnInsert': location}, upsert=True)
+             for location in locations],
+            ordered=False
+        ).bulk_api_result
+    except BulkWriteError as error:
+        # concurrent upserts of the same name fail on the unique index, the location being created by the other one
+        if any(write_error.get('code') != DUPLICATE_KEY_ERROR for write_error in error.details.get('writeErrors', [])):
+            raise
+        result = error.details
+
+    created = []
+    for upserted in result.get('upserted', []):
+        location = locations[upserted['index']]
+        location[config.ID_FIELD] = upserted['_id']
+        created.append(location)
+
+    if created:
+        superdesk.get_resource_service('locations').backend.create_in_search('locations', created)
+        clear_typeahead_cache()
+        logger.info('Created {} locations from ingest'.format(len(created)))
+
+    # the locations created by another process are read from the collection
+    if len(created) < len(locations):
+        names = [location['unique_name'] for location in locations if config.ID_FIELD not in location]
+        created.extend(collection.find({'unique_name': {'$in': names}}))
+    return created
+
+
+def _set_event_location(event_location, location):
+    event_location['qcode'] = location['guid']
+    event_location['name'] = location['name']
+    if location.get('type'):
+        event_location['type'] = location['type']
+
+    position = location.get('position') or {}
+    if position.get('latitude') is not None and position.get('longitude') is not None:
+        event_location['location'] = {'lat': position['latitude'], 'lon': position['longitude']}
+
+
+def _parse_geo(geo):
+    """Parse the geo of an ingested location, either a 'latitude, longitude' string or a tuple"""
+    if not geo:
+        return None
+
+    try:
+        if isinstance(geo, str):
+            latitude, longitude = geo.split(',')
+        else:
+            latitude, longitude = geo[0], geo[1]
+        return {'latitude': float(latitude), 'longitude': float(longitude)}
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
 class LocationsResource(superdesk.Resource):
     """Resource for locations data model
 
@@ -173,3 +516,25 @@ class LocationsResource(superdesk.Resource):
     privileges = {'POST': 'planning',
                   'PATCH': 'planning',
                   'DELETE': 'planning'}
+
+    mongo_indexes = {
+        # the locations created before unique_name was required are left out of the index
+        'unique_name_1': ([('unique_name', 1)], {
+            'background': True,
+            'unique': True,
+            'partialFilterExpression': {'unique_name': {'$type': 'string'}}
+        }),
+        'geo_location_2dsphere': ([('geo_location', '2dsphere')], {'background': True}),
+    }
+
+
+class LocationsTypeaheadResource(superdesk.Resource):
+    endpoint_name = 'locations_typeahead'
+    url = 'locations_typeahead'
+    schema = {}
+    resource_methods = ['GET']
+    item_methods = []
+    datasource = {
+        'source': 'locations',
+        'search_backend': 'elastic'
+    }
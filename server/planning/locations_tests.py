@@ -0,0 +1,144 @@
+from mock import patch
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+from planning.locations import normalise_location_name, resolve_ingest_locations, set_geo_location, \
+    LocationsService, clear_typeahead_cache, init_typeahead_analysis, clear_locations_index
+from planning.tests import TestCase
+
+
+class IngestLocationsTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            self.app.data.insert('locations', [{
+                'guid': 'location1',
+                'unique_name': 'Fr. Nansens plass 17, Tromsø, Troms',
+                'name': 'Fr. Nansens plass 17',
+                'type': 'Unclassified',
+                'position': {'latitude': 69.65, 'longitude': 18.96}
+            }])
+
+    def test_normalise_location_name(self):
+        self.assertEqual('17 fr nansens plass troms tromsø',
+                         normalise_location_name(' Fr. Nansens  plass 17, Tromsø,Troms'))
+        self.assertEqual(normalise_location_name('Nansens plass 17'), normalise_location_name('17, nansens Plass'))
+        self.assertEqual('', normalise_location_name(None))
+
+    def test_set_geo_location(self):
+        location = {'position': {'latitude': '69.65', 'longitude': 18.96}}
+        set_geo_location(location)
+        self.assertEqual([18.96, 69.65], location['geo_location'])
+
+        location = {'position': {'latitude': 69.65}}
+        set_geo_location(location)
+        self.assertIsNone(location['geo_location'])
+
+    def test_replace_sets_geo_location(self):
+        original = {'name': 'Oslo Spektrum', 'position': {'latitude': 59.91, 'longitude': 10.75},
+                    'geo_location': [10.75, 59.91]}
+
+        document = {'name': 'Oslo Spektrum', 'position': {'latitude': 59.92, 'longitude': 10.76}}
+        LocationsService().on_replace(document, original)
+        self.assertEqual([10.76, 59.92], document['geo_location'])
+
+        # the position is removed, so is the geo location
+        document = {'name': 'Oslo Spektrum'}
+        LocationsService().on_replace(document, original)
+        self.assertIsNone(document['geo_location'])
+
+    def test_resolve_ingest_locations(self):
+        items = [
+            {'guid': 'event1', 'location': [{'name': 'fr nansens plass 17, TROMSØ, Troms', 'qcode': '', 'geo': ''}]},
+            {'guid': 'event2', 'location': [{'name': 'Oslo  Spektrum', 'qcode': '', 'geo': '59.91, 10.75'}]},
+            {'guid': 'event3', 'location': [{'name': 'Oslo Spektrum', 'qcode': '', 'geo': ''}]},
+            {'guid': 'event4', 'location': [{'name': '', 'qcode': '', 'geo': ''}]},
+        ]
+
+        with self.app.app_context():
+            resolve_ingest_locations(items, {'_id': 'provider1', 'source': 'ntb'})
+
+            self.assertEqual(
+                {'name': 'Fr. Nansens plass 17', 'qcode': 'location1', 'geo': '', 'type': 'Unclassified',
+                 'location': {'lat': 69.65, 'lon': 18.96}},
+                items[0]['location'][0]
+            )
+
+            # a single location is created for the names only differing by spacing
+            created = list(self.app.data.get_mongo_collection('locations').find({'unique_name': 'Oslo Spektrum'}))
+            self.assertEqual(1, len(created))
+            self.assertEqual({'latitude': 59.91, 'longitude': 10.75}, created[0]['position'])
+            self.assertEqual([10.75, 59.91], created[0]['geo_location'])
+            self.assertEqual('provider1', created[0]['ingest_provider'])
+            self.assertEqual(created[0]['guid'], items[1]['location'][0]['qcode'])
+            self.assertEqual(created[0]['guid'], items[2]['location'][0]['qcode'])
+            self.assertEqual('', items[3]['location'][0]['qcode'])
+
+            # the created location is resolved from the index by the following batches
+            items = [{'guid': 'event5', 'location': [{'name': 'SPEKTRUM, OSLO', 'qcode': ''}]}]
+            resolve_ingest_locations(items)
+            self.assertEqual(created[0]['guid'], items[0]['location'][0]['qcode'])
+            self.assertEqual(1, self.app.data.get_mongo_collection('locations').count({'unique_name': 'Oslo Spektrum'}))
+
+    def test_resolve_ingest_locations_created_concurrently(self):
+        items = [
+            {'guid': 'event1', 'location': [{'name': 'Operahuset', 'qcode': ''}]},
+            {'guid': 'event2', 'location': [{'name': 'Nationaltheatret', 'qcode': ''}]},
+        ]
+        bulk_write = Collection.bulk_write
+
+        def concurrent_bulk_write(collection, requests, ordered=True):
+            # another process creates the first location between the lookup and the insert of the upsert
+            collection.insert_one({'guid': 'location2', 'unique_name': 'Operahuset', 'name': 'Operahuset'})
+            result = bulk_write(collection, requests[1:], ordered=ordered).bulk_api_result
+            raise BulkWriteError({
+                'writeErrors': [{'index': 0, 'code': 11000, 'errmsg': 'E11000 duplicate key error'}],
+                'upserted': [{'index': upserted['index'] + 1, '_id': upserted['_id']}
+                             for upserted in result['upserted']]
+            })
+
+        with self.app.app_context():
+            clear_locations_index()
+            with patch.object(Collection, 'bulk_write', autospec=True, side_effect=concurrent_bulk_write):
+                resolve_ingest_locations(items)
+
+            collection = self.app.data.get_mongo_collection('locations')
+            created = collection.find_one({'unique_name': 'Nationaltheatret'})
+            self.assertEqual('location2', items[0]['location'][0]['qcode'])
+            self.assertEqual(created['guid'], items[1]['location'][0]['qcode'])
+            self.assertEqual(1, collection.count({'unique_name': 'Operahuset'}))
+
+
+class LocationsTypeaheadTestCase(TestCase):
+
+    def test_typeahead(self):
+        service = LocationsService('locations')
+        location = {'guid': 'location1', 'name': 'Oslo Spektrum'}
+        with patch.object(service, 'search', return_value=[location]) as search:
+            self.assertEqual([], service.typeahead('  '))
+            self.assertFalse(search.called)
+
+            self.assertEqual([location], service.typeahead('Oslo  Spek'))
+            source = search.call_args[0][0]
+            self.assertEqual('oslo spek', source['query']['multi_match']['query'])
+            self.assertEqual(10, source['size'])
+
+            # cached per query, and the cached locations can't be modified by the caller
+            service.typeahead('oslo spek')[0]['name'] = 'Modified'
+            self.assertEqual([location], service.typeahead('OSLO SPEK'))
+            self.assertEqual(1, search.call_count)
+
+            service.typeahead('oslo spek', size=5)
+            self.assertEqual(2, search.call_count)
+
+            clear_typeahead_cache()
+            service.typeahead('oslo spek')
+            self.assertEqual(3, search.call_count)
+
+    def test_init_typeahead_analysis(self):
+        self.app.config['ELASTICSEARCH_SETTINGS'] = {'settings': {'analysis': {'analyzer': {'other': {}}}}}
+        init_typeahead_analysis(self.app)
+        analysis = self.app.config['ELASTICSEARCH_SETTINGS']['settings']['analysis']
+        self.assertEqual(['other', 'planning_typeahead', 'planning_typeahead_search'],
+                         sorted(analysis['analyzer'].keys()))
+        self.assertIn('planning_edge_ngram', analysis['filter'])
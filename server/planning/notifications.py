@@ -0,0 +1,257 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Superdesk Planning notifications
+
+The clients register the agendas and date range they are showing in `planning_notification_subscriptions`,
+along with a `client_id` generated by each instance of the client, as the browser tabs of a user share their session.
+The planning, events and coverage notifications then list the client ids interested in the item as `sessions`,
+the updates along with the `changes` made to it, so only those clients patch their state instead of all of them
+refetching it. Clients without subscription keep handling all the notifications.
+
+The notifications pushed while handling a request are buffered and sent once it is processed, those of the same
+name coalesced into a single message listing their payloads as `items`, so a series operation doesn't send a
+notification per touched item.
+"""
+
+import logging
+import pytz
+import superdesk
+from collections import OrderedDict
+from datetime import datetime
+from eve.utils import config
+from flask import current_app as app, g, has_request_context
+from apps.archive.common import get_auth, get_user
+from superdesk.notification import push_notification as _push_notification
+from superdesk.utc import get_date
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_RESOURCES = ['planning', 'events', 'coverage']
+
+# system fields sent along with the changes, so the clients can keep patching the item
+NOTIFIED_SYSTEM_FIELDS = ['_etag', '_updated']
+
+# the subscriptions not refreshed by their client expire along with its session, after the default session expiry
+SUBSCRIPTION_EXPIRY_SECONDS = 240 * 60
+
+
+class NotificationSubscriptionsResource(superdesk.Resource):
+    endpoint_name = 'planning_notification_subscriptions'
+    url = 'planning_notification_subscriptions'
+    schema = {
+        'session': {'type': 'string', 'readonly': True},
+        # Instance of the client, i.e. a browser tab
+        'client_id': {'type': 'string', 'required': True},
+        'user': superdesk.Resource.rel('users', readonly=True),
+        # Agendas shown by the client, all of them if empty
+        'agendas': {
+            'type': 'list',
+            'schema': {'type': 'string'},
+            'default': []
+        },
+        # Resources of the notifications, all of them if empty
+        'resources': {
+            'type': 'list',
+            'allowed': SUBSCRIPTION_RESOURCES,
+            'default': []
+        },
+        'start_date': {'type': 'datetime', 'nullable': True},
+        'end_date': {'type': 'datetime', 'nullable': True},
+    }
+    resource_methods = ['GET', 'POST']
+    item_methods = ['GET']
+    privileges = {'POST': 'planning'}
+    mongo_indexes = {
+        'session_1_client_id_1': ([('session', 1), ('client_id', 1)], {'unique': True}),
+        '_updated_1': ([('_updated', 1)], {'expireAfterSeconds': SUBSCRIPTION_EXPIRY_SECONDS}),
+    }
+
+
+class NotificationSubscriptionsService(superdesk.Service):
+    """A client subscribes once, posting again replaces its subscription and keeps it from expiring"""
+
+    def get(self, req, lookup):
+        lookup = dict(lookup or {})
+        lookup['session'] = _get_session_id()
+        return super().get(req, lookup)
+
+    def on_create(self, docs):
+        session_id = _get_session_id()
+        user = get_user()
+        for doc in docs:
+            doc['session'] = session_id
+            doc['user'] = user.get(config.ID_FIELD) if user else None
+
+        clients = [doc['client_id'] for doc in docs if doc['session']]
+        if clients:
+            self.delete(lookup={'session': session_id, 'client_id': {'$in': clients}})
+        g.pop('planning_notification_subscriptions', None)
+
+
+def remove_session_subscriptions(auth):
+    """Remove the subscriptions of the clients of a closed session"""
+    if auth and auth.get(config.ID_FIELD):
+        app.data.get_mongo_collection('planning_notification_subscriptions').delete_many(
+            {'session': str(auth[config.ID_FIELD])})
+
+
+def subscription_matches(subscription, resource, agendas=None, start=None, end=None):
+    """Test if a subscription is interested in an item
+
+    :param dict subscription: notification subscription
+    :param str resource: resource of the item
+    :param list agendas: agendas of the item, ignored for the events which don't have any
+    :param start: start date of the item
+    :param end: end date of the item
+    :return bool:
+    """
+    if subscription.get('resources') and resource not in subscription['resources']:
+        return False
+
+    if resource != 'events' and subscription.get('agendas') and \
+            not set(subscription['agendas']) & set(agendas or []):
+        return False
+
+    start = _get_utc_date(start)
+    end = _get_utc_date(end) or start
+    if start is None:
+        return True
+
+    if subscription.get('end_date') and start > _get_utc_date(subscription['end_date']):
+        return False
+    if subscription.get('start_date') and end < _get_utc_date(subscription['start_date']):
+        return False
+    return True
+
+
+def get_notification_sessions(resource, agendas=None, start=None, end=None):
+    """Get the clients subscribed to an item
+
+    :return list: client ids
+    """
+    return [subscription['client_id'] for subscription in get_subscriptions()
+            if subscription_matches(subscription, resource, agendas, start, end)]
+
+
+def get_subscriptions():
+    """Get the notification subscriptions, loaded once per request"""
+    subscriptions = g.get('planning_notification_subscriptions') if has_request_context() else None
+    if subscriptions is None:
+        subscriptions = list(app.data.get_mongo_collection('planning_notification_subscriptions').find(
+            {}, {'client_id': 1, 'agendas': 1, 'resources': 1, 'start_date': 1, 'end_date': 1}
+        ))
+        if has_request_context():
+            g.planning_notification_subscriptions = subscriptions
+    return subscriptions
+
+
+def get_notification_changes(updates):
+    """Get the changes sent along the notification, without the internal fields"""
+    return {field: value for field, value in (updates or {}).items()
+            if not field.startswith('_') or field in NOTIFIED_SYSTEM_FIELDS}
+
+
+def push_planning_notification(name, resource, doc, updates=None, agendas=None, **kwargs):
+    """Push a notification of a planning, event or coverage to the clients interested in it
+
+    :param str name: notification name
+    :param str resource: `planning`, `events` or `coverage`
+    :param dict doc: the item, as stored after the changes
+    :param dict updates: the changes, sent to the clients so they don't refetch the item
+    :param list agendas: agendas of the item, added and removed ones included; from the item if not set
+    """
+    start, end = _get_item_dates(resource, doc)
+    if agendas is None:
+        agendas = doc.get('agendas') or []
+
+    try:
+        sessions = get_notification_sessions(resource, agendas, start, end)
+    except Exception:
+        logger.exception('Failed to get the notification subscriptions.')
+        sessions = None
+
+    if updates is not None:
+        kwargs['changes'] = get_notification_changes(updates)
+    push_notification(name, sessions=sessions, **kwargs)
+
+
+def push_notification(name, **kwargs):
+    """Push a notification, buffered until the end of the request
+
+    Identical notifications are only sent once. Outside of a request the notification is sent right away.
+
+    :param str name: notification name
+    """
+    if not has_request_context():
+        _push_notification(name, **kwargs)
+        return
+
+    buffer = g.get('planning_notifications')
+    if buffer is None:
+        buffer = g.planning_notifications = OrderedDict()
+
+    payloads = buffer.setdefault(name, [])
+    if kwargs not in payloads:
+        payloads.append(kwargs)
+
+
+def flush_notifications(exception=None):
+    """Send the notifications buffered during the request, one message per notification name"""
+    buffer = g.pop('planning_notifications', None)
+    for name, payloads in (buffer or {}).items():
+        try:
+            _push_notification(name, **coalesce_notifications(payloads))
+        except Exception:
+            logger.exception('Failed to push the notification {}.'.format(name))
+
+
+def coalesce_notifications(payloads):
+    """Merge the payloads of the notifications of the same name
+
+    A single payload is sent unchanged. Otherwise the message carries the payloads as its `items`, and the
+    `sessions` listing the clients subscribed to any of them so the others can skip the message.
+
+    :param list payloads: notifications payloads
+    :return dict: payload of the message
+    """
+    if len(payloads) == 1:
+        return payloads[0]
+
+    coalesced = {'items': payloads}
+    if any('sessions' in payload for payload in payloads):
+        sessions = [payload.get('sessions') for payload in payloads]
+        coalesced['sessions'] = None if None in sessions else sorted(set().union(*sessions))
+    return coalesced
+
+
+def _get_session_id():
+    session_id = get_auth().get(config.ID_FIELD)
+    return str(session_id) if session_id else None
+
+
+def _get_item_dates(resource, doc):
+    if resource == 'events':
+        dates = doc.get('dates') or {}
+        return dates.get('start'), dates.get('end')
+    if resource == 'coverage':
+        scheduled = (doc.get('planning') or {}).get('scheduled')
+        return scheduled, scheduled
+    return doc.get('_planning_date'), doc.get('_planning_date')
+
+
+def _get_utc_date(value):
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        value = get_date(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=pytz.UTC)
+    return value
@@ -0,0 +1,106 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from datetime import datetime
+from unittest import mock
+from planning.notifications import subscription_matches, get_notification_changes, coalesce_notifications, \
+    push_notification, get_notification_sessions
+from planning.tests import TestCase
+
+
+class NotificationSubscriptionsTestCase(TestCase):
+
+    def test_match_resources_and_agendas(self):
+        subscription = {'agendas': ['sports'], 'resources': ['planning', 'events']}
+        self.assertTrue(subscription_matches(subscription, 'planning', ['sports', 'culture']))
+        self.assertFalse(subscription_matches(subscription, 'planning', ['culture']))
+        self.assertFalse(subscription_matches(subscription, 'planning'))
+        self.assertFalse(subscription_matches(subscription, 'coverage', ['sports']))
+        # events don't have agendas
+        self.assertTrue(subscription_matches(subscription, 'events'))
+        self.assertTrue(subscription_matches({}, 'coverage', ['culture']))
+
+    def test_match_dates(self):
+        subscription = {
+            'start_date': datetime(2017, 6, 1),
+            'end_date': '2017-06-30T00:00:00+0000'
+        }
+        self.assertTrue(subscription_matches(subscription, 'events',
+                                             start='2017-06-10T10:00:00+0000', end='2017-06-10T12:00:00+0000'))
+        self.assertTrue(subscription_matches(subscription, 'events',
+                                             start='2017-05-30T10:00:00+0000', end='2017-06-01T12:00:00+0000'))
+        self.assertFalse(subscription_matches(subscription, 'events',
+                                              start='2017-05-30T10:00:00+0000', end='2017-05-31T12:00:00+0000'))
+        self.assertFalse(subscription_matches(subscription, 'planning', start=datetime(2017, 7, 1)))
+        self.assertTrue(subscription_matches(subscription, 'planning'))
+
+    def test_notification_changes(self):
+        self.assertEqual(
+            {'slugline': 'foo', '_etag': 'abc'},
+            get_notification_changes({'slugline': 'foo', '_etag': 'abc', '_coverages': [], '_planning_date': None})
+        )
+
+    @mock.patch('planning.notifications.app')
+    def test_subscriptions_loaded_once_per_request(self, app):
+        subscriptions = [
+            {'client_id': 'c1', 'agendas': ['sports']},
+            {'client_id': 'c2', 'resources': ['events']},
+        ]
+        collection = app.data.get_mongo_collection.return_value
+        collection.find.return_value = iter(subscriptions)
+        with self.app.test_request_context():
+            self.assertEqual(['c1'], get_notification_sessions('planning', ['sports']))
+            self.assertEqual(['c1', 'c2'], get_notification_sessions('events'))
+        self.assertEqual(1, collection.find.call_count)
+
+
+class NotificationsBufferTestCase(TestCase):
+
+    def test_coalesce_notifications(self):
+        payload = {'item': 'e1', 'user': 'u1', 'etag': 'a'}
+        self.assertEqual(payload, coalesce_notifications([payload]))
+        self.assertEqual({
+            'items': [
+                {'item': 'e1', 'user': 'u1', 'etag': 'a', 'sessions': ['s1']},
+                {'item': 'e2', 'user': 'u1', 'etag': 'b', 'sessions': ['s2', 's1']},
+                {'item': 'e3', 'user': 'u1', 'etag': 'c', 'sessions': []},
+            ],
+            'sessions': ['s1', 's2']
+        }, coalesce_notifications([
+            dict(payload, sessions=['s1']),
+            {'item': 'e2', 'user': 'u1', 'etag': 'b', 'sessions': ['s2', 's1']},
+            {'item': 'e3', 'user': 'u1', 'etag': 'c', 'sessions': []},
+        ]))
+        self.assertIsNone(coalesce_notifications([
+            {'item': 'e1', 'sessions': ['s1']},
+            {'item': 'e2', 'sessions': None},
+        ])['sessions'])
+        self.assertNotIn('sessions', coalesce_notifications([
+            {'item': 'e1', 'added_agendas': ['a1']},
+            {'item': 'e2', 'added_agendas': ['a1']},
+        ]))
+
+    @mock.patch('planning.notifications._push_notification')
+    def test_notifications_sent_at_request_end(self, push):
+        with self.app.test_request_context():
+            push_notification('events:spiked', item='e1', user='u1')
+            push_notification('events:spiked', item='e2', user='u1')
+            push_notification('events:spiked', item='e1', user='u1')
+            push_notification('planning:spiked', item='p1', user='u1')
+            push.assert_not_called()
+
+        self.assertEqual([
+            mock.call('events:spiked', items=[{'item': 'e1', 'user': 'u1'}, {'item': 'e2', 'user': 'u1'}]),
+            mock.call('planning:spiked', item='p1', user='u1'),
+        ], push.call_args_list)
+
+        push.reset_mock()
+        push_notification('events:spiked', item='e3', user='u1')
+        push.assert_called_once_with('events:spiked', item='e3', user='u1')
@@ -1,8 +1,39 @@
 
+import pytz
+import threading
+from collections import OrderedDict
 from lxml import etree
-from planning.common import PUBLISHED_STATE
+from planning.common import PUBLISHED_STATE, get_timezone, is_ntb_event_pretty_print_enabled
 from superdesk.publish.formatters import Formatter
-from superdesk.utc import get_date, utc_to_local, utcnow
+from superdesk.utc import get_date, utcnow
+
+FORMAT_TYPE = 'ntb_event'
+
+# formatted items, by (item _id, _etag, pubstatus, format), most recently used last
+FORMAT_CACHE_SIZE = 1000
+_format_cache = OrderedDict()
+_format_cache_lock = threading.Lock()
+
+
+def clear_format_cache():
+    with _format_cache_lock:
+        _format_cache.clear()
+
+
+def _get_cached_format(key):
+    with _format_cache_lock:
+        xml = _format_cache.get(key)
+        if xml is not None:
+            _format_cache.move_to_end(key)
+        return xml
+
+
+def _set_cached_format(key, xml):
+    with _format_cache_lock:
+        _format_cache[key] = xml
+        _format_cache.move_to_end(key)
+        while len(_format_cache) > FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
 
 
 class NTBEventFormatter(Formatter):
@@ -13,12 +44,27 @@ class NTBEventFormatter(Formatter):
     PRIORITY = '5'
 
     def can_format(self, format_type, article):
-        return format_type == 'ntb_event' and article.get('type') == 'event'
+        return format_type == FORMAT_TYPE and article.get('type') == 'event'
 
     def format(self, item, subscriber, codes=None):
-        doc = etree.Element('document')
-        self._format_doc(doc, item)
-        xml = etree.tostring(doc, pretty_print=True, xml_declaration=True, encoding=self.ENCODING)
+        """Format the event, the xml being cached for the other subscribers of the same version of the item
+
+        The output only depends on the item, so the subscribers share the cache entry of the format.
+        The pubstatus is part of the key as it is set on the item when publishing, without new etag.
+        """
+        pretty_print = is_ntb_event_pretty_print_enabled()
+        key = None
+        if item.get('_id') and item.get('_etag'):
+            key = (item['_id'], item['_etag'], item.get('pubstatus'), FORMAT_TYPE, pretty_print)
+
+        xml = _get_cached_format(key) if key else None
+        if xml is None:
+            doc = etree.Element('document')
+            self._format_doc(doc, item)
+            xml = etree.tostring(doc, pretty_print=pretty_print, xml_declaration=True, encoding=self.ENCODING)
+            if key:
+                _set_cached_format(key, xml)
+
         return [{
             'published_seq_num': None,
             'formatted_item': xml.decode(self.ENCODING),
@@ -42,10 +88,11 @@ class NTBEventFormatter(Formatter):
         time = etree.SubElement(doc, 'time')
         time.text = self._format_time(item.get('versioncreated'))
         dates = item.get('dates', {})
+        tz = get_timezone(dates.get('tz'))
         time_start = etree.SubElement(doc, 'timeStart')
-        time_start.text = self._format_time(dates.get('start'), dates.get('tz'))
+        time_start.text = self._format_time(dates.get('start'), tz)
         time_end = etree.SubElement(doc, 'timeEnd')
-        time_end.text = self._format_time(dates.get('end'), dates.get('tz'))
+        time_end.text = self._format_time(dates.get('end'), tz)
         priority = etree.SubElement(doc, 'priority')
         priority.text = str(item.get('priority', self.PRIORITY))
         content = etree.SubElement(doc, 'content')
@@ -87,8 +134,9 @@ class NTBEventFormatter(Formatter):
         return 'NBRP{}_hh_00'.format(local_time.strftime('%y%m%d_%H%M%S'))
 
     def _get_local_time(self, time, tz=None):
+        """Convert the utc time to the given timezone, resolved with `get_timezone`, Europe/Oslo by default"""
         if time is None:
             time = utcnow()
         if tz is None:
-            tz = self.TIMEZONE
-        return utc_to_local(tz, get_date(time))
+            tz = get_timezone(self.TIMEZONE)
+        return get_date(time).replace(tzinfo=pytz.utc).astimezone(tz)
@@ -19,11 +19,11 @@ from superdesk import get_resource_service
 from superdesk.resource import not_analyzed
 from superdesk.users.services import current_user_has_privilege
 from superdesk.resource import build_custom_hateoas
-from superdesk.notification import push_notification
 from apps.archive.common import set_original_creator, get_user, get_auth
 from copy import deepcopy
 from eve.utils import config, ParsedRequest
 from .common import WORKFLOW_STATE_SCHEMA, PUBLISHED_STATE_SCHEMA
+from .notifications import push_planning_notification
 from superdesk.utc import utcnow
 
 
@@ -62,8 +62,10 @@ class PlanningService(superdesk.Service):
     def on_created(self, docs):
         session_id = get_auth().get('_id')
         for doc in docs:
-            push_notification(
+            push_planning_notification(
                 'planning:created',
+                'planning',
+                doc,
                 item=str(doc.get(config.ID_FIELD)),
                 user=str(doc.get('original_creator', '')),
                 added_agendas=doc.get('agendas') or [],
@@ -94,8 +96,10 @@ class PlanningService(superdesk.Service):
     def on_duplicated(self, doc, parent_id):
         self._update_event_history(doc)
         session_id = get_auth().get('_id')
-        push_notification(
+        push_planning_notification(
             'planning:duplicated',
+            'planning',
+            doc,
             item=str(doc.get(config.ID_FIELD)),
             original=str(parent_id),
             user=str(doc.get('original_creator', '')),
@@ -130,7 +134,12 @@ class PlanningService(superdesk.Service):
         event_id = doc.get('event_item')
         event = {}
         if event_id:
-            event = get_resource_service('events').find_one(req=None, _id=event_id)
+            events_service = get_resource_service('events')
+            event = events_service.find_one(req=None, _id=event_id)
+
+            # Planning items can only be linked to stored events
+            if event and event.get('_virtual'):
+                event = events_service.materialise_occurrence(event)
 
         doc['_planning_date'] = event.get('dates', {}).get('start') if event else utcnow()
         doc['_coverages'] = [
@@ -150,8 +159,14 @@ class PlanningService(superdesk.Service):
     def on_updated(self, updates, original):
         added, removed = self._get_added_removed_agendas(updates, original)
         session_id = get_auth().get('_id')
-        push_notification(
+        doc = deepcopy(original)
+        doc.update(updates)
+        push_planning_notification(
             'planning:updated',
+            'planning',
+            doc,
+            updates=updates,
+            agendas=list(set(doc.get('agendas') or []) | set(removed)),
             item=str(original[config.ID_FIELD]),
             user=str(updates.get('version_creator', '')),
             added_agendas=added, removed_agendas=removed,
@@ -179,17 +194,62 @@ class PlanningService(superdesk.Service):
         req.args = {'source': json.dumps(query)}
         return super().get(req=req, lookup=None)
 
+    def has_planning_items_for_agenda(self, agenda_id):
+        """Test if any planning item references the agenda, without fetching the planning items
+
+        :param agenda_id: Agenda _id
+        :return bool: True if the agenda is used
+        """
+        source = {
+            'query': {
+                'bool': {'filter': {'term': {'agendas': str(agenda_id)}}}
+            },
+            'size': 0,
+            'terminate_after': 1
+        }
+        return self.search(source).count() > 0
+
+    def get_agendas_usage(self, agenda_ids):
+        """Count the planning items of each agenda with a single terms aggregation
+
+        :param list agenda_ids: Agenda _ids
+        :return dict: number of planning items per Agenda _id
+        """
+        agenda_ids = [str(agenda_id) for agenda_id in agenda_ids]
+        usage = {agenda_id: 0 for agenda_id in agenda_ids}
+        if not agenda_ids:
+            return usage
+
+        source = {
+            'query': {
+                'bool': {'filter': {'terms': {'agendas': agenda_ids}}}
+            },
+            'size': 0,
+            'aggs': {
+                'agendas': {
+                    'terms': {'field': 'agendas', 'include': agenda_ids, 'size': len(agenda_ids)}
+                }
+            }
+        }
+        results = self.search(source)
+        for bucket in (results.hits.get('aggregations') or {}).get('agendas', {}).get('buckets', []):
+            usage[bucket['key']] = bucket['doc_count']
+        return usage
+
     def sync_coverages(self, docs):
         """Sync the coverage information between planning an coverages
 
         :param list docs: list of coverage docs
+        :return dict: the planning items of the coverages, by _id
         """
+        plannings = {}
         if not docs:
-            return
+            return plannings
         ids = set([doc.get('planning_item') for doc in docs])
         service = get_resource_service('coverage')
         for planning_id in ids:
             planning = self.find_one(req=None, _id=planning_id)
+            plannings[planning_id] = planning
             coverages = list(service.get_from_mongo(req=None, lookup={'planning_item': planning_id}))
             updates = []
             add_default_coverage = True
@@ -210,6 +270,7 @@ class PlanningService(superdesk.Service):
                 })
 
             self.system_update(planning_id, {'_coverages': updates}, planning)
+        return plannings
 
 
 event_type = deepcopy(superdesk.Resource.rel('events', type='string'))
@@ -0,0 +1,201 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Superdesk Planning aggregations"""
+
+import superdesk
+import logging
+from superdesk import get_resource_service
+from superdesk.errors import SuperdeskApiError
+from superdesk.utc import get_date
+from superdesk.utils import ListCursor
+from .common import WORKFLOW_STATE
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = ['day', 'week', 'month']
+
+# date fields of the histogram, the coverages being nested in the planning items
+DATE_FIELDS = {
+    'planning_date': '_planning_date',
+    'coverages': '_coverages.scheduled',
+}
+
+MAX_AGENDAS = 1000
+
+
+class PlanningAggregationsService(superdesk.Service):
+    """Count the planning items per agenda and per date with a single elastic request
+
+    Request arguments:
+
+    - agendas: comma separated Agenda _ids, all the agendas if not set
+    - state: comma separated workflow states, all but spiked if not set
+    - start_date and end_date: date range of the histogram
+    - date_field: `planning_date` (default) or `coverages` for the scheduled date of the coverages
+    - interval: `day` (default), `week` or `month`
+    - tz: timezone of the histogram buckets, i.e. Europe/Oslo
+
+    The response has a single item with the `total` number of planning items,
+    the `dates` histogram and the `agendas` counts, each with its own histogram.
+    """
+
+    def get(self, req, lookup):
+        args = req.args if req is not None and req.args else {}
+        source = get_planning_aggregations_query(
+            agendas=_split(args.get('agendas')),
+            states=_split(args.get('state')),
+            start_date=args.get('start_date'),
+            end_date=args.get('end_date'),
+            date_field=args.get('date_field') or 'planning_date',
+            interval=args.get('interval') or 'day',
+            tz=args.get('tz')
+        )
+        results = get_resource_service('planning').search(source)
+        return ListCursor([parse_planning_aggregations(results.hits, args.get('date_field') or 'planning_date')])
+
+
+def get_planning_aggregations_query(agendas=None, states=None, start_date=None, end_date=None,
+                                    date_field='planning_date', interval='day', tz=None):
+    """Get the elastic query counting the planning items per agenda and date
+
+    :param list agendas: Agenda _ids
+    :param list states: workflow states
+    :param start_date: start of the date range
+    :param end_date: end of the date range
+    :param str date_field: `planning_date` or `coverages`
+    :param str interval: interval of the date histogram
+    :param str tz: timezone of the date histogram
+    :return dict: elastic query source
+    """
+    if date_field not in DATE_FIELDS:
+        raise SuperdeskApiError.badRequestError('Invalid date_field {}'.format(date_field))
+    if interval not in INTERVALS:
+        raise SuperdeskApiError.badRequestError('Invalid interval {}'.format(interval))
+
+    date_range = {}
+    try:
+        if start_date:
+            date_range['gte'] = get_date(start_date).isoformat()
+        if end_date:
+            date_range['lte'] = get_date(end_date).isoformat()
+    except Exception:
+        raise SuperdeskApiError.badRequestError('Invalid start_date or end_date')
+
+    field = DATE_FIELDS[date_field]
+    filters = []
+    must_not = []
+    if agendas:
+        filters.append({'terms': {'agendas': agendas}})
+    if states:
+        filters.append({'terms': {'state': states}})
+    else:
+        must_not.append({'term': {'state': WORKFLOW_STATE.SPIKED}})
+
+    histogram = {'field': field, 'interval': interval, 'min_doc_count': 1}
+    if tz:
+        histogram['time_zone'] = tz
+
+    if date_field == 'coverages':
+        coverage_range = {'range': {field: date_range}} if date_range else {'match_all': {}}
+        if date_range:
+            filters.append({'nested': {'path': '_coverages', 'query': coverage_range}})
+
+        # the coverages are counted per date, then reverse nested to count their planning items
+        dates = {
+            'nested': {'path': '_coverages'},
+            'aggs': {
+                'range': {
+                    'filter': coverage_range,
+                    'aggs': {
+                        'dates': {
+                            'date_histogram': histogram,
+                            'aggs': {'planning': {'reverse_nested': {}}}
+                        }
+                    }
+                }
+            }
+        }
+    else:
+        if date_range:
+            filters.append({'range': {field: date_range}})
+        dates = {'date_histogram': histogram}
+
+    agendas_terms = {'field': 'agendas', 'size': len(agendas) if agendas else MAX_AGENDAS}
+    if agendas:
+        agendas_terms['include'] = agendas
+
+    return {
+        'query': {'bool': {'filter': filters, 'must_not': must_not}},
+        'size': 0,
+        'aggs': {
+            'dates': dates,
+            'agendas': {
+                'terms': agendas_terms,
+                'aggs': {'dates': dates}
+            }
+        }
+    }
+
+
+def parse_planning_aggregations(hits, date_field='planning_date'):
+    """Convert the elastic response to the planning counts
+
+    :param dict hits: elastic response
+    :param str date_field: date field of the histogram
+    :return dict: total, dates and agendas counts
+    """
+    aggregations = hits.get('aggregations') or {}
+    total = hits.get('hits', {}).get('total', 0)
+    return {
+        'total': total,
+        'dates': _get_dates(aggregations.get('dates'), date_field),
+        'agendas': [{
+            'agenda': bucket['key'],
+            'count': bucket['doc_count'],
+            'dates': _get_dates(bucket.get('dates'), date_field)
+        } for bucket in (aggregations.get('agendas') or {}).get('buckets', [])]
+    }
+
+
+def _get_dates(aggregation, date_field):
+    if not aggregation:
+        return []
+
+    if date_field == 'coverages':
+        return [{
+            'date': bucket.get('key_as_string'),
+            'count': bucket['planning']['doc_count']
+        } for bucket in aggregation.get('range', {}).get('dates', {}).get('buckets', [])]
+
+    return [{
+        'date': bucket.get('key_as_string'),
+        'count': bucket['doc_count']
+    } for bucket in aggregation.get('buckets', [])]
+
+
+def _split(value):
+    return [part for part in (value or '').split(',') if part]
+
+
+class PlanningAggregationsResource(superdesk.Resource):
+    endpoint_name = 'planning_aggregations'
+    url = 'planning_aggregations'
+    schema = {
+        'total': {'type': 'integer'},
+        'dates': {'type': 'list'},
+        'agendas': {'type': 'list'},
+    }
+    resource_methods = ['GET']
+    item_methods = []
+    datasource = {
+        'source': 'planning',
+        'search_backend': 'elastic'
+    }
@@ -0,0 +1,89 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from superdesk.errors import SuperdeskApiError
+from planning.planning_aggregations import get_planning_aggregations_query, parse_planning_aggregations
+from planning.tests import TestCase
+
+
+class PlanningAggregationsTestCase(TestCase):
+
+    def test_planning_date_query(self):
+        source = get_planning_aggregations_query(agendas=['a1', 'a2'], states=['draft', 'scheduled'],
+                                                 start_date='2017-06-01T00:00:00+0000', interval='week',
+                                                 tz='Europe/Oslo')
+        histogram = {'date_histogram': {'field': '_planning_date', 'interval': 'week', 'min_doc_count': 1,
+                                        'time_zone': 'Europe/Oslo'}}
+        self.assertEqual(0, source['size'])
+        self.assertEqual({'bool': {'must_not': [], 'filter': [
+            {'terms': {'agendas': ['a1', 'a2']}},
+            {'terms': {'state': ['draft', 'scheduled']}},
+            {'range': {'_planning_date': {'gte': '2017-06-01T00:00:00+00:00'}}},
+        ]}}, source['query'])
+        self.assertEqual(histogram, source['aggs']['dates'])
+        self.assertEqual({
+            'terms': {'field': 'agendas', 'size': 2, 'include': ['a1', 'a2']},
+            'aggs': {'dates': histogram}
+        }, source['aggs']['agendas'])
+
+    def test_coverages_query(self):
+        source = get_planning_aggregations_query(end_date='2017-06-30T00:00:00+0000', date_field='coverages')
+        coverage_range = {'range': {'_coverages.scheduled': {'lte': '2017-06-30T00:00:00+00:00'}}}
+        self.assertEqual({'bool': {
+            'must_not': [{'term': {'state': 'spiked'}}],
+            'filter': [{'nested': {'path': '_coverages', 'query': coverage_range}}]
+        }}, source['query'])
+        self.assertEqual(1000, source['aggs']['agendas']['terms']['size'])
+        dates = source['aggs']['dates']
+        self.assertEqual({'path': '_coverages'}, dates['nested'])
+        self.assertEqual(coverage_range, dates['aggs']['range']['filter'])
+        self.assertEqual({'planning': {'reverse_nested': {}}}, dates['aggs']['range']['aggs']['dates']['aggs'])
+
+    def test_invalid_query(self):
+        with self.assertRaises(SuperdeskApiError):
+            get_planning_aggregations_query(interval='hour')
+        with self.assertRaises(SuperdeskApiError):
+            get_planning_aggregations_query(date_field='foo')
+        with self.assertRaises(SuperdeskApiError):
+            get_planning_aggregations_query(start_date='foo')
+
+    def test_parse_aggregations(self):
+        hits = {
+            'hits': {'total': 3},
+            'aggregations': {
+                'dates': {'buckets': [
+                    {'key_as_string': '2017-06-01T00:00:00.000Z', 'doc_count': 2},
+                    {'key_as_string': '2017-06-02T00:00:00.000Z', 'doc_count': 1},
+                ]},
+                'agendas': {'buckets': [{
+                    'key': 'a1',
+                    'doc_count': 2,
+                    'dates': {'buckets': [{'key_as_string': '2017-06-01T00:00:00.000Z', 'doc_count': 2}]}
+                }]}
+            }
+        }
+        self.assertEqual({
+            'total': 3,
+            'dates': [{'date': '2017-06-01T00:00:00.000Z', 'count': 2},
+                      {'date': '2017-06-02T00:00:00.000Z', 'count': 1}],
+            'agendas': [{'agenda': 'a1', 'count': 2,
+                         'dates': [{'date': '2017-06-01T00:00:00.000Z', 'count': 2}]}]
+        }, parse_planning_aggregations(hits))
+
+    def test_parse_coverages_aggregations(self):
+        dates = {'range': {'dates': {'buckets': [
+            {'key_as_string': '2017-06-01T00:00:00.000Z', 'doc_count': 5, 'planning': {'doc_count': 2}}
+        ]}}}
+        hits = {'hits': {'total': 2}, 'aggregations': {'dates': dates, 'agendas': {'buckets': []}}}
+        self.assertEqual({
+            'total': 2,
+            'dates': [{'date': '2017-06-01T00:00:00.000Z', 'count': 2}],
+            'agendas': []
+        }, parse_planning_aggregations(hits, 'coverages'))
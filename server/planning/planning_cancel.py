@@ -10,12 +10,12 @@
 
 from superdesk import get_resource_service
 from superdesk.services import BaseService
-from superdesk.notification import push_notification
+from .notifications import push_notification
 from apps.archive.common import get_user, get_auth
 from eve.utils import config
 from copy import deepcopy
 from .planning import PlanningResource, planning_schema
-from .common import WORKFLOW_STATE, ITEM_STATE
+from .common import WORKFLOW_STATE, ITEM_STATE, get_vocabulary_item
 
 
 planning_cancel_schema = deepcopy(planning_schema)
@@ -41,13 +41,7 @@ class PlanningCancelResource(PlanningResource):
 class PlanningCancelService(BaseService):
     def update(self, id, updates, original):
         coverage_service = get_resource_service('coverage')
-        coverage_states = get_resource_service('vocabularies').find_one(
-            req=None,
-            _id='newscoveragestatus'
-        )
-
-        coverage_cancel_state = [x for x in coverage_states.get('items', []) if
-                                 x['qcode'] == 'ncostat:notint'][0]
+        coverage_cancel_state = get_vocabulary_item('newscoveragestatus', 'ncostat:notint')
         coverage_cancel_state.pop('is_active', None)
 
         self._cancel_plan(updates, original)
@@ -12,7 +12,7 @@ from flask import abort
 from superdesk import get_resource_service
 from superdesk.resource import Resource
 from superdesk.services import BaseService
-from superdesk.notification import push_notification
+from .notifications import push_notification
 
 from eve.utils import config
 from .planning import PlanningResource
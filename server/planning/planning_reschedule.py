@@ -10,7 +10,7 @@
 
 from superdesk import get_resource_service
 from superdesk.services import BaseService
-from superdesk.notification import push_notification
+from .notifications import push_notification
 from apps.archive.common import get_user, get_auth
 from eve.utils import config
 from copy import deepcopy
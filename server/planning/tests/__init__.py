@@ -1,6 +1,8 @@
 
 from superdesk.tests import TestCase as _TestCase, update_config
 from superdesk.factory.app import get_app
+from planning.common import clear_vocabularies_cache
+from planning.locations import clear_locations_index, clear_typeahead_cache
 
 
 class TestCase(_TestCase):
@@ -11,4 +13,7 @@ class TestCase(_TestCase):
         }
         update_config(config)
         self.app = get_app(config)
+        clear_vocabularies_cache()
+        clear_locations_index()
+        clear_typeahead_cache()
         super().setUp()
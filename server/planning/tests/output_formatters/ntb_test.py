@@ -1,8 +1,11 @@
 
+import os
 import lxml
+import time
 import unittest
+from unittest import mock
 
-from planning.output_formatters.ntb_event import NTBEventFormatter
+from planning.output_formatters.ntb_event import NTBEventFormatter, clear_format_cache
 
 
 class NTBEventTestCase(unittest.TestCase):
@@ -28,6 +31,9 @@ class NTBEventTestCase(unittest.TestCase):
         ],
     }
 
+    def setUp(self):
+        clear_format_cache()
+
     def test_formatter(self):
         formatter = NTBEventFormatter()
         output = formatter.format(self.item, {})[0]
@@ -62,3 +68,49 @@ class NTBEventTestCase(unittest.TestCase):
         output = formatter.format(item, {})[0]
         root = lxml.etree.fromstring(output['encoded_item'])
         self.assertEqual('true', root.get('DeleteRequest'))
+
+    def test_pretty_print(self):
+        formatter = NTBEventFormatter()
+        self.assertIn(b'>\n  <', formatter.format(self.item, {})[0]['encoded_item'])
+        with mock.patch('planning.output_formatters.ntb_event.is_ntb_event_pretty_print_enabled',
+                        return_value=False):
+            output = formatter.format(self.item, {})[0]
+        self.assertNotIn(b'>\n  <', output['encoded_item'])
+        self.assertEqual(self.item['name'], lxml.etree.fromstring(output['encoded_item']).find('title').text)
+
+    def test_format_cache(self):
+        formatter = NTBEventFormatter()
+        item = dict(self.item, _id='event1', _etag='etag1')
+        output = formatter.format(item, {'name': 'subscriber 1'})[0]
+
+        # same version of the item for another subscriber
+        item['name'] = 'not formatted again'
+        self.assertEqual(output, formatter.format(item, {'name': 'subscriber 2'})[0])
+
+        item['_etag'] = 'etag2'
+        root = lxml.etree.fromstring(formatter.format(item, {})[0]['encoded_item'])
+        self.assertEqual('not formatted again', root.find('title').text)
+
+        item['pubstatus'] = 'cancelled'
+        root = lxml.etree.fromstring(formatter.format(item, {})[0]['encoded_item'])
+        self.assertEqual('true', root.get('DeleteRequest'))
+
+    @unittest.skipUnless(os.environ.get('PLANNING_BENCHMARKS'), 'set PLANNING_BENCHMARKS to run the benchmarks')
+    def test_format_benchmark(self):
+        """Republish a series of 100 events to 100 subscribers, 10k formats"""
+        formatter = NTBEventFormatter()
+        items = [dict(self.item, _id='event{}'.format(i), _etag='etag{}'.format(i)) for i in range(100)]
+        subscribers = [{'name': 'subscriber {}'.format(i)} for i in range(100)]
+
+        started = time.time()
+        uncached = [formatter.format(dict(item, _etag=None), subscriber)[0]
+                    for subscriber in subscribers for item in items]
+        uncached_time = time.time() - started
+
+        started = time.time()
+        cached = [formatter.format(item, subscriber)[0] for subscriber in subscribers for item in items]
+        cached_time = time.time() - started
+
+        self.assertEqual(uncached, cached)
+        self.assertLess(cached_time, uncached_time,
+                        'formatted 10k items in {:.3f}s, cached {:.3f}s'.format(uncached_time, cached_time))